@@ -31,6 +31,10 @@ ADMINS = MANAGERS = env("ADMINS", default=[("FEINHEIT Developers", "dev@feinheit
 SERVER_EMAIL = DEFAULT_FROM_EMAIL = "no-reply@feinheit.ch"
 
 DATABASES = {"default": django_database_url(env("DATABASE_URL", required=True))}
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # SQLite ignores select_for_update(); transactions which read before
+    # writing have to wait for each other instead of failing
+    DATABASES["default"].setdefault("OPTIONS", {})["transaction_mode"] = "IMMEDIATE"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 SECRET_KEY = env("SECRET_KEY", required=True)
 
@@ -207,4 +211,22 @@ FORM_RENDERER = "form_rendering.FormRendering"
 
 DEEPL_AUTH_KEY = env("DEEPL_AUTH_KEY")
 
-CLI_API = "1"  # Bump this when changing the API in incompatible ways
+# Number of parsed catalogs kept in memory per process
+CATALOG_CACHE_SIZE = env("CATALOG_CACHE_SIZE", default=32)
+
+# Machine translations are reused for this many days; the least recently used
+# ones are removed when the translation memory grows beyond its size
+TRANSLATION_MEMORY_DAYS = env("TRANSLATION_MEMORY_DAYS", default=90)
+TRANSLATION_MEMORY_SIZE = env("TRANSLATION_MEMORY_SIZE", default=100_000)
+
+# Characters which may be sent to DeepL per month, in total and per user;
+# 0 means unlimited
+DEEPL_CHARACTER_BUDGET = env("DEEPL_CHARACTER_BUDGET", default=0)
+DEEPL_USER_CHARACTER_BUDGET = env("DEEPL_USER_CHARACTER_BUDGET", default=0)
+
+# Pre-translating catalogs sends up to this many DeepL requests at the same
+# time, and starts at most this many requests per second
+PRETRANSLATION_CONCURRENCY = env("PRETRANSLATION_CONCURRENCY", default=4)
+PRETRANSLATION_RATE = env("PRETRANSLATION_RATE", default=5)
+
+CLI_API = "2"  # Bump this when changing the API in incompatible ways
@@ -1,24 +1,310 @@
+import fnmatch
+import functools
+import gzip
+import hashlib
+import json
+import re
 import sys
+import time
+from collections import Counter
+from contextlib import contextmanager, redirect_stdout
 from pathlib import Path
-from urllib.parse import urljoin
 
 import click
-import requests
-import tomllib
 
 
-CLI_API = "1"  # Bump this when changing the API in incompatible ways
+# Startup time matters, trd runs in commit hooks and CI loops. Slow imports
+# such as requests happen inside the functions needing them, see
+# scripts/benchmark_cli_startup.py.
 
+CLI_API = "2"  # Bump this when changing the API in incompatible ways
+
+# Pofiles are uploaded gzipped; downloads are decompressed by requests
+UPLOAD_HEADERS = {"content-encoding": "gzip"}
+
+# Content type of entry-level patches, see _diff()
+PATCH_CONTENT_TYPE = "application/json"
+
+# Name of the bulk archive member listing the content hashes of all catalogs
+ARCHIVE_INDEX = "catalogs.json"
+# Name of the bulk archive member listing the revisions of the catalogs, or
+# the revisions of the last transfers when uploading
+ARCHIVE_REVISIONS = "revisions.json"
+
+# (connect, read) timeouts in seconds; the server may take a while to merge
+# large catalogs, and even longer for the whole project when using --bulk
+TIMEOUT = (10, 60)
+BULK_TIMEOUT = (10, 300)
+
+# Transient failures are retried this often with exponential backoff
+RETRIES = 4
+
+
+def _session(project, *, jobs=1, timings=None):
+    import requests
+    from urllib3.util import Retry
 
-def _session(project):
     session = requests.Session()
-    session.headers = {
+    # Keep the default headers, Accept-Encoding enables gzipped downloads
+    session.headers.update({
         "x-token": project["token"],
         "x-cli-api": CLI_API,
-    }
+    })
+    # Failed connections are retried for all requests, timeouts and overload
+    # responses only for idempotent methods; submitting uses POST and isn't
+    # retried once it has been sent. Jitter spreads the retries of parallel
+    # transfers.
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=0.5,
+        backoff_jitter=0.5,
+        status_forcelist={429, 502, 503, 504},
+        raise_on_status=False,
+    )
+    # Keep one connection per worker alive for the duration of the command
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=jobs, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if timings:
+        session.hooks["response"].append(timings.record)
     return session
 
 
+class TransferError(Exception):
+    pass
+
+
+def _check(r):
+    if not r.ok:
+        detail = r.text.strip()
+        raise TransferError(
+            f"{r.status_code} {r.reason}: {detail}"
+            if detail
+            else f"{r.status_code} {r.reason}"
+        )
+
+
+def _api_request(session, method, url, *, error):
+    """
+    Return the JSON response to a request, failures end the command with
+    ``error`` and the reason
+    """
+    import requests
+
+    try:
+        r = session.request(method, url, timeout=TIMEOUT)
+        _check(r)
+        return r.json()
+    except (TransferError, requests.RequestException) as exc:
+        raise click.ClickException(f"{error}: {exc}") from exc
+
+
+def _received(r):
+    """Return the number of bytes received, before decompression"""
+    return int(r.headers.get("content-length", len(r.content)))
+
+
+def _sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def _revision(r):
+    """Return the catalog revision sent by the server or ``None``"""
+    revision = r.headers.get("x-revision")
+    return int(revision) if revision else None
+
+
+def _summary(count, *, failed, sent, received, start):
+    click.echo(
+        f"{count} files, {failed} failed,"
+        f" {sent} bytes sent, {received} bytes received"
+        f" in {time.monotonic() - start:.1f}s"
+    )
+
+
+class Timings:
+    """
+    Collect the duration of a command's phases and of its requests
+
+    Requests are recorded by a response hook of the session. The server's
+    processing time is taken from the ``Server-Timing`` header.
+    """
+
+    def __init__(self, command, *, show=False, json_file=None):
+        self.command = command
+        self.show = show
+        self.json_file = json_file
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.requests = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def record(self, r, *args, **kwargs):
+        from urllib.parse import urlsplit
+
+        body = r.request.body or b""
+        self.requests.append({
+            "method": r.request.method,
+            "path": urlsplit(r.url).path,
+            "status": r.status_code,
+            # Until the response headers have been received
+            "latency": r.elapsed.total_seconds(),
+            "server": _server_timing(r.headers.get("server-timing", "")),
+            "sent": len(body),
+            "received": int(r.headers.get("content-length", 0)),
+        })
+
+    def summary(self):
+        return {
+            "command": self.command,
+            "total": time.perf_counter() - self.start,
+            "phases": self.phases,
+            "requests": self.requests,
+        }
+
+    def report(self):
+        summary = self.summary()
+        if self.json_file:
+            json.dump(summary, self.json_file, indent=2)
+            self.json_file.write("\n")
+        if not self.show:
+            return
+
+        click.echo(f"Timings of {self.command}: {summary['total']:.3f}s total")
+        for name, duration in self.phases.items():
+            click.echo(f"  {name:<12} {duration:8.3f}s")
+        requests = sorted(self.requests, key=lambda r: r["latency"], reverse=True)
+        if requests:
+            click.echo("Requests, slowest first:")
+        for request in requests:
+            server = request["server"]
+            click.echo(
+                f"  {request['latency']:8.3f}s"
+                f" (server {server.get('view', 0):.3f}s,"
+                f" db {server.get('db', 0):.3f}s)"
+                f" {request['sent']:>9} bytes sent {request['received']:>9} received"
+                f"  {request['method']} {request['path']} {request['status']}"
+            )
+
+
+def _server_timing(header):
+    """Return the durations of a ``Server-Timing`` header in seconds"""
+    durations = {}
+    for metric in header.split(","):
+        name, *params = (part.strip() for part in metric.split(";"))
+        for param in params:
+            key, _eq, value = param.partition("=")
+            if key == "dur" and name:
+                durations[name] = float(value) / 1000
+    return durations
+
+
+def _transfer_all(pofiles, transfer, *, jobs, checkpoint=None):
+    """
+    Run ``transfer(pofile)`` for all pofiles using up to ``jobs`` threads
+
+    ``transfer`` returns a message and the number of bytes sent and
+    received. Results are reported in the order of ``pofiles``; failures
+    don't stop the other transfers, including failures to write the pofiles.
+    ``checkpoint()`` is called after each successful transfer. Returns the
+    number of failed transfers.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+
+    start = time.monotonic()
+    sent = received = failed = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(transfer, pofile) for pofile in pofiles]
+        for pofile, future in zip(pofiles, futures):
+            try:
+                message, up, down = future.result()
+            except (OSError, TransferError, requests.RequestException) as exc:
+                failed += 1
+                click.echo(f"Failed {pofile}: {exc}", file=sys.stderr)
+            else:
+                sent += up
+                received += down
+                click.echo(message)
+                if checkpoint:
+                    checkpoint()
+
+    _summary(len(pofiles), failed=failed, sent=sent, received=received, start=start)
+    return failed
+
+
+def _record_download(manifest, pofile, content, revision):
+    # Our copy is the server's copy, there's nothing to upload
+    digest = _sha256(content)
+    manifest[str(pofile)] = {
+        "submitted": digest,
+        "replaced": digest,
+        "revision": revision,
+        "etag": digest,
+        "method": "GET",
+    }
+    _store_base(content)
+
+
+def _record_upload(manifest, pofile, content, method, revision, etag):
+    record = manifest.setdefault(str(pofile), {})
+    record["submitted"] = _sha256(content)
+    if method == "PUT":
+        record["replaced"] = record["submitted"]
+    record["revision"] = revision
+    record["etag"] = etag
+    record["method"] = method
+    _store_base(content)
+
+
+jobs_option = click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of concurrent transfers.",
+)
+bulk_option = click.option(
+    "--bulk",
+    is_flag=True,
+    help="Transfer all pofiles in a single request.",
+)
+
+
+def timings_options(fn):
+    @functools.wraps(fn)
+    def command(*args, timings_json, **kwargs):
+        if getattr(timings_json, "name", None) != "<stdout>":
+            return fn(*args, timings_json=timings_json, **kwargs)
+        # Keep stdout for the JSON so that it can be piped into e.g. jq, the
+        # JSON stream is opened already and isn't redirected
+        with redirect_stdout(sys.stderr):
+            return fn(*args, timings_json=timings_json, **kwargs)
+
+    options = click.option(
+        "--timings-json",
+        type=click.File("w"),
+        help="Write the timings as JSON to a file, use - for stdout.",
+    )(command)
+    return click.option(
+        "--timings",
+        "--profile",
+        "show_timings",
+        is_flag=True,
+        help="Report where the time is spent: discovery, requests, server.",
+    )(options)
+
+
 @click.group()
 @click.version_option(package_name="traduire-cli")
 def cli():
@@ -27,56 +313,622 @@ def cli():
 
 @click.command()
 @click.argument("folder", type=click.Path(exists=True))
-def get(folder):
+@jobs_option
+@bulk_option
+@timings_options
+def get(folder, jobs, bulk, show_timings, timings_json):
     """Fetch all pofiles from the server"""
     project = current_project()
-    session = _session(project)
-    pofiles = find_pofiles(folder)
-    for pofile in pofiles:
-        url = url_from_pofile(project, pofile)
-        r = session.get(url, timeout=10)
-        if r.ok:
-            pofile.write_text(r.content.decode("utf-8"))
+    timings = Timings("get", show=show_timings, json_file=timings_json)
+    session = _session(project, jobs=jobs, timings=timings)
+    manifest = load_manifest(project)
+
+    def transfer(pofile):
+        content = pofile.read_bytes()
+        # The server answers 304 Not Modified if our copy is up to date
+        r = session.get(
+            url_from_pofile(project, pofile),
+            headers={"if-none-match": f'"{_sha256(content)}"'},
+            timeout=TIMEOUT,
+        )
+        if r.status_code == 304:
+            message, received = f"Unchanged {pofile}", 0
+        else:
+            _check(r)
+            pofile.write_bytes(content := r.content)
+            message, received = f"Updated {pofile}", _received(r)
+        _record_download(manifest, pofile, content, _revision(r))
+        return message, 0, received
+
+    with timings.phase("discovery"):
+        pofiles = find_pofiles(project, folder)
+    try:
+        with timings.phase("transfer"):
+            if bulk:
+                failed = _get_bulk(project, session, pofiles, manifest, transfer)
+            else:
+                failed = _transfer_all(
+                    pofiles,
+                    transfer,
+                    jobs=jobs,
+                    checkpoint=lambda: _checkpoint(project, manifest),
+                )
+    finally:
+        with timings.phase("manifest"):
+            save_manifest(project, manifest)
+    timings.report()
+    if failed:
+        sys.exit(1)
+
+
+def _get_bulk(project, session, pofiles, manifest, transfer):
+    """
+    Fetch all pofiles using one request to the project's bulk endpoint
+
+    The server only sends catalogs whose hash differs from all local pofiles.
+    Pofiles which happen to have the hash of a different catalog are fetched
+    using ``transfer`` afterwards. The archive is read completely before any
+    pofile is written.
+    """
+    import zipfile
+
+    import requests
+
+    start = time.monotonic()
+    local = {pofile: pofile.read_bytes() for pofile in pofiles}
+    try:
+        r = session.get(
+            project["url"],
+            headers={
+                "if-none-match": ", ".join(
+                    f'"{digest}"' for digest in {_sha256(c) for c in local.values()}
+                )
+            },
+            timeout=BULK_TIMEOUT,
+        )
+        _check(r)
+    except (TransferError, requests.RequestException) as exc:
+        raise click.ClickException(f"Failed: {exc}") from exc
+
+    try:
+        index, revisions, members = _read_archive(r.content)
+    except (KeyError, ValueError, zipfile.BadZipFile) as exc:
+        raise click.ClickException(f"Invalid archive from the server: {exc}") from exc
+
+    failed = 0
+    received = _received(r)
+    for pofile, content in local.items():
+        name = archive_name(pofile)
+        if name in members:
+            pofile.write_bytes(content := members[name])
+            _record_download(manifest, pofile, content, revisions.get(name))
             click.echo(f"Updated {pofile}")
+        elif index.get(name) == _sha256(content):
+            _record_download(manifest, pofile, content, revisions.get(name))
+            click.echo(f"Unchanged {pofile}")
+        elif name in index:
+            try:
+                message, _up, down = transfer(pofile)
+            except (TransferError, requests.RequestException) as exc:
+                failed += 1
+                click.echo(f"Failed {pofile}: {exc}", file=sys.stderr)
+            else:
+                received += down
+                click.echo(message)
         else:
-            _terminate(r.text)
+            failed += 1
+            click.echo(f"Failed {pofile}: Not on the server", file=sys.stderr)
+
+    _summary(len(local), failed=failed, sent=0, received=received, start=start)
+    return failed
+
+
+def _read_archive(data):
+    """
+    Return the hash index, the revisions and the pofiles of a bulk archive
+    """
+    import io
+    import zipfile
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        members = {name: archive.read(name) for name in archive.namelist()}
+    index = json.loads(members.pop(ARCHIVE_INDEX))
+    revisions = json.loads(members.pop(ARCHIVE_REVISIONS, "{}"))
+    return index, revisions, members
+
+
+def _upload(folder, *, method, message, jobs, bulk, force, dry_run, timings):
+    """
+    Upload the pofiles which changed since their last upload using ``method``
+    or their last download
+    """
+    project = current_project()
+    manifest = load_manifest(project)
+
+    with timings.phase("discovery"):
+        candidates = find_pofiles(project, folder)
+    with timings.phase("compare"):
+        pofiles = _pending(manifest, candidates, method=method, force=force)
+    if skipped := len(candidates) - len(pofiles):
+        click.echo(f"Skipping {skipped} unchanged pofiles, use --force to upload them")
+    if dry_run:
+        for pofile in pofiles:
+            click.echo(f"Would upload {pofile}")
+        return
+
+    session = _session(project, jobs=jobs, timings=timings)
+    try:
+        with timings.phase("transfer"):
+            if bulk and pofiles:
+                failed = _upload_bulk(
+                    project, session, pofiles, manifest, method, message, force=force
+                )
+            else:
+                failed = _upload_each(
+                    project,
+                    session,
+                    pofiles,
+                    manifest,
+                    method=method,
+                    message=message,
+                    jobs=jobs,
+                    force=force,
+                )
+    finally:
+        with timings.phase("manifest"):
+            save_manifest(project, manifest)
+    timings.report()
+    if failed:
+        sys.exit(1)
+
+
+def _pending(manifest, pofiles, *, method, force):
+    """
+    Return the pofiles which changed since their last upload using ``method``
+    """
+    synced = "replaced" if method == "PUT" else "submitted"
+    return [
+        pofile
+        for pofile in pofiles
+        if force
+        or manifest.get(str(pofile), {}).get(synced) != _sha256(pofile.read_bytes())
+    ]
+
+
+def _upload_each(project, session, pofiles, manifest, *, method, message, jobs, force):
+    """
+    Upload pofiles one by one, as patches where possible
+    """
+
+    def transfer(pofile):
+        content = pofile.read_bytes()
+        url = url_from_pofile(project, pofile)
+        record = manifest.get(str(pofile), {})
+        headers = dict(UPLOAD_HEADERS)
+        # Older manifests contain Last-Modified values instead of revisions
+        if not force and isinstance(revision := record.get("revision"), int):
+            headers["x-base-revision"] = str(revision)
+
+        r = None
+        if not force and (patch := _patch(content, record, method=method)):
+            data = gzip.compress(patch)
+            r = session.request(
+                method,
+                url,
+                data=data,
+                headers={**headers, "content-type": PATCH_CONTENT_TYPE},
+                timeout=TIMEOUT,
+            )
+            # The catalog doesn't exist (anymore)
+            if r.status_code == 412:
+                r = None
+        if r is None:
+            data = gzip.compress(content)
+            r = session.request(
+                method, url, data=data, headers=headers, timeout=TIMEOUT
+            )
+        if r.status_code == 409:
+            raise TransferError(_conflict_message(r))
+        _check(r)
+        _record_upload(
+            manifest,
+            pofile,
+            content,
+            method,
+            _revision(r),
+            r.headers.get("etag", "").strip('"') or None,
+        )
+        return message.format(pofile=pofile), len(data), 0
+
+    return _transfer_all(
+        pofiles,
+        transfer,
+        jobs=jobs,
+        checkpoint=lambda: _checkpoint(project, manifest),
+    )
+
+
+def _conflict_message(r):
+    conflicts = r.json().get("conflicts")
+    entries = (
+        ", ".join(
+            f"{msgid!r} ({msgctxt})" if msgctxt else repr(msgid)
+            for msgctxt, msgid in conflicts
+        )
+        if conflicts
+        else "the catalog"
+    )
+    return (
+        f"Changed on the server since the last transfer: {entries}."
+        " Run trd get to merge the changes or use --force to overwrite them"
+    )
+
+
+def _upload_bulk(project, session, pofiles, manifest, method, message, *, force):
+    """
+    Upload all pofiles in one zip archive to the project's bulk endpoint
+
+    The server processes the archive in a single transaction; either all
+    pofiles are uploaded or none. The revisions of the last transfers are
+    sent along in an index like with single uploads.
+    """
+    import io
+    import zipfile
+
+    import requests
+
+    start = time.monotonic()
+    local = {pofile: pofile.read_bytes() for pofile in pofiles}
+    revisions = {
+        archive_name(pofile): revision
+        for pofile in local
+        # Older manifests contain Last-Modified values instead of revisions
+        if isinstance(revision := manifest.get(str(pofile), {}).get("revision"), int)
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for pofile, content in local.items():
+            archive.writestr(archive_name(pofile), content)
+        if not force:
+            archive.writestr(ARCHIVE_REVISIONS, json.dumps(revisions))
+    data = buffer.getvalue()
+
+    try:
+        r = session.request(
+            method,
+            project["url"],
+            data=data,
+            headers={"content-type": "application/zip"},
+            timeout=BULK_TIMEOUT,
+        )
+        if r.status_code == 409:
+            raise click.ClickException(
+                "Changed on the server since the last transfer: "
+                + ", ".join(r.json()["conflicts"])
+                + ". Run trd get to merge the changes or use --force to overwrite them"
+            )
+        _check(r)
+        results = r.json()
+    except (TransferError, requests.RequestException) as exc:
+        raise click.ClickException(f"Failed: {exc}") from exc
+
+    for pofile, content in local.items():
+        revision = results[archive_name(pofile)]["revision"]
+        _record_upload(manifest, pofile, content, method, revision, None)
+        click.echo(message.format(pofile=pofile))
+
+    _summary(len(local), failed=0, sent=len(data), received=_received(r), start=start)
+    return 0
+
+
+force_option = click.option(
+    "--force",
+    is_flag=True,
+    help="Upload pofiles even if they haven't changed since the last transfer.",
+)
+dry_run_option = click.option(
+    "--dry-run",
+    "-n",
+    is_flag=True,
+    help="Only list the pofiles which would be uploaded.",
+)
 
 
 @click.command()
 @click.argument("folder", type=click.Path(exists=True))
-def submit(folder):
+@jobs_option
+@bulk_option
+@force_option
+@dry_run_option
+@timings_options
+def submit(folder, jobs, bulk, force, dry_run, show_timings, timings_json):
     """Submit updated pofiles to the server for translation"""
-    project = current_project()
-    session = _session(project)
-    pofiles = find_pofiles(sys.argv[2])
-    for pofile in pofiles:
-        url = url_from_pofile(project, pofile)
-        r = session.post(url, data=pofile.read_bytes())
-        if r.ok:
-            click.echo(f"Submitted {pofile} to the server for translation")
-        else:
-            _terminate(r.text)
+    _upload(
+        folder,
+        method="POST",
+        timings=Timings("submit", show=show_timings, json_file=timings_json),
+        message="Submitted {pofile} to the server for translation",
+        jobs=jobs,
+        bulk=bulk,
+        force=force,
+        dry_run=dry_run,
+    )
 
 
 @click.command()
 @click.argument("folder", type=click.Path(exists=True))
-def replace(folder):
+@jobs_option
+@bulk_option
+@force_option
+@dry_run_option
+@timings_options
+def replace(folder, jobs, bulk, force, dry_run, show_timings, timings_json):
     """Replace pofiles on the server"""
+    _upload(
+        folder,
+        method="PUT",
+        timings=Timings("replace", show=show_timings, json_file=timings_json),
+        message="Replaced {pofile} on the server",
+        jobs=jobs,
+        bulk=bulk,
+        force=force,
+        dry_run=dry_run,
+    )
+
+
+@click.command()
+@click.argument("folder", type=click.Path(exists=True))
+def status(folder):
+    """Compare the local pofiles with the catalogs on the server"""
+    from urllib.parse import urljoin
+
+    project = current_project()
+    manifest = load_manifest(project)
+    catalogs = _api_request(
+        _session(project), "GET", urljoin(project["url"], "status/"), error="Failed"
+    )["catalogs"]
+    local = {archive_name(pofile): pofile for pofile in find_pofiles(project, folder)}
+    states = Counter()
+    for name in sorted(local.keys() | catalogs.keys()):
+        pofile, catalog = local.get(name), catalogs.get(name)
+        state = _sync_state(
+            pofile and pofile.read_bytes(),
+            catalog,
+            pofile and manifest.get(str(pofile)),
+        )
+        states[state] += 1
+        stats = (
+            f" ({catalog['translated']}/{catalog['total']} translated,"
+            f" {catalog['fuzzy']} fuzzy)"
+            if catalog
+            else ""
+        )
+        click.echo(f"{state:<12} {pofile or name}{stats}")
+    click.echo(", ".join(f"{count} {state}" for state, count in states.items()))
+
+
+@click.command()
+@click.argument("folder", type=click.Path(exists=True))
+@click.option(
+    "--wait/--no-wait",
+    default=True,
+    show_default=True,
+    help="Wait for the machine translations to finish.",
+)
+def pretranslate(folder, wait):
+    """Machine translate the pending entries of all catalogs on the server"""
     project = current_project()
     session = _session(project)
-    pofiles = find_pofiles(sys.argv[2])
-    for pofile in pofiles:
-        url = url_from_pofile(project, pofile)
-        r = session.put(url, data=pofile.read_bytes())
-        if r.ok:
-            click.echo(f"Replaced {pofile} on the server")
-        else:
-            _terminate(r.text)
+    urls = {
+        pofile: url_from_pofile(project, pofile) + "pretranslate/"
+        for pofile in find_pofiles(project, folder)
+    }
+    jobs = {}
+    for pofile, url in urls.items():
+        jobs[pofile] = _api_request(
+            session, "POST", url, error=f"Failed to pre-translate {pofile}"
+        )
+        click.echo(f"Pre-translating {pofile}")
+
+    polled = False
+    while wait and not all(job["finished"] for job in jobs.values()):
+        polled = True
+        time.sleep(2)
+        for pofile, job in jobs.items():
+            if not job["finished"]:
+                jobs[pofile] = _api_request(
+                    session, "GET", urls[pofile], error=f"Failed to check {pofile}"
+                )
+        done = sum(job["done"] for job in jobs.values())
+        total = sum(job["total"] for job in jobs.values())
+        click.echo(f"\rTranslated {done}/{total} messages", nl=False)
+    if polled:
+        click.echo()
+
+    failed = 0
+    for pofile, job in jobs.items():
+        if job["error"]:
+            failed += 1
+            click.echo(f"Failed {pofile}: {job['error']}", file=sys.stderr)
+        elif job["finished"]:
+            click.echo(f"{pofile}: {job['translated']} entries translated")
+    if wait and not failed:
+        click.echo("Run trd get to fetch the translations, marked as fuzzy")
+    if failed:
+        sys.exit(1)
+
+
+def _sync_state(content, catalog, record):
+    """
+    Compare a local pofile and a catalog with their state at the last transfer
+
+    Local pofiles are ahead if they changed since, behind if the catalog
+    changed and diverged if both changed.
+    """
+    if catalog is None:
+        return "local only"
+    if content is None:
+        return "server only"
+    digest = _sha256(content)
+    if digest == catalog["hash"]:
+        return "up to date"
+    if not record:
+        return "diverged"
+
+    local_changed = digest != record.get("submitted")
+    # Bulk uploads only record the revision
+    server_changed = (
+        catalog["hash"] != record["etag"]
+        if record.get("etag")
+        else catalog["revision"] != record.get("revision")
+    )
+    return {
+        (False, False): "up to date",
+        (True, False): "ahead",
+        (False, True): "behind",
+        (True, True): "diverged",
+    }[local_changed, server_changed]
+
+
+@click.command()
+@click.argument("folder", type=click.Path(exists=True))
+@jobs_option
+@click.option(
+    "--delay",
+    type=click.FloatRange(min=0.1),
+    default=2.0,
+    show_default=True,
+    help="Seconds without writes to wait for before submitting.",
+)
+@click.option("--poll", is_flag=True, help="Poll for changes instead of using inotify.")
+def watch(folder, jobs, delay, poll):
+    """Submit pofiles to the server whenever they change"""
+    project = current_project()
+    # One session for everything keeps the connections alive between submits
+    session = _session(project, jobs=jobs)
+    manifest = load_manifest(project)
+
+    click.echo(f"Watching {folder} for changes, press Ctrl-C to stop")
+    try:
+        while True:
+            _submit_and_wait(
+                project, session, manifest, folder, jobs=jobs, delay=delay, poll=poll
+            )
+    except KeyboardInterrupt:
+        click.echo("Stopped watching")
+
+
+def _submit_and_wait(project, session, manifest, folder, *, jobs, delay, poll):
+    """
+    Submit the changed pofiles, then wait until writes stop for ``delay``
+    seconds
+    """
+    pofiles = find_pofiles(project, folder)
+    directories = {Path(folder).resolve(), *(pofile.parent for pofile in pofiles)}
+    watcher = (
+        _PollWatcher({*directories, *pofiles})
+        if poll
+        else _watcher(directories, pofiles)
+    )
+    try:
+        # Check after starting to watch to not miss any writes
+        if pending := _pending(manifest, pofiles, method="POST", force=False):
+            _upload_each(
+                project,
+                session,
+                pending,
+                manifest,
+                method="POST",
+                message="Submitted {pofile} to the server for translation",
+                jobs=jobs,
+                force=False,
+            )
+            save_manifest(project, manifest)
+
+        while not watcher.wait(delay):
+            pass
+        # Debounce bursts of writes, e.g. by makemessages
+        while watcher.wait(delay):
+            pass
+    finally:
+        watcher.close()
+
+
+def _watcher(directories, pofiles):
+    """Return an inotify watcher if possible, a polling watcher otherwise"""
+    try:
+        return _InotifyWatcher(directories)
+    # E.g. os.O_CLOEXEC and libc functions are missing on some platforms
+    except (AttributeError, OSError):
+        return _PollWatcher({*directories, *pofiles})
+
+
+class _InotifyWatcher:
+    """
+    Watch directories for added, removed and written files using inotify
+    """
+
+    # From <sys/inotify.h>
+    EVENTS = 0x8 | 0x40 | 0x80 | 0x100 | 0x200  # CLOSE_WRITE, MOVED_*, CREATE, DELETE
+
+    def __init__(self, directories):
+        import ctypes
+        import ctypes.util
+        import os
+
+        self._os = os
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify isn't available")
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for directory in directories:
+            if libc.inotify_add_watch(self.fd, bytes(directory), self.EVENTS) < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), f"Can't watch {directory}")
+
+    def wait(self, timeout):
+        """Wait up to ``timeout`` seconds, return whether anything changed"""
+        import select
+
+        if select.select([self.fd], [], [], timeout)[0]:
+            self._os.read(self.fd, 65536)
+            return True
+        return False
+
+    def close(self):
+        self._os.close(self.fd)
+
+
+class _PollWatcher:
+    """
+    Watch files and directories by comparing modification times
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.state = self._stat()
+
+    def _stat(self):
+        return {path: _mtime(path) for path in self.paths}
+
+    def wait(self, timeout):
+        """Wait ``timeout`` seconds, return whether anything changed"""
+        time.sleep(timeout)
+        state, self.state = self.state, self._stat()
+        return state != self.state
+
+    def close(self):
+        pass
 
 
 cli.add_command(get)
 cli.add_command(submit)
 cli.add_command(replace)
+cli.add_command(status)
+cli.add_command(pretranslate)
+cli.add_command(watch)
 
 
 def _terminate(msg):
@@ -85,6 +937,8 @@ def _terminate(msg):
 
 
 def current_project():
+    import tomllib
+
     config = Path.home() / ".config" / "traduire.toml"
     if not config.exists():
         _terminate(f"Config file {config} doesn't exist.")
@@ -101,18 +955,308 @@ def current_project():
     return None
 
 
-def find_pofiles(root):
-    def _generate():
-        path = Path(root).resolve()
-        for dirpath, _dirnames, filenames in path.walk():
-            for filename in filenames:
-                if filename.endswith(".po"):
-                    yield dirpath / filename
+def _manifest_path():
+    return Path.home() / ".config" / "traduire-manifest.json"
 
-    return list(_generate())
+
+def load_manifest(project):
+    """
+    Return the hashes of the pofiles as they have last been transferred
+
+    The manifest maps pofile paths to the SHA-256 of the content which has
+    last been submitted or replaced (downloading counts as both), the
+    catalog's revision and ETag at that time and the method of the last
+    transfer.
+    """
+    path = _manifest_path()
+    data = json.loads(path.read_text()) if path.exists() else {}
+    return data.get(project["url"], {})
+
+
+def save_manifest(project, manifest, *, prune=True):
+    path = _manifest_path()
+    data = json.loads(path.read_text()) if path.exists() else {}
+    data[project["url"]] = manifest
+    # Replace the manifest atomically, runs may be killed at any time
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True))
+    tmp.replace(path)
+    if not prune:
+        return
+
+    # Only keep the bases which are still referenced by any project
+    referenced = {
+        f"{record.get('submitted')}.po"
+        for records in data.values()
+        for record in records.values()
+    }
+    if _cache_dir().exists():
+        for base in _cache_dir().glob("*.po"):
+            if base.name not in referenced:
+                base.unlink(missing_ok=True)
+
+
+def _checkpoint(project, manifest):
+    """
+    Save the manifest while transfers are running
+
+    Interrupted runs therefore only repeat the transfers which haven't
+    finished. Other transfers may update the manifest in the meantime, a
+    copy is saved.
+    """
+    records = list(manifest.items())
+    save_manifest(project, {key: dict(record) for key, record in records}, prune=False)
+
+
+def _cache_dir():
+    return Path.home() / ".cache" / "traduire"
+
+
+def _store_base(content):
+    """
+    Keep a copy of a transferred pofile to compute the next upload's patch
+    """
+    path = _cache_dir() / f"{_sha256(content)}.po"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+
+def _patch(content, record, *, method):
+    """
+    Return a patch against the last transferred pofile or ``None``
+
+    ``None`` is returned if the base is unknown. Submitted patches are only
+    returned if they are smaller than the pofile itself; replacing always uses
+    patches since the server merges them with concurrent changes. Replacing
+    needs the server's copy as the base though, which is only known after
+    getting or replacing; submitting keeps the server's translations.
+    """
+    if method == "PUT" and record.get("method") not in {"GET", "PUT"}:
+        return None
+    base = _cache_dir() / f"{record.get('submitted')}.po"
+    if not record.get("submitted") or not base.exists():
+        return None
+    patch = json.dumps(
+        _diff(base.read_text(encoding="utf-8"), content.decode("utf-8"))
+    ).encode("utf-8")
+    return patch if method == "PUT" or len(patch) < len(content) else None
+
+
+def _diff(base, content):
+    """
+    Return the entry-level patch turning pofile ``base`` into ``content``
+
+    Added and changed entries are sent as they are, removed entries only by
+    their msgctxt and msgid. The header is only included if it changed. The
+    base versions of changed and removed entries allow the server to merge
+    the patch with changes made by others since.
+    """
+    base_header, base_entries = _po_entries(base)
+    header, entries = _po_entries(content)
+    changed = [
+        key
+        for key, (_text, normalized) in entries.items()
+        if key in base_entries and base_entries[key][1] != normalized
+    ]
+    removed = [key for key in base_entries if key not in entries]
+    patch = {
+        "added": "\n\n".join(
+            text for key, (text, _) in entries.items() if key not in base_entries
+        ),
+        "changed": "\n\n".join(entries[key][0] for key in changed),
+        "removed": [list(key) for key in removed],
+        "base": "\n\n".join(base_entries[key][0] for key in changed + removed),
+    }
+    if header and header[1] != (base_header and base_header[1]):
+        patch["header"] = header[0]
+    return patch
+
+
+_PO_ESCAPES = {"\\": "\\", '"': '"', "n": "\n", "t": "\t", "r": "\r"}
+
+
+def _po_string(line):
+    value = line[line.index('"') + 1 : line.rindex('"')]
+    return re.sub(r"\\(.)", lambda m: _PO_ESCAPES.get(m[1], m[0]), value)
+
+
+def _po_entries(content):
+    """
+    Split a pofile into its header and entries keyed by msgctxt and msgid
+
+    Entries are ``(text, normalized)`` tuples. The normalized form joins
+    wrapped strings and occurrences so that the wrapping doesn't matter when
+    comparing entries. Obsolete entries are keyed like all others but
+    normalized with a marker, so that obsoleting an entry changes it.
+    """
+    header, entries = None, {}
+    content = content.replace("\r\n", "\n")
+    for text in re.split(r"\n[ \t]*\n", content.strip()):
+        normalized = []
+        if any(raw.startswith("#~ ") for raw in text.splitlines()):
+            normalized.append(["#~", ""])
+        for raw in text.splitlines():
+            line = raw.removeprefix("#~ ").strip()
+            if line.startswith('"') and normalized:
+                normalized[-1][1] += _po_string(line)
+            elif line.startswith("#:") and normalized and normalized[-1][0] == "#:":
+                normalized[-1][1] += f" {line[2:].strip()}"
+            elif line.startswith("#"):
+                normalized.append([line[:2], line[2:].strip()])
+            elif line:
+                keyword, _space, value = line.partition(" ")
+                normalized.append([keyword, _po_string(value)])
+
+        strings = dict(normalized)
+        key = (strings.get("msgctxt"), strings.get("msgid"))
+        if key == (None, ""):
+            header = (text, normalized)
+        elif key[1] is not None:
+            entries[key] = (text, normalized)
+    return header, entries
+
+
+#: Directories which are never searched for pofiles
+SKIP_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".tox",
+    ".nox",
+    ".venv",
+    "venv",
+    "node_modules",
+    "__pycache__",
+}
+
+
+def find_pofiles(project, root):
+    """
+    Return the pofiles inside ``root`` matching the project's ``locale`` glob
+
+    Directories in ``SKIP_DIRS``, virtualenvs and everything ignored by
+    ``.gitignore`` files are skipped. The result is cached until any of the
+    searched directories or ``.gitignore`` files is modified.
+    """
+    start = time.monotonic()
+    root = Path(root).resolve()
+    pattern = project.get("locale", "*.po")
+    key = f"{root}:{pattern}"
+
+    path = _cache_dir() / "discovery.json"
+    cache = json.loads(path.read_text()) if path.exists() else {}
+    if (entry := cache.get(key)) and all(
+        _mtime(Path(stamped)) == mtime for stamped, mtime in entry["stamps"].items()
+    ):
+        pofiles = [Path(pofile) for pofile in entry["pofiles"]]
+        how = "cached"
+    else:
+        pofiles, stamps = _discover(root, pattern)
+        cache[key] = {"pofiles": [str(pofile) for pofile in pofiles], "stamps": stamps}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(cache))
+        how = f"searched {len(stamps)} paths"
+
+    # Diagnostics go to stderr, the output of e.g. trd status is parsed by scripts
+    click.echo(
+        f"Found {len(pofiles)} pofiles in {time.monotonic() - start:.2f}s ({how})",
+        file=sys.stderr,
+    )
+    return pofiles
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _discover(root, pattern):
+    """
+    Walk ``root`` and return the matching pofiles and the modification times
+    of the directories and ``.gitignore`` files which have been read
+    """
+    ignore = _Ignore()
+    stamps = {}
+    # Rules of the enclosing repository apply too
+    in_repository = False
+    for parent in reversed(root.parents):
+        in_repository = in_repository or (parent / ".git").exists()
+        if in_repository:
+            stamps[str(parent)] = _mtime(parent)
+            stamps.update(ignore.load(parent))
+
+    pofiles = []
+    for dirpath, dirnames, filenames in root.walk():
+        stamps[str(dirpath)] = _mtime(dirpath)
+        stamps.update(ignore.load(dirpath))
+        dirnames[:] = sorted(
+            dirname
+            for dirname in dirnames
+            if dirname not in SKIP_DIRS
+            and not (dirpath / dirname / "pyvenv.cfg").exists()
+            and not ignore.ignored(dirpath / dirname, is_dir=True)
+        )
+        pofiles.extend(
+            dirpath / filename
+            for filename in sorted(filenames)
+            if filename.endswith(".po")
+            and fnmatch.fnmatch(
+                (dirpath / filename).relative_to(root).as_posix(), pattern
+            )
+            and not ignore.ignored(dirpath / filename, is_dir=False)
+        )
+    return pofiles, stamps
+
+
+class _Ignore:
+    """
+    The subset of ``.gitignore`` rules needed for pruning the search
+
+    Supports comments, negation, directory-only and anchored patterns.
+    """
+
+    def __init__(self):
+        self.rules = []
+
+    def load(self, directory):
+        """Add the rules of the directory's ``.gitignore``, return its mtime"""
+        path = directory / ".gitignore"
+        if not path.is_file():
+            return {}
+        for raw in path.read_text(errors="replace").splitlines():
+            line = raw.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line.removeprefix("!")
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line.removeprefix("**/")
+            self.rules.append((directory, line.lstrip("/"), negate, dir_only, anchored))
+        return {str(path): _mtime(path)}
+
+    def ignored(self, path, *, is_dir):
+        ignored = False
+        for base, pattern, negate, dir_only, anchored in self.rules:
+            if (dir_only and not is_dir) or not path.is_relative_to(base):
+                continue
+            name = path.relative_to(base).as_posix() if anchored else path.name
+            if fnmatch.fnmatch(name, pattern.removeprefix("**/")):
+                ignored = not negate
+        return ignored
+
+
+def archive_name(pofile):
+    """Return the name of ``pofile`` in bulk archives"""
+    return f"{pofile.parts[-3]}/{pofile.name}"
 
 
 def url_from_pofile(project, pofile):
+    from urllib.parse import urljoin
+
     return urljoin(
         project["url"],
         f"{pofile.parts[-3]}/{pofile.parts[-1].removesuffix('.po')}/",
@@ -55,6 +55,61 @@ onReady(() => {
   })
 })
 
+onReady(() => {
+  document.body.addEventListener("click", (e) => {
+    const t = e.target.closest("[data-match]")
+    if (t) {
+      e.preventDefault()
+      const textarea = qs(".entry__msgstr textarea", t.closest(".entry"))
+      textarea.value = t.dataset.match
+      textarea.dispatchEvent(new Event("change", { bubbles: true }))
+    }
+  })
+})
+
+onReady(() => {
+  document.body.addEventListener("click", async (e) => {
+    const t = e.target.closest("[data-suggest-all]")
+    if (t) {
+      e.preventDefault()
+      // Only fill the fields which haven't been translated yet
+      const pending = Array.from(qsa("[data-suggest]"))
+        .map((link) => [link, qs("textarea", link.closest(".field"))])
+        .filter(([, textarea]) => !textarea.value)
+      if (!pending.length) return
+
+      const body = new FormData()
+      body.append("language_code", t.dataset.languageCode)
+      for (const [link] of pending) {
+        body.append("msgid", link.dataset.suggest)
+      }
+      t.disabled = true
+      try {
+        const r = await fetch("/api/suggest/all/", {
+          method: "POST",
+          credentials: "same-origin",
+          headers: {
+            "x-csrftoken": qs("input[name=csrfmiddlewaretoken]").value,
+          },
+          body,
+        })
+        if (r.ok) {
+          const data = await r.json()
+          if (data.msgstrs) {
+            pending.forEach(([, textarea], index) => {
+              textarea.value = data.msgstrs[index]
+            })
+          } else if (data.error) {
+            alert(data.error)
+          }
+        }
+      } finally {
+        t.disabled = false
+      }
+    }
+  })
+})
+
 onReady(() => {
   setTimeout(() => {
     for (const el of qsa(".messages")) {
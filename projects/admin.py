@@ -27,12 +27,84 @@ class ProjectAdmin(admin.ModelAdmin):
 
 @admin.register(models.Catalog)
 class CatalogAdmin(admin.ModelAdmin):
-    list_display = ["project", "language_code", "domain", "created_at", "updated_at"]
+    list_display = [
+        "project",
+        "language_code",
+        "domain",
+        "total_count",
+        "translated_count",
+        "fuzzy_count",
+        "untranslated_count",
+        "obsolete_count",
+        "created_at",
+        "updated_at",
+    ]
     list_filter = ["project"]
-    readonly_fields = ["pofile"]
+    readonly_fields = [
+        "total_count",
+        "translated_count",
+        "fuzzy_count",
+        "untranslated_count",
+        "obsolete_count",
+        "pofile",
+    ]
     ordering = ["project", *models.Catalog._meta.ordering]
 
 
+@admin.register(models.TranslationMemory)
+class TranslationMemoryAdmin(admin.ModelAdmin):
+    list_display = [
+        "source",
+        "target_language",
+        "translation",
+        "hits",
+        "used_at",
+        "created_at",
+    ]
+    list_filter = ["target_language"]
+    search_fields = ["source", "translation"]
+    readonly_fields = [
+        "key",
+        "source_language",
+        "target_language",
+        "source",
+        "hits",
+        "used_at",
+        "created_at",
+    ]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        stats = models.TranslationMemory.objects.stats()
+        subtitle = _("{entries} entries, {hits} hits, hit rate {hit_rate:.0%}").format(
+            **stats
+        )
+        return super().changelist_view(
+            request, extra_context={"subtitle": subtitle, **(extra_context or {})}
+        )
+
+
+@admin.register(models.TranslationUsage)
+class TranslationUsageAdmin(admin.ModelAdmin):
+    list_display = ["month", "user", "characters"]
+    list_filter = ["month"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    has_change_permission = has_add_permission
+
+    def changelist_view(self, request, extra_context=None):
+        subtitle = _("{characters} characters this month").format(
+            characters=models.TranslationUsage.objects.current().characters()
+        )
+        return super().changelist_view(
+            request, extra_context={"subtitle": subtitle, **(extra_context or {})}
+        )
+
+
 @admin.register(models.Event)
 class EventAdmin(admin.ModelAdmin):
     list_display = ["created_at", "user", "action", "project_string", "catalog_string"]
@@ -1,5 +1,7 @@
-from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.apps import AppConfig, apps
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete
 from django.utils.text import capfirst
 from django.utils.translation import gettext_lazy as _
 
@@ -13,6 +15,18 @@ def _on_project_post_save(sender, instance, created, **kwargs):
         )
 
 
+def _on_user_pre_delete(sender, instance, **kwargs):
+    # The monthly totals still count the characters of deleted users
+    TranslationUsage = apps.get_model("projects", "TranslationUsage")
+    for usage in TranslationUsage.objects.filter(user=instance):
+        total, _created = TranslationUsage.objects.get_or_create(
+            user=None, month=usage.month
+        )
+        TranslationUsage.objects.filter(pk=total.pk).update(
+            characters=F("characters") + usage.characters
+        )
+
+
 class ProjectsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "projects"
@@ -20,3 +34,4 @@ class ProjectsConfig(AppConfig):
 
     def ready(self):
         post_save.connect(_on_project_post_save, sender=self.get_model("project"))
+        pre_delete.connect(_on_user_pre_delete, sender=settings.AUTH_USER_MODEL)
@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with hit and miss counters
+
+    Keys are tuples whose first item is the primary key of the object the
+    value belongs to; ``invalidate(pk)`` drops all values for an object
+    regardless of the rest of the key.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        # Build the value outside the lock; parsing may take a while and
+        # concurrent requests for other keys shouldn't have to wait.
+        value = factory()
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, pk):
+        with self._lock:
+            for key in [key for key in self._data if key[0] == pk]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
@@ -1,17 +1,26 @@
-import copy
-
 from django import forms
 from django.conf import settings
 from django.contrib import messages
+from django.db import transaction
 from django.utils.html import format_html, format_html_join
 from django.utils.timezone import localtime
 from django.utils.translation import gettext_lazy as _, ngettext
 
-from projects import translators
+from projects import similarity, translators
+from projects.models import Catalog, CatalogEntry
 
 
 ENTRIES_PER_PAGE = 20
 
+#: Searchable parts of entries, see the ``search_*`` fields of ``CatalogEntry``
+SEARCH_FIELDS = [
+    ("msgid", _("Original")),
+    ("msgstr", _("Translation")),
+    ("context", _("Context")),
+    ("comments", _("Comment")),
+    ("occurrences", _("Occurrences")),
+]
+
 
 class FilterForm(forms.Form):
     pending = forms.BooleanField(label=_("Pending"), required=False)
@@ -20,6 +29,13 @@ class FilterForm(forms.Form):
         required=False,
         widget=forms.TextInput(attrs={"placeholder": _("Query")}),
     )
+    search = forms.MultipleChoiceField(
+        label="",
+        choices=SEARCH_FIELDS,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text=_("Searches everywhere if nothing is selected."),
+    )
     start = forms.IntegerField(widget=forms.HiddenInput, required=False)
 
 
@@ -46,7 +62,15 @@ def _help_text(msgid, language_code):
     return format_html(" &middot; ".join(["{}"] * len(parts)), *parts) if parts else ""
 
 
+def _translation_of(entry):
+    """Return the parts of ``entry`` which are edited using ``EntriesForm``"""
+    return entry.msgstr, sorted(entry.msgstr_plural.items()), entry.fuzzy
+
+
 class EntriesForm(forms.Form):
+    #: Revision of the catalog when the form has been rendered
+    revision = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
     def __init__(self, *args, **kwargs):
         self.entries = kwargs.pop("entries")
         self.language_code = kwargs.pop("language_code")
@@ -65,6 +89,7 @@ class EntriesForm(forms.Form):
                 label="Fuzzy",
                 initial=entry.fuzzy,
                 required=False,
+                show_hidden_initial=True,
             )
 
             self.entry_rows.append({
@@ -72,6 +97,7 @@ class EntriesForm(forms.Form):
                 "msgid": self[f"msgid_{index}"],
                 "msgstr": [],
                 "fuzzy": self[f"fuzzy_{index}"],
+                "matches": [],
             })
 
             if entry.msgid_plural:
@@ -83,6 +109,7 @@ class EntriesForm(forms.Form):
                         initial=msgstr,
                         required=False,
                         strip=False,
+                        show_hidden_initial=True,
                         help_text=_help_text(entry.msgid_plural, self.language_code),
                     )
                     self.entry_rows[-1]["msgstr"].append(self[name])
@@ -94,6 +121,7 @@ class EntriesForm(forms.Form):
                     initial=entry.msgstr,
                     required=False,
                     strip=False,
+                    show_hidden_initial=True,
                     help_text=_help_text(entry.msgid, self.language_code),
                 )
                 self.entry_rows[-1]["msgstr"].append(self[name])
@@ -115,6 +143,23 @@ class EntriesForm(forms.Form):
                     self._check_variables(entry.msgid, value, field_name)
         return cleaned
 
+    def add_matches(self, *, projects):
+        """
+        Add similar translations from the catalogs of ``projects`` to the rows
+        of untranslated entries
+        """
+        rows = [
+            row
+            for row in self.entry_rows
+            if not (row["entry"].translated or row["entry"].msgid_plural)
+        ]
+        if not rows:
+            return
+        index = similarity.index_for(self.language_code)
+        projects = set(projects.values_list("pk", flat=True))
+        for row in rows:
+            row["matches"] = index.search(row["entry"].msgid, projects=projects)
+
     def _check_variables(self, source, translation, field_name):
         missing = set(translators.find_variables(source)) - set(
             translators.find_variables(translation)
@@ -125,52 +170,113 @@ class EntriesForm(forms.Form):
                 _("Missing variables: {vars}").format(vars=", ".join(sorted(missing))),
             )
 
+    def _current_entries(self, catalog, msgids_with_context, *, reload=False):
+        """
+        Return a ``msgid_with_context → CatalogEntry`` index of the given entries
+
+        The entries of this page have been loaded during this request and are
+        reused unless ``reload`` is set. Entries which have moved to a different
+        page since the form has been rendered are fetched using one additional
+        query.
+        """
+        index = {} if reload else {e.msgid_with_context: e for e in self.entries}
+        if missing := set(msgids_with_context) - index.keys():
+            for entry in catalog.entries.filter(
+                msgid__in={msgid.rpartition("\x04")[2] for msgid in missing}
+            ):
+                index.setdefault(entry.msgid_with_context, entry)
+        return index
+
+    def _rendered(self, name):
+        """
+        Return the value of the field ``name`` when the form has been rendered
+
+        Raises ``KeyError`` if the value hasn't been posted.
+        """
+        if (field := self.fields.get(name)) is None:
+            return None
+        if (key := self.add_initial_prefix(name)) not in self.data:
+            raise KeyError(key)
+        return field.to_python(
+            field.hidden_widget().value_from_datadict(self.data, self.files, key)
+        )
+
+    def _translation(self, index, row, value):
+        """
+        Return ``row`` as a ``POEntry`` with the translation from the form
+
+        ``value`` returns the value of a field when given its name.
+        """
+        entry = row.as_poentry()
+        entry.msgstr = translators.fix_nls(entry.msgid, value(f"msgstr_{index}") or "")
+        if entry.msgid_plural:
+            for count in entry.msgstr_plural:
+                entry.msgstr_plural[count] = translators.fix_nls(
+                    entry.msgid_plural, value(f"msgstr_{index}:{count}") or ""
+                )
+        entry.fuzzy = bool(value(f"fuzzy_{index}"))
+        return entry
+
     def update(self, catalog, *, request):
-        updates = 0
-
-        for index in range(ENTRIES_PER_PAGE):
-            msgid_with_context = self.cleaned_data.get(f"msgid_{index}")
-            msgstr = self.cleaned_data.get(f"msgstr_{index}", "")
-            fuzzy = self.cleaned_data.get(f"fuzzy_{index}")
-
-            if not msgid_with_context:
-                continue
-
-            # Better be safe than sorry -- do not modify the entries in
-            # self.entries, find the entry in the current version of the pofile
-            # instead.
-            for entry in catalog.po:
-                if entry.msgid_with_context == msgid_with_context:
-                    old = copy.deepcopy(entry)
-                    entry.msgstr = translators.fix_nls(entry.msgid, msgstr)
-                    if entry.msgid_plural:
-                        for count in entry.msgstr_plural:
-                            entry.msgstr_plural[count] = translators.fix_nls(
-                                entry.msgid_plural,
-                                self.cleaned_data.get(f"msgstr_{index}:{count}", ""),
-                            )
-                    if fuzzy and not entry.fuzzy:
-                        entry.fuzzy = True
-                        updates += 1
-                    elif not fuzzy and entry.fuzzy:
-                        entry.fuzzy = False
-                        updates += 1
-                    elif old != entry:
-                        entry.fuzzy = fuzzy
-                        updates += 1
-                    break
-
-        if updates:
-            catalog.po.metadata["Last-Translator"] = "{} {} <{}>".format(
-                getattr(request.user, "first_name", "Anonymous"),
-                getattr(request.user, "last_name", "User"),
-                getattr(request.user, "email", "anonymous@user.tld"),
-            )
-            catalog.po.metadata["X-Translated-Using"] = "traduire 0.0.1"
-            catalog.po.metadata["PO-Revision-Date"] = localtime().strftime(
-                "%Y-%m-%d %H:%M%z"
-            )
+        """
+        Save the changed translations
+
+        If the catalog has been saved since the form has been rendered the
+        changes are merged: Translations changed by somebody else in the
+        meantime are kept, and conflicting changes aren't saved. Forms posted
+        without their revision overwrite the catalog entries.
+        """
+        posted = {
+            index: msgid_with_context
+            for index in range(ENTRIES_PER_PAGE)
+            if (msgid_with_context := self.cleaned_data.get(f"msgid_{index}"))
+        }
+        base_revision = self.cleaned_data.get("revision")
+        rows, conflicts = [], []
 
+        with transaction.atomic():
+            catalog.refresh_from_db(from_queryset=Catalog.objects.select_for_update())
+            stale = base_revision not in {None, catalog.revision}
+            current = self._current_entries(catalog, posted.values(), reload=stale)
+
+            for index, msgid_with_context in posted.items():
+                if (row := current.get(msgid_with_context)) is None:
+                    continue
+
+                entry = self._translation(index, row, self.cleaned_data.get)
+                ours = _translation_of(entry)
+                if ours == (theirs := _translation_of(row.as_poentry())):
+                    continue
+                if stale:
+                    try:
+                        base = _translation_of(
+                            self._translation(index, row, self._rendered)
+                        )
+                    except KeyError:
+                        base = None
+                    if base == ours:
+                        continue
+                    if base != theirs:
+                        conflicts.append(row.msgid)
+                        continue
+
+                row.update_from_poentry(entry)
+                rows.append(row)
+
+            if rows:
+                catalog.metadata["Last-Translator"] = "{} {} <{}>".format(
+                    getattr(request.user, "first_name", "Anonymous"),
+                    getattr(request.user, "last_name", "User"),
+                    getattr(request.user, "email", "anonymous@user.tld"),
+                )
+                catalog.metadata["X-Translated-Using"] = "traduire 0.0.1"
+                catalog.metadata["PO-Revision-Date"] = localtime().strftime(
+                    "%Y-%m-%d %H:%M%z"
+                )
+                CatalogEntry.objects.bulk_update(rows, CatalogEntry.POENTRY_FIELDS)
+                catalog.save()
+
+        if updates := len(rows):
             messages.success(
                 request,
                 ngettext(
@@ -179,14 +285,38 @@ class EntriesForm(forms.Form):
                     updates,
                 ).format(count=updates),
             )
-
-            catalog.pofile = str(catalog.po)
-            catalog.save()
-
-        else:
+        if conflicts:
+            messages.warning(
+                request,
+                ngettext(
+                    "{count} message has been changed by somebody else in the"
+                    " meantime, your change hasn't been saved: {msgids}",
+                    "{count} messages have been changed by somebody else in the"
+                    " meantime, your changes haven't been saved: {msgids}",
+                    len(conflicts),
+                ).format(count=len(conflicts), msgids=", ".join(conflicts)),
+            )
+        elif not updates:
             messages.info(request, _("No changes detected."))
 
 
 class SuggestForm(forms.Form):
     language_code = forms.CharField()
     msgid = forms.CharField()
+
+
+class SuggestAllForm(forms.Form):
+    """
+    Validates the ``msgid`` values of all entries on a page to be translated
+    """
+
+    language_code = forms.CharField()
+
+    def clean(self):
+        cleaned = super().clean()
+        msgids = self.data.getlist("msgid")
+        # Plural entries contain two messages
+        if not 0 < len(msgids) <= 2 * ENTRIES_PER_PAGE or not all(msgids):
+            raise forms.ValidationError(_("Invalid messages."))
+        cleaned["msgids"] = msgids
+        return cleaned
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from projects import pretranslation
+from projects.models import Catalog, PretranslationJob
+
+
+class Command(BaseCommand):
+    help = "Machine translate the pending entries of catalogs, marked as fuzzy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("project", help="Slug of the project.")
+        parser.add_argument("--language", help="Only this language code.")
+        parser.add_argument("--domain", help="Only this domain.")
+
+    def handle(self, *, project, language, domain, **options):
+        if not settings.DEEPL_AUTH_KEY:
+            raise CommandError("DEEPL_AUTH_KEY isn't configured.")
+
+        catalogs = Catalog.objects.filter(project__slug=project)
+        if language:
+            catalogs = catalogs.filter(language_code=language)
+        if domain:
+            catalogs = catalogs.filter(domain=domain)
+        if not catalogs:
+            raise CommandError("No matching catalogs.")
+
+        for catalog in catalogs:
+            if pretranslation.running_job(catalog):
+                self.stderr.write(f"{catalog}: Already being pre-translated")
+                continue
+
+            job = PretranslationJob.objects.create(catalog=catalog)
+            job = pretranslation.run(job, progress=self.progress)
+            if job.error:
+                self.stderr.write(f"{catalog}: {job.error}")
+            else:
+                self.stdout.write(f"{catalog}: Saved {job.translated} entries")
+
+    def progress(self, job):
+        self.stdout.write(f"{job.catalog}: {job.done}/{job.total}", ending="\r")
+        self.stdout.flush()
@@ -0,0 +1,106 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0005_alter_event_action_alter_event_created_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalog",
+            name="header",
+            field=models.TextField(blank=True, verbose_name="header"),
+        ),
+        migrations.AddField(
+            model_name="catalog",
+            name="metadata",
+            field=models.JSONField(blank=True, default=dict, verbose_name="metadata"),
+        ),
+        migrations.AddField(
+            model_name="catalog",
+            name="metadata_is_fuzzy",
+            field=models.BooleanField(default=False, verbose_name="metadata is fuzzy"),
+        ),
+        migrations.CreateModel(
+            name="CatalogEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveIntegerField(verbose_name="position")),
+                (
+                    "msgctxt",
+                    models.TextField(blank=True, null=True, verbose_name="msgctxt"),
+                ),
+                ("msgid", models.TextField(verbose_name="msgid")),
+                (
+                    "msgid_plural",
+                    models.TextField(blank=True, verbose_name="msgid_plural"),
+                ),
+                ("msgstr", models.TextField(blank=True, verbose_name="msgstr")),
+                (
+                    "msgstr_plural",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="msgstr_plural"
+                    ),
+                ),
+                ("fuzzy", models.BooleanField(default=False, verbose_name="fuzzy")),
+                (
+                    "flags",
+                    models.JSONField(blank=True, default=list, verbose_name="flags"),
+                ),
+                ("comment", models.TextField(blank=True, verbose_name="comment")),
+                (
+                    "tcomment",
+                    models.TextField(blank=True, verbose_name="translator comment"),
+                ),
+                (
+                    "occurrences",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="occurrences"
+                    ),
+                ),
+                ("previous_msgctxt", models.TextField(blank=True, null=True)),
+                ("previous_msgid", models.TextField(blank=True, null=True)),
+                ("previous_msgid_plural", models.TextField(blank=True, null=True)),
+                (
+                    "obsolete",
+                    models.BooleanField(default=False, verbose_name="obsolete"),
+                ),
+                (
+                    "translated",
+                    models.BooleanField(default=False, verbose_name="translated"),
+                ),
+                (
+                    "catalog",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entries",
+                        to="projects.catalog",
+                        verbose_name="catalog",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "catalog entry",
+                "verbose_name_plural": "catalog entries",
+                "ordering": ["position"],
+                "indexes": [
+                    models.Index(
+                        fields=["catalog", "position"],
+                        name="projects_ca_catalog_fe2ffd_idx",
+                    )
+                ],
+            },
+        ),
+    ]
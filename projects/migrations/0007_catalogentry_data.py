@@ -0,0 +1,90 @@
+import polib
+from django.db import migrations
+
+
+def forwards(apps, schema_editor):
+    Catalog = apps.get_model("projects", "Catalog")
+    CatalogEntry = apps.get_model("projects", "CatalogEntry")
+
+    for catalog in Catalog.objects.select_related("project").iterator():
+        try:
+            po = polib.pofile(catalog.pofile, wrapwidth=0)
+        except OSError as exc:
+            # 0008 drops the pofile column, so the catalog would be lost
+            raise RuntimeError(
+                f"Unable to parse the pofile of the catalog {catalog.project.slug}/"
+                f"{catalog.language_code}/{catalog.domain} (pk={catalog.pk}): {exc}."
+                " Fix or delete the catalog before migrating."
+            ) from exc
+
+        catalog.header = po.header
+        catalog.metadata = dict(po.metadata)
+        catalog.metadata_is_fuzzy = bool(po.metadata_is_fuzzy)
+        catalog.save(update_fields=["header", "metadata", "metadata_is_fuzzy"])
+
+        CatalogEntry.objects.bulk_create(
+            CatalogEntry(
+                catalog=catalog,
+                position=position,
+                msgctxt=entry.msgctxt,
+                msgid=entry.msgid,
+                msgid_plural=entry.msgid_plural,
+                msgstr=entry.msgstr,
+                msgstr_plural={
+                    str(count): msgstr for count, msgstr in entry.msgstr_plural.items()
+                },
+                fuzzy=entry.fuzzy,
+                flags=[flag for flag in entry.flags if flag != "fuzzy"],
+                comment=entry.comment,
+                tcomment=entry.tcomment,
+                occurrences=[list(occurrence) for occurrence in entry.occurrences],
+                previous_msgctxt=entry.previous_msgctxt,
+                previous_msgid=entry.previous_msgid,
+                previous_msgid_plural=entry.previous_msgid_plural,
+                obsolete=bool(entry.obsolete),
+                translated=entry.translated(),
+            )
+            for position, entry in enumerate(po)
+        )
+
+
+def backwards(apps, schema_editor):
+    Catalog = apps.get_model("projects", "Catalog")
+
+    for catalog in Catalog.objects.iterator():
+        po = polib.POFile(wrapwidth=0)
+        po.header = catalog.header
+        po.metadata = dict(catalog.metadata)
+        po.metadata_is_fuzzy = catalog.metadata_is_fuzzy
+        po.extend(
+            polib.POEntry(
+                msgctxt=entry.msgctxt,
+                msgid=entry.msgid,
+                msgid_plural=entry.msgid_plural,
+                msgstr=entry.msgstr,
+                msgstr_plural={
+                    int(count): msgstr for count, msgstr in entry.msgstr_plural.items()
+                },
+                flags=["fuzzy", *entry.flags] if entry.fuzzy else entry.flags,
+                comment=entry.comment,
+                tcomment=entry.tcomment,
+                occurrences=[tuple(occurrence) for occurrence in entry.occurrences],
+                previous_msgctxt=entry.previous_msgctxt,
+                previous_msgid=entry.previous_msgid,
+                previous_msgid_plural=entry.previous_msgid_plural,
+                obsolete=entry.obsolete,
+            )
+            for entry in catalog.entries.order_by("position")
+        )
+        catalog.pofile = str(po)
+        catalog.save(update_fields=["pofile"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0006_catalogentry"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0007_catalogentry_data"),
+    ]
+
+    operations = [
+        # Allow reversing the removal when catalogs exist
+        migrations.AlterField(
+            model_name="catalog",
+            name="pofile",
+            field=models.TextField(default="", verbose_name="pofile"),
+        ),
+        migrations.RemoveField(
+            model_name="catalog",
+            name="pofile",
+        ),
+    ]
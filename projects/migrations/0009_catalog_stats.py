@@ -0,0 +1,75 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def update_stats(apps, schema_editor):
+    Catalog = apps.get_model("projects", "Catalog")
+
+    for catalog in Catalog.objects.iterator():
+        stats = catalog.entries.aggregate(
+            total=Count("pk", filter=Q(obsolete=False)),
+            translated=Count("pk", filter=Q(translated=True)),
+            fuzzy=Count("pk", filter=Q(fuzzy=True, obsolete=False)),
+            obsolete=Count("pk", filter=Q(obsolete=True)),
+        )
+        catalog.total_count = stats["total"]
+        catalog.translated_count = stats["translated"]
+        catalog.fuzzy_count = stats["fuzzy"]
+        catalog.untranslated_count = (
+            stats["total"] - stats["translated"] - stats["fuzzy"]
+        )
+        catalog.obsolete_count = stats["obsolete"]
+        catalog.save(
+            update_fields=[
+                "total_count",
+                "translated_count",
+                "fuzzy_count",
+                "untranslated_count",
+                "obsolete_count",
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0008_remove_catalog_pofile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalog",
+            name="fuzzy_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="fuzzy"
+            ),
+        ),
+        migrations.AddField(
+            model_name="catalog",
+            name="obsolete_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="obsolete"
+            ),
+        ),
+        migrations.AddField(
+            model_name="catalog",
+            name="total_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="total"
+            ),
+        ),
+        migrations.AddField(
+            model_name="catalog",
+            name="translated_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="translated"
+            ),
+        ),
+        migrations.AddField(
+            model_name="catalog",
+            name="untranslated_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="untranslated"
+            ),
+        ),
+        migrations.RunPython(update_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:08
+
+from django.db import migrations, models
+
+
+def update_search_fields(apps, schema_editor):
+    CatalogEntry = apps.get_model("projects", "CatalogEntry")
+
+    def join(*values):
+        return "\n".join(value for value in values if value).casefold()
+
+    fields = [
+        "search_msgid",
+        "search_msgstr",
+        "search_context",
+        "search_comments",
+        "search_occurrences",
+    ]
+    entries = []
+    for entry in CatalogEntry.objects.iterator(chunk_size=1000):
+        entry.search_msgid = join(entry.msgid, entry.msgid_plural)
+        entry.search_msgstr = join(entry.msgstr, *entry.msgstr_plural.values())
+        entry.search_context = join(entry.msgctxt)
+        entry.search_comments = join(entry.comment, entry.tcomment)
+        entry.search_occurrences = join(
+            *(
+                f"{path}:{lineno}" if lineno else path
+                for path, lineno in entry.occurrences
+            )
+        )
+        entries.append(entry)
+        if len(entries) >= 1000:
+            CatalogEntry.objects.bulk_update(entries, fields)
+            entries = []
+    CatalogEntry.objects.bulk_update(entries, fields)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0009_catalog_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalogentry",
+            name="search_comments",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="catalogentry",
+            name="search_context",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="catalogentry",
+            name="search_msgid",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="catalogentry",
+            name="search_msgstr",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="catalogentry",
+            name="search_occurrences",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(update_search_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0010_catalogentry_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalog",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, verbose_name="content hash"
+            ),
+        ),
+    ]
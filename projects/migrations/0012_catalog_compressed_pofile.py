@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def reset_content_hash(apps, schema_editor):
+    # Hashes are only valid together with the stored pofile
+    Catalog = apps.get_model("projects", "Catalog")
+    Catalog.objects.update(content_hash="")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0011_catalog_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalog",
+            name="compressed_pofile",
+            field=models.BinaryField(
+                blank=True, default=b"", verbose_name="compressed pofile"
+            ),
+        ),
+        migrations.RunPython(reset_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0012_catalog_compressed_pofile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalog",
+            name="revision",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="revision"
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 6.0.3 on 2026-10-18 16:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0013_catalog_revision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TranslationMemory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(max_length=64, unique=True, verbose_name="key"),
+                ),
+                (
+                    "source_language",
+                    models.CharField(
+                        blank=True,
+                        help_text="Empty if the language has been detected automatically.",
+                        max_length=10,
+                        verbose_name="source language",
+                    ),
+                ),
+                (
+                    "target_language",
+                    models.CharField(max_length=10, verbose_name="target language"),
+                ),
+                ("source", models.TextField(verbose_name="source")),
+                ("translation", models.TextField(verbose_name="translation")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+                (
+                    "used_at",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        verbose_name="used at",
+                    ),
+                ),
+                ("hits", models.PositiveIntegerField(default=0, verbose_name="hits")),
+            ],
+            options={
+                "verbose_name": "translation memory entry",
+                "verbose_name_plural": "translation memory",
+                "ordering": ["-used_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.3 on 2026-10-18 17:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("projects", "0016_translationusage"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="translationusage",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("user", None)),
+                fields=("month",),
+                name="projects_translationusage_month_unique",
+            ),
+        ),
+    ]
@@ -1,12 +1,16 @@
 import datetime as dt
+import gzip
+import hashlib
 from functools import cached_property
 
 import polib
 from django.conf import global_settings, settings
 from django.core import validators
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.formats import date_format
 from django.utils.html import format_html
 from django.utils.timesince import timesince
@@ -14,6 +18,11 @@ from django.utils.timezone import localtime
 from django.utils.translation import gettext_lazy as _
 
 from accounts.models import User
+from projects.caching import LRUCache
+
+
+#: Parsed pofiles, keyed by ``(catalog.pk, catalog.updated_at)``
+po_cache = LRUCache(maxsize=settings.CATALOG_CACHE_SIZE)
 
 
 class ChoicesCharField(models.CharField):
@@ -126,6 +135,12 @@ class CatalogQuerySet(models.QuerySet):
         return self if user.is_staff else self.filter(project__users=user)
 
 
+class CatalogManager(models.Manager.from_queryset(CatalogQuerySet)):
+    def get_queryset(self):
+        # The compressed pofile is only loaded when it is accessed
+        return super().get_queryset().defer("compressed_pofile")
+
+
 class Catalog(TimestampedModel):
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
     updated_at = models.DateTimeField(_("updated at"), auto_now=True)
@@ -140,9 +155,32 @@ class Catalog(TimestampedModel):
         _("language"), max_length=10, choices=global_settings.LANGUAGES
     )
     domain = models.CharField(_("domain"), max_length=20, default="django")
-    pofile = models.TextField("pofile")
+    header = models.TextField(_("header"), blank=True)
+    metadata = models.JSONField(_("metadata"), default=dict, blank=True)
+    metadata_is_fuzzy = models.BooleanField(_("metadata is fuzzy"), default=False)
 
-    objects = CatalogQuerySet.as_manager()
+    total_count = models.PositiveIntegerField(_("total"), default=0, editable=False)
+    translated_count = models.PositiveIntegerField(
+        _("translated"), default=0, editable=False
+    )
+    fuzzy_count = models.PositiveIntegerField(_("fuzzy"), default=0, editable=False)
+    untranslated_count = models.PositiveIntegerField(
+        _("untranslated"), default=0, editable=False
+    )
+    obsolete_count = models.PositiveIntegerField(
+        _("obsolete"), default=0, editable=False
+    )
+    # Incremented by every save, see ``save()``
+    revision = models.PositiveIntegerField(_("revision"), default=0, editable=False)
+    # The rendered pofile (gzip) and its SHA-256, stored when first requested
+    content_hash = models.CharField(
+        _("content hash"), max_length=64, blank=True, editable=False
+    )
+    compressed_pofile = models.BinaryField(
+        _("compressed pofile"), blank=True, default=b""
+    )
+
+    objects = CatalogManager()
 
     class Meta:
         ordering = ["language_code", "domain"]
@@ -150,17 +188,38 @@ class Catalog(TimestampedModel):
         verbose_name = _("catalog")
         verbose_name_plural = _("catalogs")
 
+    #: Replacement pofile (text or ``polib.POFile``) written by ``save()``
+    _new_po = None
+
     def __str__(self):
-        try:
-            percent_translated = f"{self.po.percent_translated()}%"
-        except Exception:
-            percent_translated = "Invalid"
-        return (
-            f"{self.get_language_code_display()}, {self.domain} ({percent_translated})"
-        )
+        return f"{self.get_language_code_display()}, {self.domain} ({self.percent_translated}%)"
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            new_entries = None
+            if self._new_po is not None:
+                po = self._parse_new_po()
+                self.header = po.header
+                self.metadata = dict(po.metadata)
+                self.metadata_is_fuzzy = bool(po.metadata_is_fuzzy)
+                new_entries = [
+                    CatalogEntry.from_poentry(entry, catalog=self, position=position)
+                    for position, entry in enumerate(po)
+                ]
+                self._new_po = None
+
+            self.update_stats(new_entries)
+            self.content_hash = ""
+            self.compressed_pofile = b""
+            # Concurrent saves must not end up with the same revision
+            self.revision = models.F("revision") + 1 if self.pk else 1
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=["revision"])
+
+            if new_entries is not None:
+                self.entries.all().delete()
+                CatalogEntry.objects.bulk_create(new_entries)
+        po_cache.invalidate(self.pk)
         self.project.save()
 
     save.alters_data = True
@@ -175,9 +234,381 @@ class Catalog(TimestampedModel):
             },
         )
 
-    @cached_property
+    def update_stats(self, entries=None):
+        """
+        Recompute the translation statistics
+
+        Counts ``entries`` if given, the stored entries otherwise. Follows
+        polib: Fuzzy entries are neither translated nor untranslated.
+        """
+        if entries is not None:
+            stats = {
+                "total": sum(not entry.obsolete for entry in entries),
+                "translated": sum(entry.translated for entry in entries),
+                "fuzzy": sum(entry.fuzzy and not entry.obsolete for entry in entries),
+                "obsolete": sum(entry.obsolete for entry in entries),
+            }
+        elif self.pk:
+            stats = self.entries.aggregate(
+                total=Count("pk", filter=Q(obsolete=False)),
+                translated=Count("pk", filter=Q(translated=True)),
+                fuzzy=Count("pk", filter=Q(fuzzy=True, obsolete=False)),
+                obsolete=Count("pk", filter=Q(obsolete=True)),
+            )
+        else:
+            return
+
+        self.total_count = stats["total"]
+        self.translated_count = stats["translated"]
+        self.fuzzy_count = stats["fuzzy"]
+        self.untranslated_count = stats["total"] - stats["translated"] - stats["fuzzy"]
+        self.obsolete_count = stats["obsolete"]
+
+    def store_pofile(self):
+        """
+        Render the pofile and store it compressed together with its hash
+
+        Nothing is stored if the catalog has been modified in the meantime.
+        """
+        content = str(self.po).encode("utf-8")
+        self.content_hash = hashlib.sha256(content).hexdigest()
+        self.compressed_pofile = gzip.compress(content, mtime=0)
+        Catalog.objects.filter(pk=self.pk, updated_at=self.updated_at).update(
+            content_hash=self.content_hash,
+            compressed_pofile=self.compressed_pofile,
+        )
+
+    @property
+    def percent_translated(self):
+        if not self.total_count:
+            return 100
+        return self.translated_count * 100 // self.total_count
+
+    @property
+    def pofile(self):
+        if isinstance(self._new_po, str):
+            return self._new_po
+        if self._new_po is None and self.content_hash:
+            if "compressed_pofile" in self.get_deferred_fields():
+                # Concurrent saves clear the hash and the compressed pofile;
+                # load them together to not mix up different versions
+                self.refresh_from_db(
+                    fields=["content_hash", "compressed_pofile", "updated_at"]
+                )
+            if self.compressed_pofile:
+                return gzip.decompress(self.compressed_pofile).decode("utf-8")
+        return str(self.po)
+
+    @pofile.setter
+    def pofile(self, value):
+        self._new_po = value
+
+    def replace_po(self, po):
+        """
+        Replace all entries and the metadata with the contents of ``po``
+
+        The catalog has to be saved afterwards.
+        """
+        self._new_po = po
+
+    def merge_po(self, po, *, removed=None):
+        """
+        Merge the entries of ``po`` into the stored entries and save the catalog
+
+        Behaves like ``polib.POFile.merge()`` (and therefore like msgmerge):
+        Translations and translator comments are kept, occurrences, extracted
+        comments and flags are taken from ``po`` while keeping the fuzzy flag,
+        missing plural forms are added, entries which aren't in ``po`` anymore
+        are marked obsolete and new entries are appended. Entries are matched
+        using a ``msgid_with_context`` index and only changed rows are written.
+
+        ``po`` may also contain only the added and changed entries of a
+        patch, in which case only the entries whose ``msgid_with_context`` is
+        in ``removed`` are marked obsolete.
+
+        Returns the number of changed and added entries. The catalog isn't
+        saved if nothing changed.
+        """
+        with transaction.atomic():
+            rows = list(self.entries.all())
+            index = {row.msgid_with_context: row for row in rows}
+            position = rows[-1].position + 1 if rows else 0
+            incoming = set()
+            changed, created = [], []
+
+            for entry in po:
+                incoming.add(entry.msgid_with_context)
+                if (row := index.get(entry.msgid_with_context)) is None:
+                    merged = polib.POEntry()
+                    merged.merge(entry)
+                    created.append(
+                        CatalogEntry.from_poentry(
+                            merged, catalog=self, position=position
+                        )
+                    )
+                    position += 1
+                else:
+                    merged = row.as_poentry()
+                    merged.merge(entry)
+                    if row.update_from_poentry(merged):
+                        changed.append(row)
+
+            for row in rows:
+                if row.obsolete:
+                    continue
+                if (
+                    row.msgid_with_context not in incoming
+                    if removed is None
+                    else row.msgid_with_context in removed
+                ):
+                    merged = row.as_poentry()
+                    merged.obsolete = True
+                    row.update_from_poentry(merged)
+                    changed.append(row)
+
+            if not changed and not created:
+                return 0
+
+            # An upsert is much faster than bulk_update() and its CASE WHENs
+            CatalogEntry.objects.bulk_create(
+                changed + created,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=CatalogEntry.POENTRY_FIELDS,
+            )
+            self.save()
+        return len(changed) + len(created)
+
+    merge_po.alters_data = True
+
+    def patch_po(self, po, removed):
+        """
+        Replace the entries of ``po`` and delete the ``removed`` entries
+
+        The counterpart of ``replace_po()`` for patches: ``po`` only contains
+        the added and changed entries; added entries are appended. The
+        metadata is only replaced if ``po`` has any. Saves the catalog.
+        """
+        with transaction.atomic():
+            rows = list(self.entries.all())
+            index = {row.msgid_with_context: row for row in rows}
+            position = rows[-1].position + 1 if rows else 0
+            upserts = []
+
+            for entry in po:
+                if (row := index.get(entry.msgid_with_context)) is None:
+                    row = CatalogEntry(catalog=self, position=position)
+                    position += 1
+                row.update_from_poentry(entry)
+                upserts.append(row)
+
+            CatalogEntry.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=CatalogEntry.POENTRY_FIELDS,
+            )
+            self.entries.filter(
+                pk__in=[row.pk for row in rows if row.msgid_with_context in removed]
+            ).delete()
+
+            if po.metadata:
+                self.header = po.header
+                self.metadata = dict(po.metadata)
+                self.metadata_is_fuzzy = bool(po.metadata_is_fuzzy)
+            self.save()
+
+    patch_po.alters_data = True
+
+    def patch_conflicts(self, po, base, removed):
+        """
+        Return the ``msgid_with_context`` values of conflicting patch entries
+
+        ``po`` contains the added and changed entries, ``base`` the versions
+        they were changed from. Entries conflict if they have been changed on
+        both sides since, to different values. Removing entries which have
+        been changed since conflicts too.
+        """
+        ours = {entry.msgid_with_context: str(entry) for entry in po}
+        base = {entry.msgid_with_context: str(entry) for entry in base}
+        keys = ours.keys() | removed
+        conflicts = []
+        for row in self.entries.filter(
+            msgid__in={key.rpartition("\x04")[2] for key in keys}
+        ):
+            key = row.msgid_with_context
+            if key in keys and str(row.as_poentry()) not in {
+                base.get(key),
+                ours.get(key),
+            }:
+                conflicts.append(key)
+        return conflicts
+
+    @property
     def po(self):
-        return polib.pofile(self.pofile, wrapwidth=0)
+        """
+        The pofile, built from the catalog entries
+
+        The instance is shared with other requests through ``po_cache`` and
+        must not be modified. Use ``build_po()`` to get a private copy.
+        """
+        if self._new_po is not None or not self.pk:
+            return self._parse_new_po()
+        return po_cache.get((self.pk, self.updated_at), self.build_po)
+
+    def build_po(self):
+        if self._new_po is not None or not self.pk:
+            return self._parse_new_po()
+        po = polib.POFile(wrapwidth=0)
+        po.header = self.header
+        po.metadata = dict(self.metadata)
+        po.metadata_is_fuzzy = self.metadata_is_fuzzy
+        po.extend(entry.as_poentry() for entry in self.entries.all())
+        return po
+
+    def _parse_new_po(self):
+        if isinstance(self._new_po, polib.POFile):
+            return self._new_po
+        return polib.pofile(self._new_po or "", wrapwidth=0)
+
+
+class CatalogEntry(models.Model):
+    catalog = models.ForeignKey(
+        Catalog,
+        on_delete=models.CASCADE,
+        related_name="entries",
+        verbose_name=_("catalog"),
+    )
+    position = models.PositiveIntegerField(_("position"))
+    # NULL and the empty string aren't the same in pofiles, e.g. ``msgctxt ""``
+    msgctxt = models.TextField("msgctxt", blank=True, null=True)  # noqa: DJ001
+    msgid = models.TextField("msgid")
+    msgid_plural = models.TextField("msgid_plural", blank=True)
+    msgstr = models.TextField("msgstr", blank=True)
+    msgstr_plural = models.JSONField("msgstr_plural", default=dict, blank=True)
+    fuzzy = models.BooleanField(_("fuzzy"), default=False)
+    flags = models.JSONField(_("flags"), default=list, blank=True)
+    comment = models.TextField(_("comment"), blank=True)
+    tcomment = models.TextField(_("translator comment"), blank=True)
+    occurrences = models.JSONField(_("occurrences"), default=list, blank=True)
+    previous_msgctxt = models.TextField(blank=True, null=True)  # noqa: DJ001
+    previous_msgid = models.TextField(blank=True, null=True)  # noqa: DJ001
+    previous_msgid_plural = models.TextField(blank=True, null=True)  # noqa: DJ001
+    obsolete = models.BooleanField(_("obsolete"), default=False)
+    translated = models.BooleanField(_("translated"), default=False)
+
+    # Casefolded copies of the searchable parts of the entry
+    search_msgid = models.TextField(blank=True, editable=False)
+    search_msgstr = models.TextField(blank=True, editable=False)
+    search_context = models.TextField(blank=True, editable=False)
+    search_comments = models.TextField(blank=True, editable=False)
+    search_occurrences = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        ordering = ["position"]
+        indexes = [models.Index(fields=["catalog", "position"])]
+        verbose_name = _("catalog entry")
+        verbose_name_plural = _("catalog entries")
+
+    #: Fields set by ``update_from_poentry()``, e.g. for ``bulk_update()``
+    POENTRY_FIELDS = [
+        "msgctxt",
+        "msgid",
+        "msgid_plural",
+        "msgstr",
+        "msgstr_plural",
+        "fuzzy",
+        "flags",
+        "comment",
+        "tcomment",
+        "occurrences",
+        "previous_msgctxt",
+        "previous_msgid",
+        "previous_msgid_plural",
+        "obsolete",
+        "translated",
+        "search_msgid",
+        "search_msgstr",
+        "search_context",
+        "search_comments",
+        "search_occurrences",
+    ]
+
+    def __str__(self):
+        return self.msgid
+
+    @property
+    def msgid_with_context(self):
+        if self.msgctxt:
+            return f"{self.msgctxt}\x04{self.msgid}"
+        return self.msgid
+
+    @classmethod
+    def from_poentry(cls, entry, **kwargs):
+        instance = cls(**kwargs)
+        instance.update_from_poentry(entry)
+        return instance
+
+    def update_from_poentry(self, entry):
+        """
+        Copy the contents of ``entry`` to this row
+
+        Returns whether any of the ``POENTRY_FIELDS`` changed.
+        """
+        before = [getattr(self, field) for field in self.POENTRY_FIELDS]
+        self.msgctxt = entry.msgctxt
+        self.msgid = entry.msgid
+        self.msgid_plural = entry.msgid_plural
+        self.msgstr = entry.msgstr
+        self.msgstr_plural = {
+            str(count): msgstr for count, msgstr in entry.msgstr_plural.items()
+        }
+        self.fuzzy = entry.fuzzy
+        self.flags = [flag for flag in entry.flags if flag != "fuzzy"]
+        self.comment = entry.comment
+        self.tcomment = entry.tcomment
+        self.occurrences = [list(occurrence) for occurrence in entry.occurrences]
+        self.previous_msgctxt = entry.previous_msgctxt
+        self.previous_msgid = entry.previous_msgid
+        self.previous_msgid_plural = entry.previous_msgid_plural
+        self.obsolete = bool(entry.obsolete)
+        self.translated = entry.translated()
+        self.update_search_fields()
+        return before != [getattr(self, field) for field in self.POENTRY_FIELDS]
+
+    def update_search_fields(self):
+        def join(*values):
+            return "\n".join(value for value in values if value).casefold()
+
+        self.search_msgid = join(self.msgid, self.msgid_plural)
+        self.search_msgstr = join(self.msgstr, *self.msgstr_plural.values())
+        self.search_context = join(self.msgctxt)
+        self.search_comments = join(self.comment, self.tcomment)
+        self.search_occurrences = join(
+            *(
+                f"{path}:{lineno}" if lineno else path
+                for path, lineno in self.occurrences
+            )
+        )
+
+    def as_poentry(self):
+        return polib.POEntry(
+            msgctxt=self.msgctxt,
+            msgid=self.msgid,
+            msgid_plural=self.msgid_plural,
+            msgstr=self.msgstr,
+            msgstr_plural={
+                int(count): msgstr for count, msgstr in self.msgstr_plural.items()
+            },
+            flags=["fuzzy", *self.flags] if self.fuzzy else list(self.flags),
+            comment=self.comment,
+            tcomment=self.tcomment,
+            occurrences=[tuple(occurrence) for occurrence in self.occurrences],
+            previous_msgctxt=self.previous_msgctxt,
+            previous_msgid=self.previous_msgid,
+            previous_msgid_plural=self.previous_msgid_plural,
+            obsolete=self.obsolete,
+        )
 
 
 class Event(models.Model):
@@ -259,3 +690,167 @@ class Event(models.Model):
             project=self.project or self.project_string,
             catalog=self.catalog_string,
         )
+
+
+class TranslationMemoryQuerySet(models.QuerySet):
+    def fresh(self):
+        return self.filter(
+            created_at__gte=timezone.now()
+            - dt.timedelta(days=settings.TRANSLATION_MEMORY_DAYS)
+        )
+
+    def prune(self):
+        """
+        Remove expired entries and the least recently used entries exceeding
+        ``TRANSLATION_MEMORY_SIZE``
+        """
+        self.exclude(pk__in=self.fresh()).delete()
+        if (excess := self.count() - settings.TRANSLATION_MEMORY_SIZE) > 0:
+            self.filter(
+                pk__in=list(
+                    self.order_by("used_at").values_list("pk", flat=True)[:excess]
+                )
+            ).delete()
+
+    def stats(self):
+        """
+        Return the number of entries and hits and the hit rate
+
+        Every entry has been a miss once, when it has been machine translated.
+        """
+        stats = self.aggregate(entries=Count("pk"), hits=Coalesce(Sum("hits"), 0))
+        lookups = stats["entries"] + stats["hits"]
+        return {**stats, "hit_rate": stats["hits"] / lookups if lookups else 0.0}
+
+
+class TranslationMemory(models.Model):
+    """
+    Machine translations, reused across projects and users
+    """
+
+    key = models.CharField(_("key"), max_length=64, unique=True)
+    source_language = models.CharField(
+        _("source language"),
+        max_length=10,
+        blank=True,
+        help_text=_("Empty if the language has been detected automatically."),
+    )
+    target_language = models.CharField(_("target language"), max_length=10)
+    source = models.TextField(_("source"))
+    translation = models.TextField(_("translation"))
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    used_at = models.DateTimeField(_("used at"), default=timezone.now, db_index=True)
+    hits = models.PositiveIntegerField(_("hits"), default=0)
+
+    objects = TranslationMemoryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["-used_at"]
+        verbose_name = _("translation memory entry")
+        verbose_name_plural = _("translation memory")
+
+    def __str__(self):
+        return self.source
+
+    @staticmethod
+    def make_key(source, source_language, target_language):
+        """
+        Return the key of a translation; the source text may be too long for
+        an index of its own
+        """
+        return hashlib.sha256(
+            f"{source_language.lower()}\x00{target_language.lower()}\x00{source}".encode()
+        ).hexdigest()
+
+
+class TranslationUsageQuerySet(models.QuerySet):
+    def current(self):
+        return self.filter(month=timezone.localdate().replace(day=1))
+
+    def characters(self):
+        return self.aggregate(characters=Coalesce(Sum("characters"), 0))["characters"]
+
+
+class TranslationUsage(models.Model):
+    """
+    Characters sent to DeepL per user and month, see ``DEEPL_CHARACTER_BUDGET``
+
+    Rows without a user contain the characters of requests made without a
+    user and of deleted users.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name=_("user"),
+    )
+    month = models.DateField(_("month"))
+    characters = models.PositiveBigIntegerField(_("characters"), default=0)
+
+    objects = TranslationUsageQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # unique_together doesn't prevent duplicate rows without a user
+            models.UniqueConstraint(
+                fields=["month"],
+                condition=Q(user=None),
+                name="projects_translationusage_month_unique",
+            )
+        ]
+        ordering = ["-month", "-characters"]
+        unique_together = [("user", "month")]
+        verbose_name = _("translation usage")
+        verbose_name_plural = _("translation usage")
+
+    def __str__(self):
+        return f"{self.user or '-'} ({self.month:%Y-%m})"
+
+
+class PretranslationJob(models.Model):
+    """
+    Machine translation of all pending entries of a catalog, see
+    ``projects.pretranslation``
+    """
+
+    catalog = models.ForeignKey(
+        Catalog,
+        on_delete=models.CASCADE,
+        related_name="pretranslation_jobs",
+        verbose_name=_("catalog"),
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name=_("user"),
+    )
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+    finished_at = models.DateTimeField(_("finished at"), blank=True, null=True)
+    total = models.PositiveIntegerField(_("total"), default=0)
+    done = models.PositiveIntegerField(_("done"), default=0)
+    translated = models.PositiveIntegerField(_("translated"), default=0)
+    error = models.TextField(_("error"), blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = _("pre-translation job")
+        verbose_name_plural = _("pre-translation jobs")
+
+    def __str__(self):
+        return f"{self.catalog} ({self.done}/{self.total})"
+
+    def as_json(self):
+        return {
+            "total": self.total,
+            "done": self.done,
+            "translated": self.translated,
+            "finished": self.finished_at is not None,
+            "error": self.error,
+        }
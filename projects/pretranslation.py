@@ -0,0 +1,180 @@
+"""
+Machine translation of all pending entries of a catalog
+
+Jobs are started from the catalog page and by ``trd pretranslate`` and run in
+a background thread of the web process, or run directly by the
+``pretranslate`` management command. Texts are sent to DeepL in batches with
+bounded concurrency and rate limiting; the catalog is only written once at
+the end and the translations are marked as fuzzy.
+"""
+
+import asyncio
+import datetime as dt
+import threading
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from projects import translators
+from projects.models import Catalog, CatalogEntry, Event, PretranslationJob
+
+
+#: Unfinished jobs which haven't made progress for this long have died
+STALE_AFTER = dt.timedelta(minutes=10)
+
+
+def _pending(row):
+    """Return whether the entry hasn't been translated at all"""
+    return not (row.fuzzy or row.msgstr or any(row.msgstr_plural.values()))
+
+
+def _sources(row):
+    """Return the text to translate for the msgstr or each plural form"""
+    if row.msgid_plural:
+        return {
+            count: row.msgid if count == "0" else row.msgid_plural
+            for count in row.msgstr_plural
+        }
+    return {None: row.msgid}
+
+
+def running_job(catalog):
+    return catalog.pretranslation_jobs.filter(
+        finished_at__isnull=True, updated_at__gte=timezone.now() - STALE_AFTER
+    ).first()
+
+
+def start(catalog, *, user):
+    """
+    Start pre-translating ``catalog`` in a background thread
+
+    Only one job runs per catalog at a time. Returns the job and whether it
+    has been created.
+    """
+    with transaction.atomic():
+        Catalog.objects.select_for_update().filter(pk=catalog.pk).exists()
+        if job := running_job(catalog):
+            return job, False
+        job = PretranslationJob.objects.create(catalog=catalog, user=user)
+        transaction.on_commit(
+            lambda: threading.Thread(target=_run_in_thread, args=(job,)).start()
+        )
+    return job, True
+
+
+def _run_in_thread(job):
+    try:
+        run(job)
+    finally:
+        connection.close()
+
+
+def run(job, *, progress=None):
+    """
+    Translate the pending entries of the job's catalog
+
+    ``total`` and ``done`` count distinct texts, ``translated`` the entries
+    saved at the end. ``progress(job)`` is called after each batch.
+    """
+    sources = {
+        row.pk: _sources(row)
+        for row in job.catalog.entries.filter(
+            obsolete=False, translated=False, fuzzy=False
+        )
+        if _pending(row)
+    }
+    texts = list(
+        dict.fromkeys(text for forms in sources.values() for text in forms.values())
+    )
+    job.total = len(texts)
+    job.save()
+
+    try:
+        translations = async_to_sync(_translate_all)(
+            job, texts, job.catalog.language_code, progress, user=job.user
+        )
+    except (translators.TranslationError, httpx.HTTPError) as exc:
+        job.error = str(exc) or exc.__class__.__name__
+    else:
+        job.translated = _save(job, sources, translations)
+    job.finished_at = timezone.now()
+    job.save()
+    if progress:
+        progress(job)
+    return job
+
+
+async def _translate_all(job, texts, language_code, progress, *, user):
+    """
+    Return a ``text → translation`` mapping using concurrent batches, charged
+    to ``user``
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(settings.PRETRANSLATION_CONCURRENCY)
+    interval = 1 / settings.PRETRANSLATION_RATE
+    next_start = loop.time()
+
+    async def translate(batch):
+        nonlocal next_start
+        async with semaphore:
+            # Space out the requests to stay below the rate limit
+            delay = next_start - loop.time()
+            next_start = max(next_start, loop.time()) + interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+            translations = await translators.translate_many_by_deepl(
+                batch, language_code, settings.DEEPL_AUTH_KEY, user=user
+            )
+        job.done += len(batch)
+        await job.asave(update_fields=["done", "updated_at"])
+        if progress:
+            progress(job)
+        return dict(zip(batch, translations))
+
+    size = translators.DEEPL_BATCH_SIZE
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(translate(texts[start : start + size]))
+                for start in range(0, len(texts), size)
+            ]
+    except ExceptionGroup as exc:
+        # The other batches have been cancelled
+        raise exc.exceptions[0] from exc
+    return {text: msgstr for task in tasks for text, msgstr in task.result().items()}
+
+
+def _save(job, sources, translations):
+    """
+    Save the translations as fuzzy
+
+    Entries translated by somebody else in the meantime are kept. Returns
+    the number of entries saved.
+    """
+    rows = []
+    with transaction.atomic():
+        catalog = Catalog.objects.select_for_update().get(pk=job.catalog_id)
+        for row in catalog.entries.filter(pk__in=sources):
+            if not _pending(row):
+                continue
+            entry = row.as_poentry()
+            for count, source in sources[row.pk].items():
+                msgstr = translators.fix_nls(source, translations[source])
+                if count is None:
+                    entry.msgstr = msgstr
+                else:
+                    entry.msgstr_plural[int(count)] = msgstr
+            entry.fuzzy = True
+            row.update_from_poentry(entry)
+            rows.append(row)
+
+        if rows:
+            CatalogEntry.objects.bulk_update(rows, CatalogEntry.POENTRY_FIELDS)
+            catalog.save()
+            Event.objects.create(
+                user=job.user, action=Event.Action.CATALOG_UPDATED, catalog=catalog
+            )
+    return len(rows)
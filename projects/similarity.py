@@ -0,0 +1,173 @@
+"""
+Fuzzy matches for msgids from the translations in all catalogs
+
+An index of the translated entries is built per target language and kept in
+memory. When catalogs of the language change, only their entries are
+reindexed. Matches are scored using the Dice coefficient of the character
+trigrams of the casefolded msgids, so no external service is needed.
+"""
+
+import heapq
+import math
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from projects.caching import LRUCache
+from projects.models import Catalog, CatalogEntry
+
+
+index_cache = LRUCache(maxsize=8)
+
+Match = namedtuple("Match", ["score", "msgid", "msgstr"])
+
+
+def _trigrams(text):
+    text = " ".join(text.casefold().split())
+    text = f"  {text} "
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class SimilarityIndex:
+    """
+    Inverted index mapping trigrams to the translated msgids containing them
+
+    Rows are added per catalog, so that the rows of changed catalogs can be
+    replaced without rebuilding the whole index.
+    """
+
+    def __init__(self, rows=()):
+        """Index ``(msgid, msgstr, project_id)`` rows"""
+        self.docs = {}
+        self.doc_ids = {}
+        self.postings = defaultdict(set)
+        self.catalogs = {}
+        self.versions = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        if rows:
+            self.update(None, rows)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def update(self, catalog_id, rows, *, version=None):
+        """
+        Replace the ``(msgid, msgstr, project_id)`` rows of a catalog
+
+        ``version`` is remembered for ``outdated()``.
+        """
+        with self._lock:
+            self._remove(catalog_id)
+            self.versions[catalog_id] = version
+            added = Counter()
+            for msgid, msgstr, project_id in rows:
+                if (doc_id := self.doc_ids.get((msgid, msgstr))) is None:
+                    doc_id = self.doc_ids[msgid, msgstr] = self._next_id
+                    self._next_id += 1
+                    trigrams = _trigrams(msgid)
+                    self.docs[doc_id] = (msgid, msgstr, Counter(), len(trigrams))
+                    for trigram in trigrams:
+                        self.postings[trigram].add(doc_id)
+                self.docs[doc_id][2][project_id] += 1
+                added[doc_id, project_id] += 1
+            self.catalogs[catalog_id] = added
+
+    def remove(self, catalog_id):
+        """Remove the rows of a catalog"""
+        with self._lock:
+            self._remove(catalog_id)
+            self.versions.pop(catalog_id, None)
+
+    def outdated(self, versions):
+        """
+        Return the indexed catalogs missing from the ``catalog_id → version``
+        mapping and the catalogs whose version differs from the indexed one
+        """
+        with self._lock:
+            removed = self.versions.keys() - versions.keys()
+            changed = [
+                pk
+                for pk, version in versions.items()
+                if pk not in self.versions or self.versions[pk] != version
+            ]
+        return removed, changed
+
+    def _remove(self, catalog_id):
+        for (doc_id, project_id), count in self.catalogs.pop(catalog_id, {}).items():
+            msgid, msgstr, project_ids, _size = self.docs[doc_id]
+            project_ids[project_id] -= count
+            if project_ids[project_id] <= 0:
+                del project_ids[project_id]
+            if not project_ids:
+                del self.docs[doc_id]
+                del self.doc_ids[msgid, msgstr]
+                for trigram in _trigrams(msgid):
+                    self.postings[trigram].discard(doc_id)
+                    if not self.postings[trigram]:
+                        del self.postings[trigram]
+
+    def search(self, msgid, *, limit=3, min_score=0.5, projects=None):
+        """
+        Return up to ``limit`` matches scoring at least ``min_score``, best first
+
+        Only translations from ``projects`` (a set of primary keys) are
+        returned if given.
+        """
+        with self._lock:
+            return self._search(msgid, limit, min_score, projects)
+
+    def _search(self, msgid, limit, min_score, projects):
+        trigrams = sorted(
+            _trigrams(msgid), key=lambda trigram: len(self.postings.get(trigram, ()))
+        )
+        # Matches share at least ``required`` trigrams with the msgid, and
+        # therefore at least one of the rarest ``len - required + 1``.
+        # Counting the common trigrams is only necessary for those candidates.
+        required = math.ceil(min_score * len(trigrams) / (2 - min_score))
+        cutoff = len(trigrams) - required + 1
+        shared = Counter()
+        for trigram in trigrams[:cutoff]:
+            shared.update(self.postings.get(trigram, ()))
+        for trigram in trigrams[cutoff:]:
+            if postings := self.postings.get(trigram):
+                shared.update(postings.intersection(shared))
+
+        matches = []
+        for doc_id, count in shared.items():
+            doc_msgid, msgstr, project_ids, size = self.docs[doc_id]
+            score = 2 * count / (len(trigrams) + size)
+            if score >= min_score and (
+                projects is None or not projects.isdisjoint(project_ids)
+            ):
+                matches.append(Match(score, doc_msgid, msgstr))
+        return heapq.nlargest(limit, matches)
+
+
+def index_for(language_code):
+    """
+    Return the index of all translations into ``language_code``
+
+    The index is cached; the entries of catalogs which changed since they
+    have been indexed are reindexed first.
+    """
+    index = index_cache.get((language_code,), SimilarityIndex)
+    versions = dict(
+        Catalog.objects.filter(language_code=language_code).values_list(
+            "pk", "updated_at"
+        )
+    )
+    removed, changed = index.outdated(versions)
+    for catalog_id in removed:
+        index.remove(catalog_id)
+
+    rows = defaultdict(list)
+    for catalog_id, *row in CatalogEntry.objects.filter(
+        catalog__in=changed,
+        translated=True,
+        obsolete=False,
+        msgid_plural="",
+    ).values_list("catalog_id", "msgid", "msgstr", "catalog__project_id"):
+        rows[catalog_id].append(row)
+    for catalog_id in changed:
+        index.update(catalog_id, rows[catalog_id], version=versions[catalog_id])
+    return index
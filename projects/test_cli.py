@@ -0,0 +1,444 @@
+import importlib.util
+import io
+import json
+import tempfile
+import zipfile
+from concurrent.futures import Executor, Future
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from unittest.mock import Mock, patch
+from urllib.parse import urlsplit
+
+import click
+import requests
+from click.testing import CliRunner
+from django.conf import settings
+from django.test import Client, TestCase
+
+from accounts.models import User
+from projects.models import Project
+
+
+_spec = importlib.util.spec_from_file_location(
+    "trd", Path(__file__).resolve().parent.parent / "cli" / "trd.py"
+)
+trd = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(trd)
+
+
+POFILE = """\
+msgid ""
+msgstr ""
+"Language: de\\n"
+
+#: app/views.py:10
+msgid "Hello"
+msgstr "Hallo"
+
+msgid "World"
+msgstr "Welt"
+"""
+
+ENTRIES = """\
+msgid ""
+msgstr ""
+"Language: de\\n"
+
+#: app/menu.py:1
+#: app/menu.py:2
+msgctxt "menu"
+msgid "Open"
+msgstr "Öffnen"
+
+msgid "Open"
+msgstr "Offen"
+
+msgid "%(count)s file"
+msgid_plural "%(count)s files"
+msgstr[0] "%(count)s Datei"
+msgstr[1] "%(count)s Dateien"
+
+#~ msgid "Old"
+#~ msgstr "Alt"
+"""
+
+
+class TestSession:
+    """
+    Send the CLI's requests to the Django test client
+    """
+
+    def __init__(self, client, headers):
+        self.client = client
+        self.headers = headers
+
+    def request(self, method, url, *, data=None, headers=None, timeout=None):
+        headers = {**self.headers, **(headers or {})}
+        r = self.client.generic(
+            method,
+            urlsplit(url).path,
+            data=data or b"",
+            content_type=headers.pop("content-type", "text/plain"),
+            headers=headers,
+        )
+        return Mock(
+            status_code=r.status_code,
+            ok=r.status_code < 400,
+            reason=r.reason_phrase,
+            headers=r.headers,
+            content=r.content,
+            text=r.content.decode("utf-8"),
+            json=r.json,
+        )
+
+
+class InlineExecutor(Executor):
+    """
+    Run transfers in the test's thread, which has access to the test database
+    """
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+class CLITest(TestCase):
+    def test_obsoleting_round_trip(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        client = Client()
+        headers = {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+
+        p = Project.objects.create(name="test", slug="test")
+        c = p.catalogs.create(language_code="de", domain="django", pofile=POFILE)
+
+        content = POFILE.replace(
+            'msgid "World"\nmsgstr "Welt"', '#~ msgid "World"\n#~ msgstr "Welt"'
+        )
+        patch = trd._diff(POFILE, content)
+        self.assertEqual(patch["changed"], '#~ msgid "World"\n#~ msgstr "Welt"')
+        self.assertEqual(patch["removed"], [])
+
+        r = client.put(
+            "/api/pofile/test/de/django/",
+            headers={**headers, "x-base-revision": str(c.revision)},
+            data=json.dumps(patch),
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "obsolete")),
+            [("Hello", False), ("World", True)],
+        )
+
+        # Reviving the entry is a change as well
+        self.assertEqual(
+            trd._diff(content, POFILE)["changed"], 'msgid "World"\nmsgstr "Welt"'
+        )
+
+    def test_submit_and_replace(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        session = TestSession(
+            Client(), {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+        )
+        p = Project.objects.create(name="test", slug="test")
+        c = p.catalogs.create(language_code="de", domain="django", pofile=POFILE)
+        project = {"url": "http://testserver/api/pofile/test/"}
+
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(patch.object(trd, "_cache_dir", return_value=directory))
+        self.enterContext(
+            patch.object(
+                trd, "_manifest_path", return_value=directory / "manifest.json"
+            )
+        )
+        pofile = directory / "de" / "LC_MESSAGES" / "django.po"
+        pofile.parent.mkdir(parents=True)
+        manifest = {}
+        trd._record_download(manifest, pofile, POFILE.encode("utf-8"), c.revision)
+
+        def upload(method):
+            with (
+                patch("concurrent.futures.ThreadPoolExecutor", InlineExecutor),
+                redirect_stdout(io.StringIO()),
+            ):
+                return trd._upload_each(
+                    project,
+                    session,
+                    [pofile],
+                    manifest,
+                    method=method,
+                    message="Uploaded",
+                    jobs=1,
+                    force=False,
+                )
+
+        # Submitting keeps the server's translations
+        pofile.write_text(POFILE.replace("Hallo", "Servus"))
+        self.assertEqual(upload("POST"), 0)
+        self.assertEqual(c.entries.get(msgid="Hello").msgstr, "Hallo")
+
+        # The server's copy isn't the submitted pofile, replace it completely
+        self.assertIsNone(
+            trd._patch(pofile.read_bytes(), manifest[str(pofile)], method="PUT")
+        )
+        self.assertEqual(upload("PUT"), 0)
+        self.assertEqual(c.entries.get(msgid="Hello").msgstr, "Servus")
+
+        # Afterwards, replacing uses patches again
+        pofile.write_text(POFILE.replace("Hallo", "Moin"))
+        self.assertIsNotNone(
+            trd._patch(pofile.read_bytes(), manifest[str(pofile)], method="PUT")
+        )
+        self.assertEqual(upload("PUT"), 0)
+        self.assertEqual(c.entries.get(msgid="Hello").msgstr, "Moin")
+
+    def test_crlf(self):
+        content = POFILE.replace("\n", "\r\n")
+        header, entries = trd._po_entries(content)
+        self.assertEqual(header[1], [["msgid", ""], ["msgstr", "Language: de\n"]])
+        self.assertEqual(list(entries), [(None, "Hello"), (None, "World")])
+        self.assertEqual(entries[None, "World"][0], 'msgid "World"\nmsgstr "Welt"')
+        self.assertEqual(
+            trd._diff(POFILE, content),
+            {"added": "", "changed": "", "removed": [], "base": ""},
+        )
+
+    def test_transfer_errors(self):
+        def transfer(pofile):
+            if pofile == "b.po":
+                raise requests.ConnectionError("Connection refused")
+            return f"Updated {pofile}", 0, 0
+
+        checkpoint = Mock()
+        with (
+            redirect_stdout(io.StringIO()) as out,
+            redirect_stderr(io.StringIO()) as err,
+        ):
+            failed = trd._transfer_all(
+                ["a.po", "b.po", "c.po"], transfer, jobs=2, checkpoint=checkpoint
+            )
+        self.assertEqual(failed, 1)
+        self.assertEqual(checkpoint.call_count, 2)
+        self.assertEqual(
+            out.getvalue().splitlines()[:2], ["Updated a.po", "Updated c.po"]
+        )
+        self.assertIn("3 files, 1 failed", out.getvalue())
+        self.assertEqual(err.getvalue(), "Failed b.po: Connection refused\n")
+
+        with tempfile.TemporaryDirectory() as directory:
+            pofile = Path(directory) / "de" / "LC_MESSAGES" / "django.po"
+            pofile.parent.mkdir(parents=True)
+            pofile.write_text(POFILE)
+            project = {"url": "http://localhost/api/test/"}
+            session = Mock()
+
+            session.get.side_effect = requests.ConnectionError("Connection refused")
+            with self.assertRaisesRegex(click.ClickException, "Connection refused"):
+                trd._get_bulk(project, session, [pofile], {}, transfer)
+
+            session.get.side_effect = None
+            session.get.return_value = Mock(
+                ok=True, content=b"Not a zip file", headers={}
+            )
+            with self.assertRaisesRegex(click.ClickException, "Invalid archive"):
+                trd._get_bulk(project, session, [pofile], {}, transfer)
+
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w") as archive:
+                archive.writestr("de/django.po", "Updated")
+                archive.writestr(trd.ARCHIVE_INDEX, "{}")
+            session.get.return_value.content = buffer.getvalue()
+            manifest = {}
+            with (
+                patch.object(trd, "_store_base"),
+                redirect_stdout(io.StringIO()) as out,
+            ):
+                failed = trd._get_bulk(project, session, [pofile], manifest, transfer)
+            self.assertEqual(failed, 0)
+            self.assertEqual(out.getvalue().splitlines()[0], f"Updated {pofile}")
+            self.assertEqual(pofile.read_text(), "Updated")
+            self.assertIsNone(manifest[str(pofile)]["revision"])
+
+    def test_po_entries(self):
+        header, entries = trd._po_entries(ENTRIES)
+        self.assertEqual(header[1], [["msgid", ""], ["msgstr", "Language: de\n"]])
+        self.assertEqual(
+            list(entries),
+            [("menu", "Open"), (None, "Open"), (None, "%(count)s file"), (None, "Old")],
+        )
+        self.assertEqual(
+            entries["menu", "Open"][1],
+            [
+                ["#:", "app/menu.py:1 app/menu.py:2"],
+                ["msgctxt", "menu"],
+                ["msgid", "Open"],
+                ["msgstr", "Öffnen"],
+            ],
+        )
+        self.assertEqual(
+            entries[None, "%(count)s file"][1][1:],
+            [
+                ["msgid_plural", "%(count)s files"],
+                ["msgstr[0]", "%(count)s Datei"],
+                ["msgstr[1]", "%(count)s Dateien"],
+            ],
+        )
+        self.assertEqual(
+            entries[None, "Old"][1],
+            [["#~", ""], ["msgid", "Old"], ["msgstr", "Alt"]],
+        )
+
+    def test_diff(self):
+        # Wrapping doesn't matter
+        wrapped = ENTRIES.replace('msgstr "Offen"', 'msgstr ""\n"Of"\n"fen"').replace(
+            "#: app/menu.py:1\n#: app/menu.py:2", "#: app/menu.py:1 app/menu.py:2"
+        )
+        self.assertEqual(
+            trd._diff(ENTRIES, wrapped),
+            {"added": "", "changed": "", "removed": [], "base": ""},
+        )
+
+        content = (
+            ENTRIES
+            .replace('msgstr[1] "%(count)s Dateien"', 'msgstr[1] ""')
+            .replace('msgid "Open"\nmsgstr "Offen"\n\n', "")
+            .replace('#~ msgid "Old"\n#~ msgstr "Alt"', 'msgid "Old"\nmsgstr "Alt"')
+            .replace('msgstr "Öffnen"', 'msgstr "Aufmachen"')
+            + '\nmsgctxt "menu"\nmsgid "Close"\nmsgstr ""\n'
+        )
+        patch = trd._diff(ENTRIES, content)
+        self.assertEqual(patch["added"], 'msgctxt "menu"\nmsgid "Close"\nmsgstr ""')
+        _header, changed = trd._po_entries(patch["changed"])
+        self.assertEqual(
+            list(changed), [("menu", "Open"), (None, "%(count)s file"), (None, "Old")]
+        )
+        self.assertEqual(patch["removed"], [[None, "Open"]])
+        _header, base = trd._po_entries(patch["base"])
+        self.assertEqual(
+            list(base),
+            [("menu", "Open"), (None, "%(count)s file"), (None, "Old"), (None, "Open")],
+        )
+        self.assertNotIn("header", patch)
+
+        content = ENTRIES.replace(
+            '"Language: de\\n"', '"Language: de\\n"\n"Plural-Forms: nplurals=2;\\n"'
+        )
+        self.assertIn("Plural-Forms", trd._diff(ENTRIES, content)["header"])
+
+    def test_patch(self):
+        content = ENTRIES.encode("utf-8")
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(patch.object(trd, "_cache_dir", return_value=Path(directory)))
+        record = {"submitted": trd._sha256(content), "method": "GET"}
+        # The base is unknown
+        self.assertIsNone(trd._patch(content, record, method="PUT"))
+
+        trd._store_base(content)
+        changed = content.replace(b'msgstr "Offen"', b'msgstr "Auf"')
+        self.assertEqual(
+            json.loads(trd._patch(changed, record, method="POST"))["changed"],
+            'msgid "Open"\nmsgstr "Auf"',
+        )
+
+        # Submitting sends the pofile if it's smaller than the patch
+        small = b'msgid "Open"\nmsgstr ""\n'
+        self.assertIsNone(trd._patch(small, record, method="POST"))
+        self.assertEqual(
+            len(json.loads(trd._patch(small, record, method="PUT"))["removed"]),
+            3,
+        )
+
+    def test_ignore(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "sub").mkdir()
+            (root / ".gitignore").write_text(
+                "# Comment\n\n*.po\n!keep.po\nbuild/\n/static/vendor\n"
+            )
+            (root / "sub" / ".gitignore").write_text("**/local\n")
+
+            ignore = trd._Ignore()
+            stamps = ignore.load(root)
+            self.assertEqual(list(stamps), [str(root / ".gitignore")])
+            self.assertEqual(ignore.load(root / "missing"), {})
+            ignore.load(root / "sub")
+
+            self.assertTrue(ignore.ignored(root / "sub" / "de.po", is_dir=False))
+            self.assertFalse(ignore.ignored(root / "sub" / "keep.po", is_dir=False))
+            # Directory-only patterns
+            self.assertTrue(ignore.ignored(root / "sub" / "build", is_dir=True))
+            self.assertFalse(ignore.ignored(root / "sub" / "build", is_dir=False))
+            # Anchored patterns only match relative to their .gitignore
+            self.assertTrue(ignore.ignored(root / "static" / "vendor", is_dir=True))
+            self.assertFalse(
+                ignore.ignored(root / "sub" / "static" / "vendor", is_dir=True)
+            )
+            # Rules only apply below their directory
+            self.assertTrue(ignore.ignored(root / "sub" / "local", is_dir=True))
+            self.assertFalse(ignore.ignored(root / "local", is_dir=True))
+
+    def test_session(self):
+        session = trd._session({"token": "secret"})
+        request = session.prepare_request(
+            requests.Request("GET", "http://localhost/api/pofile/test/de/django/")
+        )
+        self.assertIn("gzip", request.headers["accept-encoding"])
+        self.assertEqual(request.headers["x-token"], "secret")
+        self.assertEqual(request.headers["x-cli-api"], trd.CLI_API)
+
+    def test_timings_json_to_stdout(self):
+        @click.command()
+        @trd.timings_options
+        def command(show_timings, timings_json):
+            click.echo("Unchanged de.po")
+            trd.Timings("command", show=show_timings, json_file=timings_json).report()
+
+        result = CliRunner().invoke(command, ["--timings", "--timings-json", "-"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(json.loads(result.stdout)["command"], "command")
+        self.assertIn("Unchanged de.po\nTimings of command", result.stderr)
+
+    def test_api_errors(self):
+        session = Mock()
+        session.request.side_effect = requests.ConnectionError("Connection refused")
+        project = {"url": "http://localhost/api/pofile/test/", "token": "secret"}
+        with (
+            patch.object(trd, "current_project", return_value=project),
+            patch.object(trd, "load_manifest", return_value={}),
+            patch.object(
+                trd, "find_pofiles", return_value=[Path("de/LC_MESSAGES/django.po")]
+            ),
+            patch.object(trd, "_session", return_value=session),
+        ):
+            result = CliRunner().invoke(trd.status, ["."])
+            self.assertEqual(result.exit_code, 1)
+            self.assertEqual(result.stderr, "Error: Failed: Connection refused\n")
+
+            result = CliRunner().invoke(trd.pretranslate, ["."])
+            self.assertEqual(result.exit_code, 1)
+            self.assertEqual(
+                result.stderr,
+                "Error: Failed to pre-translate de/LC_MESSAGES/django.po:"
+                " Connection refused\n",
+            )
+
+            session.request.side_effect = None
+            session.request.return_value = Mock(
+                ok=False, status_code=403, reason="Forbidden", text=""
+            )
+            result = CliRunner().invoke(trd.status, ["."])
+            self.assertEqual(result.stderr, "Error: Failed: 403 Forbidden\n")
+
+    def test_watcher_fallback(self):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        with patch("ctypes.CDLL", side_effect=AttributeError("inotify_init1")):
+            watcher = trd._watcher([directory], [])
+        self.assertIsInstance(watcher, trd._PollWatcher)
+        watcher.close()
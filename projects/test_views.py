@@ -1,21 +1,51 @@
-from unittest.mock import AsyncMock, patch
-
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import time
+import zipfile
+from unittest.mock import ANY, AsyncMock, patch
+from urllib.parse import parse_qs
+
+import httpx
+import polib
 from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.messages import get_messages
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import AsyncClient, Client, TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
 
 from accounts.models import User
-from projects.models import Catalog, Event, Project
+from projects import pretranslation, similarity, translators
+from projects.caching import LRUCache
+from projects.models import (
+    Catalog,
+    CatalogEntry,
+    Event,
+    PretranslationJob,
+    Project,
+    TranslationMemory,
+    TranslationUsage,
+    po_cache,
+)
+from projects.similarity import SimilarityIndex
 from projects.translators import (
+    DEEPL_BATCH_SIZE,
     TranslationError,
     _protect_variables,
     _restore_variables,
     _variable_name,
+    deepl_breaker,
     find_variables,
     fix_nls,
+    translate_many_by_deepl,
 )
+from projects.views import csv_cache
 
 
 def messages(response):
@@ -129,6 +159,32 @@ msgstr[1] "Réinitialisation des mots de passe de %(count)s élèves ."
         )
         self.assertNotContains(r, "msgid_0")
 
+        # Case-insensitive search in the translation
+        r = su_client.get(
+            c.get_absolute_url() + "?query=COPIÉ", headers={"accept-language": "en"}
+        )
+        self.assertContains(
+            r,
+            '<input type="hidden" name="msgid_0" value="Copied code!" id="id_msgid_0">',
+        )
+        self.assertNotContains(r, "msgid_1")
+
+        r = su_client.get(
+            c.get_absolute_url() + "?query=COPIÉ&search=msgid",
+            headers={"accept-language": "en"},
+        )
+        self.assertNotContains(r, "msgid_0")
+
+        r = su_client.get(
+            c.get_absolute_url() + "?query=people/person.js&search=occurrences",
+            headers={"accept-language": "en"},
+        )
+        self.assertContains(
+            r,
+            '<input type="hidden" name="msgid_0" value="Continue" id="id_msgid_0">',
+        )
+        self.assertNotContains(r, "msgid_1")
+
         r = su_client.get(
             c.get_absolute_url() + "?start=a", headers={"accept-language": "en"}
         )
@@ -167,6 +223,51 @@ msgstr[1] "Réinitialisation des mots de passe de %(count)s élèves ."
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.content.decode("utf-8"), c.pofile)
 
+        # Conditional requests
+        etag = f'"{hashlib.sha256(r.content).hexdigest()}"'
+        self.assertEqual(r.headers["etag"], etag)
+        self.assertEqual(Catalog.objects.get(pk=c.pk).content_hash, etag[1:-1])
+
+        with CaptureQueriesContext(connection) as ctx:
+            r = su_client.get(
+                "/api/pofile/test/fr/djangojs/",
+                headers={
+                    "x-token": superuser.token,
+                    "x-cli-api": settings.CLI_API,
+                    "if-none-match": etag,
+                },
+            )
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r.headers["etag"], etag)
+        self.assertEqual(r.content, b"")
+        # Neither the entries nor the stored pofile are loaded
+        self.assertFalse(
+            any(
+                "entry" in q["sql"] or "compressed_pofile" in q["sql"]
+                for q in ctx.captured_queries
+            )
+        )
+
+        r = su_client.get(
+            "/api/pofile/test/fr/djangojs/",
+            headers={
+                "x-token": superuser.token,
+                "x-cli-api": settings.CLI_API,
+                "if-modified-since": r.headers["last-modified"],
+            },
+        )
+        self.assertEqual(r.status_code, 304)
+
+        r = su_client.get(
+            "/api/pofile/test/fr/djangojs/",
+            headers={
+                "x-token": superuser.token,
+                "x-cli-api": settings.CLI_API,
+                "if-none-match": '"outdated"',
+            },
+        )
+        self.assertEqual(r.status_code, 200)
+
         r = su_client.patch(
             "/api/pofile/test/fr/djangojs/",
             headers={"x-token": superuser.token, "x-cli-api": settings.CLI_API},
@@ -215,6 +316,19 @@ msgstr ""
             c.pofile,
         )
 
+        # The submission changed the catalog
+        self.assertNotEqual(f'"{c.content_hash}"', etag)
+        r = su_client.get(
+            "/api/pofile/test/fr/djangojs/",
+            headers={
+                "x-token": superuser.token,
+                "x-cli-api": settings.CLI_API,
+                "if-none-match": etag,
+            },
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content.decode("utf-8"), c.pofile)
+
         # Different language!
         r = su_client.put(
             "/api/pofile/test/de/djangojs/",
@@ -265,6 +379,458 @@ msgstr "Blab"
         )
         self.assertEqual(r.status_code, 404)
 
+    def test_compression(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        su_client = Client()
+        su_client.force_login(superuser)
+        headers = {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+
+        _p, c = self.create_project_and_catalog()
+        pofile = c.pofile
+
+        r = su_client.get(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "accept-encoding": "gzip, deflate"},
+        )
+        self.assertEqual(r.headers["content-encoding"], "gzip")
+        self.assertIn("Accept-Encoding", r.headers["vary"])
+        self.assertEqual(gzip.decompress(r.content).decode("utf-8"), pofile)
+
+        # Compressed uploads
+        r = su_client.post(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "content-encoding": "gzip"},
+            data=gzip.compress(b'msgid "Continue"\nmsgstr ""\n'),
+            content_type="text/plain",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "obsolete")),
+            [
+                ("Continue", False),
+                ("Copied code!", True),
+                ("Successfully reset the password of %(count)s student.", True),
+            ],
+        )
+        self.assertIn("last-modified", r.headers)
+
+        # Submitting the same pofile again doesn't log an event
+        events = Event.objects.count()
+        r = su_client.post(
+            "/api/pofile/test/fr/djangojs/",
+            headers=headers,
+            data=b'msgid "Continue"\nmsgstr ""\n',
+            content_type="text/plain",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(Event.objects.count(), events)
+
+        r = su_client.post(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "content-encoding": "gzip"},
+            data=b'msgid "Continue"\nmsgstr ""\n',
+            content_type="text/plain",
+        )
+        self.assertEqual(r.status_code, 400)
+
+        r = su_client.post(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "content-encoding": "br"},
+            data=b"",
+            content_type="text/plain",
+        )
+        self.assertContains(r, "Unsupported content encoding 'br'", status_code=400)
+
+        r = su_client.post(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "content-encoding": "gzip"},
+            data=gzip.compress(b'msgid "Continue"\nmsgstr ""\n')[:-10],
+            content_type="text/plain",
+        )
+        self.assertContains(r, "truncated", status_code=400)
+
+        # The decompressed size is limited as well
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100_000):
+            r = su_client.post(
+                "/api/pofile/test/fr/djangojs/",
+                headers={**headers, "content-encoding": "gzip"},
+                data=gzip.compress(b"#" * 1_000_000),
+                content_type="text/plain",
+            )
+        self.assertEqual(r.status_code, 413)
+
+        r = su_client.get(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "accept-encoding": "gzip;q=0, deflate"},
+        )
+        self.assertNotIn("content-encoding", r.headers)
+        self.assertEqual(r.content.decode("utf-8"), c.pofile)
+        r = su_client.get(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "accept-encoding": "identity, *;q=0.5"},
+        )
+        self.assertEqual(r.headers["content-encoding"], "gzip")
+
+        # The CSV export is compressed and cached until a catalog changes
+        csv_cache.clear()
+        r = su_client.get("/test/messages.csv", headers={"accept-encoding": "gzip"})
+        self.assertEqual(r.headers["content-encoding"], "gzip")
+        self.assertIn(b",Continue,", gzip.decompress(r.content))
+
+        r = su_client.get("/test/messages.csv")
+        self.assertContains(r, ",Continue,")
+        self.assertEqual(csv_cache.info()[:2], (1, 1))
+
+        c.delete()
+        r = su_client.get("/test/messages.csv")
+        self.assertNotContains(r, ",Continue,")
+
+    def test_patch_api(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        su_client = Client()
+        su_client.force_login(superuser)
+        headers = {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+
+        _p, c = self.create_project_and_catalog()
+        r = su_client.get("/api/pofile/test/fr/djangojs/", headers=headers)
+        self.assertEqual(r["x-revision"], str(c.revision))
+        delta = {
+            "added": 'msgid "Back"\nmsgstr ""',
+            "changed": '#: conf/strings.js\nmsgid "Continue"\nmsgstr ""',
+            "removed": [[None, "Copied code!"]],
+        }
+
+        # Patches need an existing catalog
+        r = su_client.post(
+            "/api/pofile/test/fr/nothing/",
+            headers=headers,
+            data=json.dumps(delta),
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 412)
+
+        # Submitting merges the patch like a complete pofile, whatever the base
+        r = su_client.post(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "x-base-revision": "0", "content-encoding": "gzip"},
+            data=gzip.compress(json.dumps(delta).encode()),
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 202)
+        c.refresh_from_db()
+        self.assertEqual(r["x-revision"], str(c.revision))
+        # The pofile is only rendered when it's downloaded next
+        self.assertNotIn("etag", r.headers)
+        self.assertEqual(c.content_hash, "")
+        r = su_client.get("/api/pofile/test/fr/djangojs/", headers=headers)
+        c.refresh_from_db()
+        self.assertEqual(r["etag"], f'"{c.content_hash}"')
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "msgstr", "obsolete", "occurrences")),
+            [
+                ("Continue", "Continuer", False, [["conf/strings.js", ""]]),
+                ("Copied code!", "Code copié !", True, [["conf/strings.js", ""]]),
+                (
+                    "Successfully reset the password of %(count)s student.",
+                    "",
+                    False,
+                    [["fmw/dashboard/classes/forms.py", ""]],
+                ),
+                ("Back", "", False, []),
+            ],
+        )
+        self.assertEqual(Event.objects.latest("pk").action, "catalog-updated")
+
+        # Replacing applies it as-is
+        delta = {
+            "header": 'msgid ""\nmsgstr ""\n"Language: fr\\n"',
+            "added": "",
+            "changed": 'msgid "Continue"\nmsgstr "Continuez"',
+            "removed": [[None, "Copied code!"], ["menu", "Back"]],
+        }
+        r = su_client.put(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "x-base-revision": r["x-revision"]},
+            data=json.dumps(delta),
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 202)
+        c.refresh_from_db()
+        self.assertEqual(c.metadata, {"Language": "fr"})
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "msgstr", "occurrences")),
+            [
+                ("Continue", "Continuez", []),
+                ("Successfully reset the password of %(count)s student.", "", ANY),
+                ("Back", "", []),
+            ],
+        )
+        self.assertEqual(
+            (c.total_count, c.translated_count, c.obsolete_count), (3, 2, 0)
+        )
+        self.assertEqual(Event.objects.latest("pk").action, "catalog-replaced")
+
+        # Somebody else translates a message in the meantime
+        base_revision = r["x-revision"]
+        entry = c.entries.get(msgid="Continue")
+        entry.msgstr = "Continuons"
+        entry.save()
+        c.save()
+        self.assertEqual(c.revision, int(base_revision) + 1)
+
+        # Replacing the same message conflicts and changes nothing
+        r = su_client.put(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "x-base-revision": base_revision},
+            data=json.dumps({
+                "changed": 'msgid "Continue"\nmsgstr "Weiter"\n\n'
+                'msgid "Back"\nmsgstr "Retour"',
+                "removed": [],
+                "base": 'msgid "Continue"\nmsgstr "Continuez"\n\n'
+                'msgid "Back"\nmsgstr ""',
+            }),
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 409)
+        self.assertEqual(r.json(), {"conflicts": [[None, "Continue"]]})
+        self.assertEqual(c.entries.get(msgid="Back").msgstr, "")
+
+        # Other messages are merged
+        r = su_client.put(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "x-base-revision": base_revision},
+            data=json.dumps({
+                "changed": 'msgid "Back"\nmsgstr "Retour"',
+                "removed": [],
+                "base": 'msgid "Back"\nmsgstr ""',
+            }),
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(
+            dict(c.entries.values_list("msgid", "msgstr")),
+            {
+                "Continue": "Continuons",
+                "Successfully reset the password of %(count)s student.": "",
+                "Back": "Retour",
+            },
+        )
+
+        # Complete pofiles can only replace the base revision
+        r = su_client.put(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "x-base-revision": base_revision},
+            data=b'msgid "Continue"\nmsgstr "Weiter"\n',
+            content_type="text/plain",
+        )
+        self.assertEqual(r.status_code, 409)
+        r = su_client.put(
+            "/api/pofile/test/fr/djangojs/",
+            headers=headers,
+            data=b'msgid "Continue"\nmsgstr "Weiter"\n',
+            content_type="text/plain",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(c.entries.get().msgstr, "Weiter")
+
+        r = su_client.put(
+            "/api/pofile/test/fr/djangojs/",
+            headers=headers,
+            data=b"{}",
+            content_type="application/json",
+        )
+        self.assertContains(r, "Invalid patch: 'removed'", status_code=400)
+        r = su_client.put(
+            "/api/pofile/test/fr/djangojs/",
+            headers={**headers, "x-base-revision": "latest"},
+            data=b"",
+            content_type="text/plain",
+        )
+        self.assertEqual(r.status_code, 400)
+
+    def test_bulk_api(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        client = Client()
+        headers = {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+
+        _p, c = self.create_project_and_catalog()
+
+        r = client.get("/api/pofile/test/", headers=headers)
+        with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+            self.assertEqual(
+                archive.namelist(),
+                ["fr/djangojs.po", "catalogs.json", "revisions.json"],
+            )
+            self.assertEqual(archive.read("fr/djangojs.po").decode(), c.pofile)
+            index = json.loads(archive.read("catalogs.json"))
+            revisions = json.loads(archive.read("revisions.json"))
+        c.refresh_from_db()
+        self.assertEqual(index, {"fr/djangojs.po": c.content_hash})
+        self.assertEqual(revisions, {"fr/djangojs.po": c.revision})
+
+        # Known catalogs aren't sent again
+        r = client.get(
+            "/api/pofile/test/",
+            headers={**headers, "if-none-match": f'"{c.content_hash}"'},
+        )
+        with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+            self.assertEqual(archive.namelist(), ["catalogs.json", "revisions.json"])
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("fr/djangojs.po", 'msgid "Continue"\nmsgstr ""\n')
+            archive.writestr("de/django.po", 'msgid "Hello"\nmsgstr "Hallo"\n')
+        r = client.post(
+            "/api/pofile/test/",
+            headers=headers,
+            data=buffer.getvalue(),
+            content_type="application/zip",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(
+            {name: result["changed"] for name, result in r.json().items()},
+            {"fr/djangojs.po": True, "de/django.po": True},
+        )
+        self.assertEqual(
+            list(Event.objects.values_list("action", flat=True)[:2]),
+            ["catalog-created", "catalog-updated"],
+        )
+        self.assertEqual(
+            list(c.entries.filter(obsolete=False).values_list("msgid", "msgstr")),
+            [("Continue", "Continuer")],
+        )
+
+        r = client.put(
+            "/api/pofile/test/",
+            headers=headers,
+            data=buffer.getvalue(),
+            content_type="application/zip",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "msgstr")), [("Continue", "")]
+        )
+        revisions = {name: result["revision"] for name, result in r.json().items()}
+
+        # Replacing catalogs changed since the base revisions fails for all
+        c.refresh_from_db()
+        c.entries.update(msgstr="Continuez")
+        c.save()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("fr/djangojs.po", 'msgid "Continue"\nmsgstr "Weiter"\n')
+            archive.writestr("de/django.po", 'msgid "Hello"\nmsgstr "Servus"\n')
+            archive.writestr("revisions.json", json.dumps(revisions))
+        r = client.put(
+            "/api/pofile/test/",
+            headers=headers,
+            data=buffer.getvalue(),
+            content_type="application/zip",
+        )
+        self.assertEqual(r.status_code, 409)
+        self.assertEqual(r.json(), {"conflicts": ["fr/djangojs.po"]})
+        self.assertEqual(
+            list(CatalogEntry.objects.order_by("msgid").values_list("msgid", "msgstr")),
+            [("Continue", "Continuez"), ("Hello", "Hallo")],
+        )
+
+        c.refresh_from_db()
+        revisions["fr/djangojs.po"] = c.revision
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("fr/djangojs.po", 'msgid "Continue"\nmsgstr "Weiter"\n')
+            archive.writestr("revisions.json", json.dumps(revisions))
+        r = client.put(
+            "/api/pofile/test/",
+            headers=headers,
+            data=buffer.getvalue(),
+            content_type="application/zip",
+        )
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(list(r.json()), ["fr/djangojs.po"])
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("fr/djangojs.po", 'msgid "Continue"\nmsgstr "Bla"\n')
+            archive.writestr("django.po", 'msgid "Hello"\nmsgstr ""\n')
+        r = client.post(
+            "/api/pofile/test/",
+            headers=headers,
+            data=buffer.getvalue(),
+            content_type="application/zip",
+        )
+        self.assertContains(r, "Unexpected archive member 'django.po'", status_code=400)
+
+        r = client.post(
+            "/api/pofile/test/",
+            headers=headers,
+            data=b"not a zip file",
+            content_type="application/zip",
+        )
+        self.assertEqual(r.status_code, 400)
+
+        # Archives may be gzipped like single pofiles, but their decompressed
+        # size is limited as well
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("fr/djangojs.po", 'msgid "Continue"\nmsgstr "Bla"\n')
+            archive.writestr("de/django.po", "#" * 1_000_000)
+        r = client.post(
+            "/api/pofile/test/",
+            headers={**headers, "content-encoding": "gzip"},
+            data=gzip.compress(buffer.getvalue()),
+            content_type="application/zip",
+        )
+        self.assertEqual(r.status_code, 202)
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100_000):
+            r = client.post(
+                "/api/pofile/test/",
+                headers=headers,
+                data=buffer.getvalue(),
+                content_type="application/zip",
+            )
+        self.assertEqual(r.status_code, 413)
+
+    def test_status_api(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        client = Client()
+        headers = {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+
+        _p, c = self.create_project_and_catalog()
+
+        with self.assertNumQueries(5):
+            r = client.get("/api/pofile/test/status/", headers=headers)
+        c.refresh_from_db()
+        self.assertEqual(
+            r.json(),
+            {
+                "catalogs": {
+                    "fr/djangojs.po": {
+                        "hash": c.content_hash,
+                        "last_modified": http_date(c.updated_at.timestamp()),
+                        "revision": c.revision,
+                        "total": 3,
+                        "translated": 3,
+                        "fuzzy": 0,
+                        "untranslated": 0,
+                        "obsolete": 0,
+                    }
+                }
+            },
+        )
+
+        self.assertRegex(
+            r["server-timing"],
+            r"^auth;dur=[0-9.]+, view;dur=[0-9.]+, db;dur=[0-9.]+$",
+        )
+
+        # The stored hash is reused
+        with self.assertNumQueries(3):
+            client.get("/api/pofile/test/status/", headers=headers)
+
+        r = client.get("/api/pofile/test/status/", headers={"x-token": "invalid"})
+        self.assertEqual(r.status_code, 400)
+
     def test_updating(self):
         superuser = User.objects.create_superuser("admin@example.com", "admin")
         su_client = Client()
@@ -278,6 +844,7 @@ msgstr "Blab"
                 headers={"accept-language": "en"},
             )
             self.assertContains(r, "data-suggest")
+            self.assertContains(r, "data-suggest-all")
 
         with override_settings(DEEPL_AUTH_KEY=""):
             r = su_client.get(
@@ -392,6 +959,104 @@ msgstr[1] "Blab %(count)s"
         # print(list(c.po))
         # print(r, r.content.decode("utf-8"))
 
+    def test_update_scales_with_page_size(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        su_client = Client()
+        su_client.force_login(superuser)
+
+        p = Project.objects.create(name="scale", slug="scale")
+        queries = []
+        for size in [50, 500]:
+            c = p.catalogs.create(
+                language_code="fr",
+                domain=f"size{size}",
+                pofile="".join(
+                    f'msgid "Message {i}"\nmsgstr ""\n\n' for i in range(size)
+                ),
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                r = su_client.post(
+                    c.get_absolute_url(),
+                    {
+                        "msgid_0": "Message 0",
+                        "msgstr_0": "Message zéro",
+                        "msgid_1": "Message 30",  # Not on the first page
+                        "msgstr_1": "Message trente",
+                    },
+                    headers={"accept-language": "en"},
+                )
+            self.assertRedirects(r, c.get_absolute_url() + "?start=0")
+            queries.append(len(ctx))
+
+            self.assertEqual(
+                list(c.entries.filter(translated=True).values_list("msgstr")),
+                [("Message zéro",), ("Message trente",)],
+            )
+
+        self.assertEqual(queries[0], queries[1])
+
+    def test_concurrent_updates(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        su_client = Client()
+        su_client.force_login(superuser)
+
+        _p, c = self.create_project_and_catalog()
+        revision = c.revision
+        r = su_client.get(c.get_absolute_url(), headers={"accept-language": "en"})
+        self.assertContains(r, f'name="revision" value="{revision}"')
+        self.assertContains(r, 'name="initial-msgstr_0" value="Continuer"')
+
+        # Somebody else changes a translation after the form has been rendered
+        entry = c.entries.get(msgid="Copied code!")
+        entry.msgstr = "Copié !"
+        entry.save()
+        c.save()
+
+        data = {
+            "revision": revision,
+            "msgid_0": "Continue",
+            "msgstr_0": "Continuez",
+            "initial-msgstr_0": "Continuer",
+            "initial-fuzzy_0": "False",
+            "msgid_1": "Copied code!",
+            "msgstr_1": "Code copié !",
+            "initial-msgstr_1": "Code copié !",
+            "initial-fuzzy_1": "False",
+        }
+        r = su_client.post(
+            c.get_absolute_url(), data, headers={"accept-language": "en"}
+        )
+        self.assertRedirects(
+            r, c.get_absolute_url() + "?start=0", fetch_redirect_response=False
+        )
+        self.assertEqual(messages(r), ["Successfully updated 1 message."])
+        self.assertEqual(
+            dict(c.entries.values_list("msgid", "msgstr")[:2]),
+            {"Continue": "Continuez", "Copied code!": "Copié !"},
+        )
+
+        # Translations which haven't been edited are kept, changing the same
+        # translation conflicts
+        r = su_client.post(
+            c.get_absolute_url(),
+            {**data, "msgstr_0": "Continuer", "msgstr_1": "Code copié !!"},
+            headers={"accept-language": "en"},
+        )
+        self.assertEqual(
+            messages(r),
+            [
+                "Successfully updated 1 message.",
+                (
+                    "1 message has been changed by somebody else in the meantime,"
+                    " your change hasn't been saved: Copied code!"
+                ),
+            ],
+        )
+        self.assertEqual(
+            dict(c.entries.values_list("msgid", "msgstr")[:2]),
+            {"Continue": "Continuez", "Copied code!": "Copié !"},
+        )
+
     def test_admin(self):
         superuser = User.objects.create_superuser("admin@example.com", "admin")
         su_client = Client()
@@ -411,6 +1076,16 @@ msgstr[1] "Blab %(count)s"
             r, '<td class="field-explicit_users"> &lt;user@example.com&gt;</td>'
         )
 
+        TranslationMemory.objects.create(
+            key="a", target_language="fr", source="Save", translation="Enregistrer"
+        )
+        TranslationMemory.objects.create(
+            key="b", target_language="fr", source="Yes", translation="Oui", hits=3
+        )
+        with override_settings(DEBUG=True):
+            r = su_client.get("/admin/projects/translationmemory/")
+        self.assertContains(r, "<h2>2 entries, 3 hits, hit rate 60%</h2>")
+
     async def test_suggest(self):
         c = AsyncClient()
 
@@ -445,9 +1120,713 @@ msgstr[1] "Blab %(count)s"
             self.assertEqual(r.status_code, 200)
             self.assertEqual(r.json(), {"error": "Oops"})
 
+    async def test_suggest_all(self):
+        c = AsyncClient()
+        r = await c.post("/api/suggest/all/")
+        self.assertEqual(r.status_code, 403)
+
+        user = await sync_to_async(User.objects.create_user)("user@example.com", "user")
+        await c.aforce_login(user)
+
+        r = await c.post("/api/suggest/all/", {"language_code": "fr"})
+        self.assertEqual(r.status_code, 400)
+        r = await c.post(
+            "/api/suggest/all/", {"language_code": "fr", "msgid": ["Hello", ""]}
+        )
+        self.assertEqual(r.status_code, 400)
+
+        mock = AsyncMock(return_value=["Bonjour", "Monde"])
+        with patch("projects.views.translators.translate_many_by_deepl", mock):
+            r = await c.post(
+                "/api/suggest/all/",
+                {"language_code": "fr", "msgid": ["Hello", "World", "Hello"]},
+            )
+        self.assertEqual(r.json(), {"msgstrs": ["Bonjour", "Monde", "Bonjour"]})
+        # Duplicates are only translated once
+        mock.assert_awaited_once_with(["Hello", "World"], "fr", ANY, user=user)
+
+        mock = AsyncMock(side_effect=TranslationError("Oops"))
+        with patch("projects.views.translators.translate_many_by_deepl", mock):
+            r = await c.post(
+                "/api/suggest/all/", {"language_code": "fr", "msgid": ["Hello"]}
+            )
+        self.assertEqual(r.json(), {"error": "Oops"})
+
+    async def test_translate_many_by_deepl(self):
+        requests = []
+
+        def handler(request):
+            data = parse_qs(request.content.decode())
+            requests.append(data)
+            return httpx.Response(
+                200,
+                json={
+                    "translations": [{"text": f"fr: {text}"} for text in data["text"]]
+                },
+            )
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        texts = [f"message %(count)s {i}" for i in range(60)]
+        with patch("projects.translators._client", return_value=client):
+            translations = await translate_many_by_deepl(texts, "fr", "key:fx")
+
+        self.assertEqual(translations[59], "fr: message %(count)s 59")
+        self.assertEqual(
+            [len(request["text"]) for request in requests], [DEEPL_BATCH_SIZE, 10]
+        )
+        self.assertEqual(requests[0]["target_lang"], ["FR"])
+        self.assertEqual(requests[0]["text"][0], 'message <var id="0">count</var> 0')
+
+        # Translations are remembered across projects and users
+        requests.clear()
+        with patch("projects.translators._client", return_value=client):
+            translations = await translate_many_by_deepl(
+                ["message %(count)s 3", "Save"], "FR", "key:fx"
+            )
+            await translate_many_by_deepl(["Save"], "de", "key:fx")
+        self.assertEqual(translations, ["fr: message %(count)s 3", "fr: Save"])
+        self.assertEqual([request["text"] for request in requests], [["Save"]] * 2)
+
+        stats = await sync_to_async(TranslationMemory.objects.stats)()
+        self.assertEqual(stats, {"entries": 62, "hits": 1, "hit_rate": 1 / 63})
+
+        # The least recently used translations are removed first
+        with override_settings(TRANSLATION_MEMORY_SIZE=3):
+            await sync_to_async(TranslationMemory.objects.prune)()
+        self.assertEqual(
+            {entry.source async for entry in TranslationMemory.objects.all()},
+            {"message %(count)s 3", "Save"},
+        )
+
+        with override_settings(TRANSLATION_MEMORY_DAYS=0):
+            await sync_to_async(TranslationMemory.objects.prune)()
+        self.assertEqual(await TranslationMemory.objects.acount(), 0)
+
+        # Writes only prune the memory once per interval
+        now = time.monotonic()
+        with (
+            override_settings(TRANSLATION_MEMORY_SIZE=1),
+            patch("projects.translators._client", return_value=client),
+            patch.dict("projects.translators._memory", pruned_at=now),
+        ):
+            await translate_many_by_deepl(["One", "Two"], "fr", "key:fx")
+            self.assertEqual(await TranslationMemory.objects.acount(), 2)
+            translators._memory["pruned_at"] -= translators.MEMORY_PRUNE_INTERVAL
+            await translate_many_by_deepl(["Three"], "fr", "key:fx")
+            self.assertEqual(await TranslationMemory.objects.acount(), 1)
+            self.assertGreater(translators._memory["pruned_at"], now)
+
+    async def test_deepl_protections(self):
+        self.addCleanup(deepl_breaker.reset)
+        user = await sync_to_async(User.objects.create_user)("user@example.com", "user")
+        requests = []
+        timeout = False
+        status = 200
+
+        async def handler(request):
+            data = parse_qs(request.content.decode())
+            requests.append(data["text"])
+            await asyncio.sleep(0.01)
+            if timeout:
+                raise httpx.ReadTimeout("Timeout", request=request)
+            if status != 200:
+                return httpx.Response(status)
+            return httpx.Response(
+                200,
+                json={
+                    "translations": [{"text": f"fr: {text}"} for text in data["text"]]
+                },
+            )
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch("projects.translators._client", return_value=client):
+            # Identical texts in flight are only sent once
+            translations = await asyncio.gather(
+                translate_many_by_deepl(["Hello"], "fr", "key", user=user),
+                translate_many_by_deepl(["Hello", "World"], "fr", "key"),
+            )
+            self.assertEqual(translations, [["fr: Hello"], ["fr: Hello", "fr: World"]])
+            self.assertEqual(
+                sorted(text for texts in requests for text in texts), ["Hello", "World"]
+            )
+            usage = TranslationUsage.objects.current()
+            self.assertEqual(await sync_to_async(usage.characters)(), 10)
+
+            # Budgets are checked before sending anything
+            requests.clear()
+            await TranslationUsage.objects.all().adelete()
+            await translate_many_by_deepl(["Goodbye"], "fr", "key", user=user)
+            with override_settings(DEEPL_USER_CHARACTER_BUDGET=10):
+                with self.assertRaisesRegex(TranslationError, "Your machine"):
+                    await translate_many_by_deepl(["Welcome"], "fr", "key", user=user)
+                await translate_many_by_deepl(["Welcome"], "fr", "key")
+            with override_settings(DEEPL_CHARACTER_BUDGET=19):
+                with self.assertRaisesRegex(TranslationError, "The machine"):
+                    await translate_many_by_deepl(["Thanks"], "fr", "key")
+                # Remembered translations are free
+                await translate_many_by_deepl(["Goodbye"], "fr", "key", user=user)
+            # Failed requests don't count
+            status = 456
+            with self.assertRaises(TranslationError):
+                await translate_many_by_deepl(["Thanks"], "fr", "key", user=user)
+            status = 200
+            self.assertEqual(requests, [["Goodbye"], ["Welcome"], ["Thanks"]])
+            self.assertEqual(
+                [
+                    (row.user_id, row.characters)
+                    async for row in TranslationUsage.objects.order_by("pk")
+                ],
+                [(None, 7), (user.pk, 7)],
+            )
+
+            # Requests fail fast after repeated timeouts
+            requests.clear()
+            timeout = True
+            for text in ["One", "Two", "Three", "Four"]:
+                with self.assertRaises(TranslationError):
+                    await translate_many_by_deepl([text], "fr", "key")
+            self.assertEqual(requests, [["One"], ["Two"], ["Three"]])
+
+            # One request is let through after the cooldown
+            requests.clear()
+            deepl_breaker.opened_at -= deepl_breaker.cooldown
+            results = await asyncio.gather(
+                translate_many_by_deepl(["Four"], "fr", "key"),
+                translate_many_by_deepl(["Five"], "fr", "key"),
+                return_exceptions=True,
+            )
+            self.assertEqual(requests, [["Four"]])
+            self.assertIsInstance(results[0], TranslationError)
+            self.assertRegex(str(results[1]), "isn't responding")
+            # The probe timed out and opened the breaker again
+            with self.assertRaisesRegex(TranslationError, "isn't responding"):
+                await translate_many_by_deepl(["Five"], "fr", "key")
+
+            timeout = False
+            deepl_breaker.opened_at -= deepl_breaker.cooldown
+            await translate_many_by_deepl(["Five"], "fr", "key")
+            self.assertEqual(deepl_breaker.timeouts, 0)
+            self.assertIsNone(deepl_breaker.opened_at)
+
+    def test_translation_usage_of_deleted_users(self):
+        user = User.objects.create_user("user@example.com", "user")
+        other = User.objects.create_user("other@example.com", "other")
+        month = timezone.localdate().replace(day=1)
+        TranslationUsage.objects.create(user=None, month=month, characters=3)
+        TranslationUsage.objects.create(user=user, month=month, characters=5)
+        TranslationUsage.objects.create(
+            user=user, month=month.replace(year=month.year - 1), characters=7
+        )
+        TranslationUsage.objects.create(user=other, month=month, characters=11)
+
+        user.delete()
+        self.assertEqual(
+            list(TranslationUsage.objects.values_list("user", "month", "characters")),
+            [
+                (other.pk, month, 11),
+                (None, month, 8),
+                (None, month.replace(year=month.year - 1), 7),
+            ],
+        )
+        # The monthly total doesn't change
+        self.assertEqual(TranslationUsage.objects.current().characters(), 19)
+
+    def test_pretranslation(self):
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        su_client = Client()
+        su_client.force_login(superuser)
+        headers = {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+
+        p = Project.objects.create(name="test", slug="test")
+        c = p.catalogs.create(
+            language_code="de",
+            domain="django",
+            pofile="""\
+msgid "Hello"
+msgstr ""
+
+msgid "Translated"
+msgstr "Übersetzt"
+
+#, fuzzy
+msgid "Fuzzy"
+msgstr ""
+
+msgid "%(count)s file"
+msgid_plural "%(count)s files"
+msgstr[0] ""
+msgstr[1] ""
+
+msgid "Again"
+msgstr ""
+""",
+        )
+        url = c.get_absolute_url()
+
+        with override_settings(DEEPL_AUTH_KEY="key"):
+            r = su_client.get(url)
+            self.assertContains(r, "Pre-translate pending entries")
+
+            with self.captureOnCommitCallbacks() as callbacks:
+                r = su_client.post(f"{url}pretranslate/")
+            self.assertRedirects(r, url, fetch_redirect_response=False)
+            self.assertEqual(len(callbacks), 1)  # Starts the thread
+
+            # Only one job runs at a time
+            r = su_client.post(
+                "/api/pofile/test/de/django/pretranslate/", headers=headers
+            )
+            self.assertEqual(r.status_code, 202)
+            self.assertEqual(
+                r.json(),
+                {
+                    "total": 0,
+                    "done": 0,
+                    "translated": 0,
+                    "finished": False,
+                    "error": "",
+                },
+            )
+            r = su_client.get(url)
+            self.assertContains(r, "0 of 0 messages translated")
+
+        job = c.pretranslation_jobs.get()
+        mock = AsyncMock(
+            side_effect=lambda texts, *args, **kwargs: [f"de: {t}" for t in texts]
+        )
+        with patch("projects.pretranslation.translators.translate_many_by_deepl", mock):
+            pretranslation.run(job)
+        mock.assert_awaited_once_with(
+            ["Hello", "%(count)s file", "%(count)s files", "Again"],
+            "de",
+            ANY,
+            user=superuser,
+        )
+
+        r = su_client.get("/api/pofile/test/de/django/pretranslate/", headers=headers)
+        self.assertEqual(
+            r.json(),
+            {"total": 4, "done": 4, "translated": 3, "finished": True, "error": ""},
+        )
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "msgstr", "msgstr_plural", "fuzzy")),
+            [
+                ("Hello", "de: Hello", {}, True),
+                ("Translated", "Übersetzt", {}, False),
+                ("Fuzzy", "", {}, True),
+                (
+                    "%(count)s file",
+                    "",
+                    {"0": "de: %(count)s file", "1": "de: %(count)s files"},
+                    True,
+                ),
+                ("Again", "de: Again", {}, True),
+            ],
+        )
+        c.refresh_from_db()
+        self.assertEqual(c.fuzzy_count, 4)
+        self.assertEqual(Event.objects.latest("pk").user, superuser)
+
+        # Errors are recorded; there's nothing left to translate anyway
+        job = PretranslationJob.objects.create(catalog=c)
+        job.total = 1
+        mock = AsyncMock(side_effect=TranslationError("Oops"))
+        with patch("projects.pretranslation.translators.translate_many_by_deepl", mock):
+            pretranslation.run(job)
+        self.assertEqual((job.total, job.error), (0, ""))
+
+        c.entries.filter(msgid="Hello").update(msgstr="", fuzzy=False)
+        job = PretranslationJob.objects.create(catalog=c)
+        with patch("projects.pretranslation.translators.translate_many_by_deepl", mock):
+            pretranslation.run(job)
+        self.assertEqual((job.total, job.error), (1, "Oops"))
+        self.assertEqual(c.entries.get(msgid="Hello").msgstr, "")
+
+        r = su_client.post("/api/pofile/test/de/django/pretranslate/", headers=headers)
+        self.assertEqual(r.status_code, 400)
+
+    def test_pretranslate_command(self):
+        p = Project.objects.create(name="test", slug="test")
+        c = p.catalogs.create(
+            language_code="de", domain="django", pofile='msgid "Hello"\nmsgstr ""\n'
+        )
+        with self.assertRaises(CommandError):
+            call_command("pretranslate", "test")
+
+        stdout = io.StringIO()
+        mock = AsyncMock(return_value=["Hallo"])
+        with (
+            override_settings(DEEPL_AUTH_KEY="key"),
+            patch("projects.pretranslation.translators.translate_many_by_deepl", mock),
+        ):
+            with self.assertRaises(CommandError):
+                call_command("pretranslate", "test", language="fr")
+            call_command("pretranslate", "test", stdout=stdout)
+        self.assertIn("Saved 1 entries", stdout.getvalue())
+        self.assertEqual(c.entries.get().msgstr, "Hallo")
+
     def test_invalid_catalog(self):
         c = Catalog(language_code="it", domain="django", pofile="blub")
-        self.assertEqual(str(c), "Italian, django (Invalid)")
+        self.assertEqual(str(c), "Italian, django (100%)")
+        with self.assertRaises(OSError):
+            c.save()
+
+    def test_catalog_stats(self):
+        _p, c = self.create_project_and_catalog()
+        self.assertEqual(
+            (c.total_count, c.translated_count, c.fuzzy_count, c.untranslated_count),
+            (3, 3, 0, 0),
+        )
+
+        c.pofile = """\
+#, fuzzy
+msgid "Fuzzy"
+msgstr "Flou"
+
+msgid "Untranslated"
+msgstr ""
+
+msgid "Translated"
+msgstr "Traduit"
+
+#~ msgid "Obsolete"
+#~ msgstr "Obsolète"
+"""
+        c.save()
+
+        # The statistics are stored and counting them doesn't parse anything
+        c = Catalog.objects.get(pk=c.pk)
+        with patch("projects.models.polib") as polib:
+            self.assertEqual(str(c), "French, djangojs (33%)")
+            e = Event.objects.create(action=Event.Action.CATALOG_UPDATED, catalog=c)
+        polib.pofile.assert_not_called()
+        self.assertEqual(e.catalog_string, "French, djangojs (33%)")
+        self.assertEqual(
+            (
+                c.total_count,
+                c.translated_count,
+                c.fuzzy_count,
+                c.untranslated_count,
+                c.obsolete_count,
+            ),
+            (3, 1, 1, 1, 1),
+        )
+
+        c.entries.filter(msgid="Untranslated").update(
+            msgstr="Non traduit", translated=True
+        )
+        c.save()
+        self.assertEqual(str(c), "French, djangojs (66%)")
+
+    def test_catalog_entries(self):
+        _p, c = self.create_project_and_catalog()
+
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "msgstr_plural", "translated")),
+            [
+                ("Continue", {}, True),
+                ("Copied code!", {}, True),
+                (
+                    "Successfully reset the password of %(count)s student.",
+                    {
+                        "0": "Réinitialisation du mot de passe de %(count)s élève.",
+                        "1": "Réinitialisation des mots de passe de %(count)s élèves .",
+                    },
+                    True,
+                ),
+            ],
+        )
+
+        # The pofile is rendered from the entries
+        c = Catalog.objects.get(pk=c.pk)
+        self.assertIn(
+            '#, python-format\nmsgid "Successfully reset the password', c.pofile
+        )
+
+        c.pofile = '#~ msgid "Gone"\n#~ msgstr "Parti"\n'
+        c.save()
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "obsolete", "translated")),
+            [("Gone", True, False)],
+        )
+
+    def test_merge_po(self):
+        p = Project.objects.create(name="test", slug="test")
+        c = p.catalogs.create(
+            language_code="fr",
+            domain="django",
+            pofile="""\
+#: old.py:1
+#, fuzzy, python-format
+msgid "Hello %(name)s"
+msgstr "Bonjour %(name)s"
+
+# Translator comment
+#: old.py:2
+msgctxt "menu"
+msgid "File"
+msgstr "Fichier"
+
+msgid "File"
+msgstr "Dossier"
+
+msgid "%(count)s item"
+msgid_plural "%(count)s items"
+msgstr[0] "%(count)s élément"
+
+msgid "Unchanged"
+msgstr "Inchangé"
+
+msgid "Removed"
+msgstr "Supprimé"
+""",
+        )
+        pot = polib.pofile(
+            """\
+#: new.py:1
+#, python-format
+msgid "Hello %(name)s"
+msgstr ""
+
+#: new.py:2
+msgctxt "menu"
+msgid "File"
+msgstr ""
+
+msgid "File"
+msgstr ""
+
+msgid "%(count)s item"
+msgid_plural "%(count)s items"
+msgstr[0] ""
+msgstr[1] ""
+
+msgid "Unchanged"
+msgstr ""
+
+#. Extracted comment
+msgid "Added"
+msgstr ""
+""",
+            wrapwidth=0,
+        )
+
+        # The previous implementation, merging using polib
+        po = c.build_po()
+        po.merge(pot)
+        expected = p.catalogs.create(language_code="de", domain="django", pofile=po)
+
+        c = Catalog.objects.get(pk=c.pk)
+        bulk_create = CatalogEntry.objects.bulk_create
+        with patch.object(
+            CatalogEntry.objects, "bulk_create", wraps=bulk_create
+        ) as upsert:
+            self.assertEqual(c.merge_po(pot), 5)
+        self.assertEqual(
+            str(Catalog.objects.get(pk=c.pk).po),
+            str(Catalog.objects.get(pk=expected.pk).po),
+        )
+
+        # "Unchanged" and the row with the "File" msgid aren't written again
+        self.assertEqual(
+            [row.msgid for row in upsert.call_args.args[0]],
+            ["Hello %(name)s", "File", "%(count)s item", "Removed", "Added"],
+        )
+        self.assertEqual(
+            list(c.entries.values_list("msgid", "msgctxt", "obsolete", "position")),
+            [
+                ("Hello %(name)s", None, False, 0),
+                ("File", "menu", False, 1),
+                ("File", None, False, 2),
+                ("%(count)s item", None, False, 3),
+                ("Unchanged", None, False, 4),
+                ("Removed", None, True, 5),
+                ("Added", None, False, 6),
+            ],
+        )
+        self.assertEqual(
+            (c.total_count, c.translated_count, c.fuzzy_count, c.obsolete_count),
+            (6, 3, 1, 1),
+        )
+
+        # Merging the same file again doesn't change anything
+        updated_at = c.updated_at
+        self.assertEqual(c.merge_po(pot), 0)
+        self.assertEqual(Catalog.objects.get(pk=c.pk).updated_at, updated_at)
+
+    def test_compressed_pofile(self):
+        _p, c = self.create_project_and_catalog()
+        pofile = c.pofile
+        self.assertEqual(c.content_hash, "")
+
+        c.store_pofile()
+        self.assertEqual(gzip.decompress(c.compressed_pofile).decode("utf-8"), pofile)
+
+        # The compressed pofile is only loaded when needed and is used instead
+        # of the entries
+        c = Catalog.objects.get(pk=c.pk)
+        self.assertIn("compressed_pofile", c.get_deferred_fields())
+        with patch.object(Catalog, "build_po") as build_po:
+            self.assertEqual(c.pofile, pofile)
+        build_po.assert_not_called()
+
+        # Saving concurrently clears the hash and the compressed pofile; the
+        # entries are used instead of an empty pofile
+        c = Catalog.objects.get(pk=c.pk)
+        other = Catalog.objects.get(pk=c.pk)
+        other.pofile = 'msgid "Hello"\nmsgstr "Bonjour"\n'
+        other.save()
+        self.assertTrue(c.content_hash)
+        self.assertIn('msgstr "Bonjour"', c.pofile)
+
+        c = Catalog.objects.get(pk=c.pk)
+        self.assertEqual((c.content_hash, bytes(c.compressed_pofile)), ("", b""))
+        self.assertIn('msgstr "Bonjour"', c.pofile)
+
+        # The API never serves an empty pofile under a stored hash
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        headers = {"x-token": superuser.token, "x-cli-api": settings.CLI_API}
+        c.store_pofile()
+        Catalog.objects.filter(pk=c.pk).update(compressed_pofile=b"")
+        r = self.client.get("/api/pofile/test/fr/djangojs/", headers=headers)
+        self.assertContains(r, 'msgstr "Bonjour"')
+        c = Catalog.objects.defer(None).get(pk=c.pk)
+        self.assertEqual(r["etag"], f'"{c.content_hash}"')
+        self.assertEqual(gzip.decompress(c.compressed_pofile), r.content)
+
+    def test_po_cache(self):
+        _p, c = self.create_project_and_catalog()
+        po_cache.clear()
+
+        first = Catalog.objects.get(pk=c.pk).po
+        second = Catalog.objects.get(pk=c.pk).po
+        self.assertIs(first, second)
+        self.assertEqual(po_cache.info()[:2], (1, 1))
+
+        c.pofile = 'msgid "Hello"\nmsgstr "Bonjour"\n'
+        c.save()
+        self.assertEqual(po_cache.info().currsize, 0)
+        self.assertEqual(
+            [entry.msgstr for entry in Catalog.objects.get(pk=c.pk).po], ["Bonjour"]
+        )
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache.get((1, "a"), lambda: "1a")
+        cache.get((2, "a"), lambda: "2a")
+        self.assertEqual(cache.get((1, "a"), lambda: "miss"), "1a")
+        cache.get((3, "a"), lambda: "3a")  # Evicts (2, "a")
+        self.assertEqual(cache.get((2, "a"), lambda: "2b"), "2b")
+        self.assertEqual(cache.info(), (1, 4, 2, 2))
+
+        cache.invalidate(2)
+        self.assertEqual(cache.info().currsize, 1)
+
+    def test_similarity(self):
+        index = SimilarityIndex([
+            ("Save the file", "Datei speichern", 1),
+            ("Save the files", "Dateien speichern", 2),
+            ("Delete the file", "Datei löschen", 1),
+            ("Something else entirely", "Etwas anderes", 1),
+        ])
+        self.assertEqual(len(index), 4)
+        matches = index.search("save  the FILE")
+        self.assertEqual(
+            [(match.msgstr, round(match.score, 2)) for match in matches],
+            [
+                ("Datei speichern", 1.0),
+                ("Dateien speichern", 0.9),
+                ("Datei löschen", 0.6),
+            ],
+        )
+        self.assertEqual(
+            [match.msgstr for match in index.search("Save the file", projects={2})],
+            ["Dateien speichern"],
+        )
+        self.assertEqual(len(index.search("Save the file", limit=3, min_score=0.2)), 3)
+        self.assertEqual(index.search("Unrelated"), [])
+
+        # Catalogs are reindexed one by one
+        index = SimilarityIndex()
+        index.update(1, [("Save the file", "Datei speichern", 1)], version="a")
+        index.update(2, [("Save the file", "Datei speichern", 2)], version="a")
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.outdated({1: "a", 2: "b", 3: "a"}), (set(), [2, 3]))
+        index.update(2, [("Save the files", "Dateien speichern", 2)], version="b")
+        self.assertEqual(
+            [match.msgstr for match in index.search("Save the file")],
+            ["Datei speichern", "Dateien speichern"],
+        )
+        self.assertEqual(
+            [match.msgstr for match in index.search("Save the file", projects={2})],
+            ["Dateien speichern"],
+        )
+        index.remove(1)
+        self.assertEqual(index.outdated({2: "b"}), (set(), []))
+        self.assertEqual(
+            [match.msgstr for match in index.search("Save the file")],
+            ["Dateien speichern"],
+        )
+        index.remove(2)
+        self.assertEqual((len(index), dict(index.postings)), (0, {}))
+
+    def test_similarity_matches_in_catalog(self):
+        p1 = Project.objects.create(name="one", slug="one")
+        p1.catalogs.create(
+            language_code="de",
+            domain="django",
+            pofile='msgid "Save the file"\nmsgstr "Datei speichern"\n',
+        )
+        p2 = Project.objects.create(name="two", slug="two")
+        c2 = p2.catalogs.create(
+            language_code="de",
+            domain="django",
+            pofile='msgid "Save the files"\nmsgstr ""\n',
+        )
+        # Translations into other languages aren't used
+        p1.catalogs.create(
+            language_code="fr",
+            domain="django",
+            pofile='msgid "Save the files"\nmsgstr "Enregistrer les fichiers"\n',
+        )
+
+        user = User.objects.create_user("user@example.com", "user")
+        user.projects.add(p2)
+        client = Client()
+        client.force_login(user)
+        superuser = User.objects.create_superuser("admin@example.com", "admin")
+        su_client = Client()
+        su_client.force_login(superuser)
+
+        url = c2.get_absolute_url()
+        r = su_client.get(url)
+        self.assertContains(r, '<ul class="entry__matches">')
+        self.assertContains(r, 'data-match="Datei speichern"')
+        self.assertContains(r, ">90%</a>")
+        self.assertNotContains(r, "Enregistrer")
+
+        # Only translations from accessible projects are shown
+        r = client.get(url)
+        self.assertNotContains(r, "Datei speichern")
+
+        # The index is rebuilt when catalogs change
+        p1.catalogs.create(
+            language_code="de",
+            domain="djangojs",
+            pofile='msgid "Save the files"\nmsgstr "Dateien speichern"\n',
+        )
+        r = su_client.get(url)
+        self.assertContains(r, 'data-match="Dateien speichern"')
+        self.assertContains(r, ">100%</a>")
+
+        # Only the entries of changed catalogs are loaded again
+        index = similarity.index_for("de")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIs(similarity.index_for("de"), index)
+        self.assertEqual(len(queries), 1)  # The versions of the catalogs
+        c2.delete()
+        similarity.index_for("de")
+        self.assertEqual(len(index.versions), 2)
 
     def test_fix_nls(self):
         for test in [
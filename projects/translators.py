@@ -1,6 +1,18 @@
+import asyncio
+import functools
 import re
+import threading
+import time
+import weakref
 
 import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from projects.models import TranslationMemory, TranslationUsage
 
 
 class TranslationError(Exception):
@@ -58,40 +70,318 @@ def _restore_variables(text, placeholders):
     )
 
 
-async def translate_by_deepl(text, to_language, auth_key):
+#: DeepL accepts up to 50 texts per request
+DEEPL_BATCH_SIZE = 50
+
+#: Pooled clients per event loop, see ``_client()``
+_clients = weakref.WeakKeyDictionary()
+
+
+def _client():
+    """
+    Return a long-lived client for the running event loop
+
+    Reusing the client keeps connections to DeepL alive between suggestions,
+    saving a TLS handshake per request. Connections can't be shared between
+    event loops, e.g. when async views run using ``async_to_sync``.
+    """
+    loop = asyncio.get_running_loop()
+    if (client := _clients.get(loop)) is None:
+        client = _clients[loop] = httpx.AsyncClient(
+            timeout=5,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60),
+        )
+    return client
+
+
+#: Translations currently being requested from DeepL per event loop, see
+#: ``_translate_once()``
+_in_flight = weakref.WeakKeyDictionary()
+
+
+class CircuitBreaker:
+    """
+    Fail fast for ``cooldown`` seconds after ``threshold`` consecutive timeouts
+
+    Afterwards, one probe request is let through while the others keep
+    failing. The breaker closes if the probe succeeds and opens again if it
+    times out as well.
+    """
+
+    def __init__(self, *, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        # Pre-translation jobs run in threads of their own
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timeouts = 0
+            self.opened_at = None
+            self.probing = False
+
+    def check(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if not self.probing and time.monotonic() - self.opened_at >= self.cooldown:
+                self.probing = True
+                return
+        raise TranslationError(
+            "Deepl isn't responding at the moment. Please try again later."
+        )
+
+    def record(self, *, timeout):
+        with self._lock:
+            self.probing = False
+            if not timeout:
+                self.timeouts = 0
+                self.opened_at = None
+                return
+            self.timeouts += 1
+            if self.timeouts >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a request which neither succeeded nor timed out"""
+        with self._lock:
+            self.probing = False
+
+
+deepl_breaker = CircuitBreaker(threshold=3, cooldown=60)
+
+
+async def translate_by_deepl(text, to_language, auth_key, *, user=None):
+    return (await translate_many_by_deepl([text], to_language, auth_key, user=user))[0]
+
+
+async def translate_many_by_deepl(
+    texts, to_language, auth_key, *, source_language="", user=None
+):
+    """
+    Translate all ``texts`` using as few requests as possible
+
+    Translations are taken from the translation memory where possible, only
+    the remaining texts are sent to DeepL and charged to ``user``. The source
+    language is detected by DeepL if it's empty. Returns the translations in
+    the order of ``texts``.
+    """
+    translations = await _recall(texts, source_language, to_language)
+    if missing := list(dict.fromkeys(t for t in texts if t not in translations)):
+        translated = dict(
+            zip(
+                missing,
+                await _translate_once(
+                    missing, to_language, auth_key, source_language, user=user
+                ),
+            )
+        )
+        await _memorize(translated, source_language, to_language)
+        translations.update(translated)
+    return [translations[text] for text in texts]
+
+
+async def _recall(texts, source_language, target_language):
+    """
+    Return the translations of ``texts`` contained in the translation memory
+    """
+    keys = {
+        TranslationMemory.make_key(text, source_language, target_language): text
+        for text in texts
+    }
+    entries = [
+        entry
+        async for entry in TranslationMemory.objects
+        .fresh()
+        .filter(key__in=keys)
+        .only("key", "translation")
+    ]
+    if entries:
+        await TranslationMemory.objects.filter(
+            pk__in=[entry.pk for entry in entries]
+        ).aupdate(hits=F("hits") + 1, used_at=timezone.now())
+    return {keys[entry.key]: entry.translation for entry in entries}
+
+
+# Pruning counts the whole memory, so writes only prune it this often (seconds)
+MEMORY_PRUNE_INTERVAL = 600
+_memory = {"pruned_at": None}
+
+
+async def _memorize(translations, source_language, target_language):
+    await TranslationMemory.objects.abulk_create(
+        [
+            TranslationMemory(
+                key=TranslationMemory.make_key(
+                    source, source_language, target_language
+                ),
+                source_language=source_language.lower(),
+                target_language=target_language.lower(),
+                source=source,
+                translation=translation,
+            )
+            for source, translation in translations.items()
+        ],
+        # Expired entries are replaced
+        update_conflicts=True,
+        unique_fields=["key"],
+        update_fields=["translation", "created_at", "used_at"],
+    )
+    now = time.monotonic()
+    pruned_at = _memory["pruned_at"]
+    if pruned_at is None or now - pruned_at >= MEMORY_PRUNE_INTERVAL:
+        _memory["pruned_at"] = now
+        await sync_to_async(TranslationMemory.objects.prune)()
+
+
+async def _translate_once(texts, to_language, auth_key, source_language, *, user):
+    """
+    Translate distinct ``texts``, joining identical requests in progress
+
+    Double clicks and translators working on the same catalog would
+    otherwise send the same texts to DeepL several times. Only the texts
+    which aren't being translated already are charged to ``user``.
+    """
+    loop = asyncio.get_running_loop()
+    in_flight = _in_flight.setdefault(loop, {})
+
+    def key(text):
+        return text, source_language.lower(), to_language.lower()
+
+    if new := [text for text in texts if key(text) not in in_flight]:
+        task = loop.create_task(
+            _translate(new, to_language, auth_key, source_language, user=user)
+        )
+        for index, text in enumerate(new):
+            in_flight[key(text)] = task, index
+        task.add_done_callback(
+            functools.partial(_forget, in_flight, [key(text) for text in new])
+        )
+
+    # Shielded so that a cancelled request doesn't fail the others
+    pending = [in_flight[key(text)] for text in texts]
+    results = {}
+    for task, _index in pending:
+        if task not in results:
+            results[task] = await asyncio.shield(task)
+    return [results[task][index] for task, index in pending]
+
+
+def _forget(in_flight, keys, task):
+    for key in keys:
+        del in_flight[key]
+    if not task.cancelled():
+        task.exception()  # Nobody may be waiting for the result anymore
+
+
+@sync_to_async
+def _charge(texts, user):
+    """
+    Record the characters sent to DeepL, unless the monthly budgets are used up
+
+    Returns the month and the characters charged, see ``_refund()``.
+    """
+    characters = sum(len(text) for text in texts)
+    month = timezone.localdate().replace(day=1)
+    usage = TranslationUsage.objects.filter(month=month)
+    with transaction.atomic():
+        # Locking the row of the month's requests without a user serializes
+        # all charges, so that concurrent requests can't exceed the budgets
+        TranslationUsage.objects.select_for_update().get_or_create(
+            user=None, month=month
+        )
+        if (
+            budget := settings.DEEPL_CHARACTER_BUDGET
+        ) and usage.characters() + characters > budget:
+            raise TranslationError(
+                "The machine translation budget for this month has been used up."
+            )
+        if (
+            user
+            and (budget := settings.DEEPL_USER_CHARACTER_BUDGET)
+            and usage.filter(user=user).characters() + characters > budget
+        ):
+            raise TranslationError(
+                "Your machine translation budget for this month has been used up."
+            )
+        row, _created = TranslationUsage.objects.get_or_create(user=user, month=month)
+        TranslationUsage.objects.filter(pk=row.pk).update(
+            characters=F("characters") + characters
+        )
+    return month, characters
+
+
+@sync_to_async
+def _refund(charge, user):
+    """Give back the characters of a failed request"""
+    month, characters = charge
+    TranslationUsage.objects.filter(user=user, month=month).update(
+        characters=F("characters") - characters
+    )
+
+
+async def _translate(texts, to_language, auth_key, source_language, *, user=None):
     # Copied 1:1 from django-rosetta, thanks!
     if auth_key.lower().endswith(":fx"):
         endpoint = "https://api-free.deepl.com"
     else:
         endpoint = "https://api.deepl.com"
 
-    protected, placeholders = _protect_variables(text)
+    protected = [_protect_variables(text) for text in texts]
+    translations = []
+    for start in range(0, len(protected), DEEPL_BATCH_SIZE):
+        batch = protected[start : start + DEEPL_BATCH_SIZE]
+        data = {
+            "tag_handling": "xml",
+            "ignore_tags": "var",
+            "target_lang": to_language.upper(),
+            "text": [text for text, _placeholders in batch],
+        }
+        if source_language:
+            data["source_lang"] = source_language.upper()
+        # Charged up front so that concurrent requests respect the budgets,
+        # failed requests are refunded
+        charge = await _charge(texts[start : start + DEEPL_BATCH_SIZE], user)
+        try:
+            translated = await _deepl_request(endpoint, auth_key, data)
+        except BaseException:
+            await _refund(charge, user)
+            raise
+        if len(translated) != len(batch):
+            raise TranslationError("Deepl returned a non-JSON or unexpected response.")
+        translations.extend(
+            _restore_variables(translation, placeholders)
+            for translation, (_text, placeholders) in zip(translated, batch)
+        )
+    return translations
+
 
+async def _deepl_request(endpoint, auth_key, data):
+    deepl_breaker.check()
     try:
-        async with httpx.AsyncClient() as client:
-            r = await client.post(
-                f"{endpoint}/v2/translate",
-                headers={"Authorization": f"DeepL-Auth-Key {auth_key}"},
-                data={
-                    "tag_handling": "xml",
-                    "ignore_tags": "var",
-                    "target_lang": to_language.upper(),
-                    "text": protected,
-                },
-                timeout=5,
-            )
+        r = await _client().post(
+            f"{endpoint}/v2/translate",
+            headers={"Authorization": f"DeepL-Auth-Key {auth_key}"},
+            data=data,
+        )
     except httpx.TimeoutException as exc:
+        deepl_breaker.record(timeout=True)
         raise TranslationError(
             "The Deepl request timed out. Please try again later."
         ) from exc
+    except BaseException:
+        # E.g. connection errors and cancelled requests
+        deepl_breaker.release()
+        raise
+    deepl_breaker.record(timeout=False)
 
     if r.status_code != 200:
         raise TranslationError(
             f"Deepl response is {r.status_code}. Please check your API key or try again later."
         )
     try:
-        translated = r.json().get("translations")[0].get("text")
-        return _restore_variables(translated, placeholders)
+        return [translation["text"] for translation in r.json()["translations"]]
     except Exception as exc:
         raise TranslationError(
             "Deepl returned a non-JSON or unexpected response."
@@ -9,17 +9,35 @@ urlpatterns = [
     path("feed.rss", feeds.AllProjectsFeed(), name="feed"),
     path("<slug:slug>/", views.project, name="project"),
     path("<slug:slug>/feed.rss", feeds.ProjectFeed(), name="project_feed"),
+    # Has to come before the catalog pattern
+    path("api/pofile/<str:project>/", views.pofiles, name="pofiles"),
+    path(
+        "api/pofile/<str:project>/status/",
+        views.pofile_status,
+        name="pofile_status",
+    ),
+    path("api/suggest/all/", views.suggest_all),
     path(
         "<slug:project>/<str:language_code>/<str:domain>/",
         views.catalog,
         name="catalog",
     ),
+    path(
+        "<slug:project>/<str:language_code>/<str:domain>/pretranslate/",
+        views.catalog_pretranslate,
+        name="catalog_pretranslate",
+    ),
     path("api/suggest/", views.suggest),
     path(
         "api/pofile/<str:project>/<str:language_code>/<str:domain>/",
         views.pofile,
         name="pofile",
     ),
+    path(
+        "api/pofile/<str:project>/<str:language_code>/<str:domain>/pretranslate/",
+        views.pofile_pretranslate,
+        name="pofile_pretranslate",
+    ),
     path(
         "traduire.toml",
         views.traduire_toml,
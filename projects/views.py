@@ -1,25 +1,130 @@
 import csv
+import gzip
+import io
+import json
+import time
+import zipfile
+import zlib
+from functools import wraps
 
 import polib
 from django import http
 from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import RequestDataTooBig
+from django.db import connection, transaction
+from django.db.models import Q
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.defaulttags import querystring
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+from django.utils.translation import gettext as _
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
 from accounts.models import User
 from form_rendering import adapt_rendering
-from projects import translators
+from projects import pretranslation, translators
+from projects.caching import LRUCache
 from projects.foreign import messages_as_table
-from projects.forms import EntriesForm, FilterForm, SuggestForm
+from projects.forms import (
+    SEARCH_FIELDS,
+    EntriesForm,
+    FilterForm,
+    SuggestAllForm,
+    SuggestForm,
+)
 from projects.models import Catalog, Event, Project
 
 
 ENTRIES_PER_PAGE = 20
 
+#: Gzipped CSV exports, keyed by project and the state of its catalogs
+csv_cache = LRUCache(maxsize=16)
+
+#: Size of the chunks gzipped request bodies are decompressed in
+DECOMPRESSION_CHUNK_SIZE = 64 * 1024
+
+
+def _accepts_gzip(request):
+    """
+    Return whether the ``Accept-Encoding`` header allows gzip
+
+    Codings with ``q=0`` are refused, ``*`` stands for all codings not
+    mentioned explicitly.
+    """
+    qvalues = {}
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, *params = coding.split(";")
+        qvalue = 1.0
+        for param in params:
+            key, _sep, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[name.strip().lower()] = qvalue
+    return qvalues.get("gzip", qvalues.get("*", 0.0)) > 0
+
+
+def _gzip_response(request, compressed, *, content_type, headers=None):
+    """
+    Return ``compressed`` as-is if the client accepts gzip, decompressed otherwise
+    """
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if _accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        return HttpResponse(compressed, content_type=content_type, headers=headers)
+    return HttpResponse(
+        gzip.decompress(compressed), content_type=content_type, headers=headers
+    )
+
+
+def _request_body(request):
+    """
+    Return the request body, decompressed if it has been sent gzipped
+
+    Decompressed bodies may not exceed ``DATA_UPLOAD_MAX_MEMORY_SIZE`` either,
+    ``RequestDataTooBig`` is raised otherwise.
+    """
+    encoding = request.headers.get("content-encoding", "identity")
+    if encoding == "identity":
+        return request.body
+    if encoding != "gzip":
+        raise ValueError(f"Unsupported content encoding {encoding!r}")
+
+    limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks, size, data = [], 0, request.body
+    while not decompressor.eof:
+        chunk = decompressor.decompress(data, DECOMPRESSION_CHUNK_SIZE)
+        data = decompressor.unconsumed_tail
+        if not chunk and not data:
+            raise EOFError("The gzipped request body is truncated.")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise RequestDataTooBig(
+                "The decompressed request body exceeds DATA_UPLOAD_MAX_MEMORY_SIZE."
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _check_archive_size(archive):
+    """
+    Raise ``RequestDataTooBig`` if the members of a zip archive would exceed
+    ``DATA_UPLOAD_MAX_MEMORY_SIZE`` once decompressed
+    """
+    limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    # Members can't be read beyond the size declared in the archive
+    if limit is not None and sum(info.file_size for info in archive.infolist()) > limit:
+        raise RequestDataTooBig(
+            "The decompressed archive exceeds DATA_UPLOAD_MAX_MEMORY_SIZE."
+        )
+
 
 @login_required
 def projects(request):
@@ -55,30 +160,34 @@ def catalog(request, project, language_code, domain):
         domain=domain,
     )
 
-    entries = [entry for entry in catalog.po if not entry.obsolete]
-    total = len(entries)
+    entries = catalog.entries.filter(obsolete=False)
 
     filter_form = FilterForm(request.GET)
     if filter_form.is_valid():
         data = filter_form.cleaned_data
         if data.get("pending"):
-            entries = [entry for entry in entries if not entry.translated()]
-            total = len(entries)
+            entries = entries.filter(translated=False)
         if query := data.get("query", "").casefold():
-            entries = [entry for entry in entries if query in str(entry).casefold()]
-            total = len(entries)
-        if start := data.get("start") or 0:
-            if len(entries) > start:
-                entries = entries[start:]
-            else:
-                start = 0
+            q = Q()
+            for field in data.get("search") or dict(SEARCH_FIELDS):
+                q |= Q(**{f"search_{field}__contains": query})
+            entries = entries.filter(q)
+        total = entries.count()
+        start = data.get("start") or 0
+        if not 0 <= start < total:
+            start = 0
     else:
         start = 0
         return http.HttpResponseRedirect(".")
 
     data = [request.POST] if request.method == "POST" else []
-    entries = entries[:ENTRIES_PER_PAGE]
-    form = EntriesForm(*data, entries=entries, language_code=language_code)
+    entries = list(entries[start : start + ENTRIES_PER_PAGE])
+    form = EntriesForm(
+        *data,
+        entries=entries,
+        language_code=language_code,
+        initial={"revision": catalog.revision},
+    )
 
     if form.is_valid():
         form.update(catalog, request=request)
@@ -97,15 +206,17 @@ def catalog(request, project, language_code, domain):
             )
         )
 
+    form.add_matches(projects=Project.objects.for_user(request.user))
     return render(
         request,
         "projects/catalog.html",
         {
             "catalog": catalog,
             "project": catalog.project,
-            "po": catalog.po,
             "filter_form": adapt_rendering(filter_form),
             "form": adapt_rendering(form),
+            "can_suggest": bool(settings.DEEPL_AUTH_KEY),
+            "pretranslation": pretranslation.running_job(catalog),
             "entries": entries,
             "previous_url": querystring(
                 None, request.GET, start=start - ENTRIES_PER_PAGE
@@ -122,6 +233,33 @@ def catalog(request, project, language_code, domain):
     )
 
 
+@login_required
+@require_POST
+def catalog_pretranslate(request, project, language_code, domain):
+    catalog = get_object_or_404(
+        Catalog.objects.for_user(request.user),
+        project__slug=project,
+        language_code=language_code,
+        domain=domain,
+    )
+    if not settings.DEEPL_AUTH_KEY:
+        return http.HttpResponseBadRequest()
+
+    _job, created = pretranslation.start(catalog, user=request.user)
+    if created:
+        messages.success(
+            request,
+            _(
+                "Pre-translating the pending entries, reload the page to see the progress."
+            ),
+        )
+    else:
+        messages.info(
+            request, _("The pending entries are already being pre-translated.")
+        )
+    return http.HttpResponseRedirect(catalog.get_absolute_url())
+
+
 @require_POST
 async def suggest(request):
     user = await request.auser()
@@ -133,7 +271,10 @@ async def suggest(request):
         data = form.cleaned_data
         try:
             translation = await translators.translate_by_deepl(
-                data["msgid"], data["language_code"], settings.DEEPL_AUTH_KEY
+                data["msgid"],
+                data["language_code"],
+                settings.DEEPL_AUTH_KEY,
+                user=user,
             )
         except translators.TranslationError as exc:
             return http.JsonResponse({"error": str(exc)})
@@ -142,55 +283,332 @@ async def suggest(request):
     return http.HttpResponseBadRequest()
 
 
-@csrf_exempt
-def pofile(request, project, language_code, domain):
-    if not (version := request.headers.get("x-cli-api")) or (
-        version != settings.CLI_API
-    ):
-        return http.HttpResponseBadRequest(f"Incorrect CLI version {version!r}")
-
-    user = User.objects.filter(token=request.headers.get("x-token")).first()
-    if not user:
+@require_POST
+async def suggest_all(request):
+    """
+    Suggest translations for all pending entries of a page in one request
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
         return http.HttpResponseForbidden()
 
-    project = Project.objects.for_user(user).filter(slug=project).first()
-    if not project:
-        return http.HttpResponseNotFound()
+    form = SuggestAllForm(request.POST)
+    if form.is_valid():
+        data = form.cleaned_data
+        msgids = list(dict.fromkeys(data["msgids"]))
+        try:
+            translations = await translators.translate_many_by_deepl(
+                msgids, data["language_code"], settings.DEEPL_AUTH_KEY, user=user
+            )
+        except translators.TranslationError as exc:
+            return http.JsonResponse({"error": str(exc)})
+        translations = dict(zip(msgids, translations))
+        return http.JsonResponse({
+            "msgstrs": [translations[msgid] for msgid in data["msgids"]]
+        })
 
-    if request.method == "GET":
-        if catalog := project.catalogs.filter(
-            language_code=language_code, domain=domain
-        ).first():
-            return http.HttpResponse(catalog.pofile, content_type="text/plain")
-        return http.HttpResponseNotFound()
+    return http.HttpResponseBadRequest()
 
-    if request.method in {"POST", "PUT"}:
-        new = polib.pofile(request.body.decode("utf-8"))
-        catalog, created = project.catalogs.get_or_create(
+
+def cli_api(view):
+    """
+    Authenticate CLI requests and pass the user and the project to ``view``
+    """
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, project, *args, **kwargs):
+        start = time.perf_counter()
+        if not (version := request.headers.get("x-cli-api")) or (
+            version != settings.CLI_API
+        ):
+            return http.HttpResponseBadRequest(f"Incorrect CLI version {version!r}")
+
+        user = User.objects.filter(token=request.headers.get("x-token")).first()
+        if not user:
+            return http.HttpResponseForbidden()
+
+        project = Project.objects.for_user(user).filter(slug=project).first()
+        if not project:
+            return http.HttpResponseNotFound()
+
+        authenticated = time.perf_counter()
+        queries = _QueryTimer()
+        with connection.execute_wrapper(queries):
+            response = view(request, *args, user=user, project=project, **kwargs)
+        # Lets trd --timings tell the server's processing time from the network
+        response["Server-Timing"] = ", ".join(
+            f"{name};dur={seconds * 1000:.1f}"
+            for name, seconds in {
+                "auth": authenticated - start,
+                "view": time.perf_counter() - authenticated,
+                "db": queries.duration,
+            }.items()
+        )
+        return response
+
+    return wrapper
+
+
+class _QueryTimer:
+    """
+    Database execute wrapper summing up the duration of all queries
+    """
+
+    def __init__(self):
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+
+
+class Conflict(Exception):
+    """
+    Raised when an upload would overwrite changes made since its base revision
+    """
+
+    def __init__(self, conflicts=()):
+        super().__init__(conflicts)
+        self.conflicts = list(conflicts)
+
+
+def _upload_catalog(
+    project, language_code, domain, po, *, user, replace, base_revision=None
+):
+    """
+    Merge ``po`` into the catalog or replace its contents
+
+    Returns the catalog and whether it changed; events are only logged for
+    changes. Replacing a catalog which has been modified since
+    ``base_revision`` raises ``Conflict``, merging never loses translations.
+    """
+    with transaction.atomic():
+        catalog, created = Catalog.objects.select_for_update().get_or_create(
+            project=project,
             language_code=language_code,
             domain=domain,
-            defaults={"pofile": ""},
         )
-        if request.method == "PUT" or created:
-            catalog.pofile = str(new)
+        if replace and base_revision not in {None, catalog.revision} and not created:
+            raise Conflict
+        if replace or created:
+            catalog.replace_po(po)
+            catalog.save()
+            changed = True
         else:
-            catalog.po.merge(new)
-            catalog.pofile = str(catalog.po)
-        catalog.save()
+            # Submitting an unchanged pofile doesn't touch the catalog at all
+            changed = bool(catalog.merge_po(po))
+
+    if changed:
+        _log_upload(catalog, user=user, created=created, replace=replace)
+    return catalog, changed
+
+
+def _log_upload(catalog, *, user, created, replace):
+    Event.objects.create(
+        user=user,
+        action=(
+            Event.Action.CATALOG_CREATED
+            if created
+            else Event.Action.CATALOG_REPLACED
+            if replace
+            else Event.Action.CATALOG_UPDATED
+        ),
+        catalog=catalog,
+    )
 
-        Event.objects.create(
-            user=user,
-            action=(
-                Event.Action.CATALOG_CREATED
-                if created
-                else Event.Action.CATALOG_REPLACED
-                if request.method == "PUT"
-                else Event.Action.CATALOG_UPDATED
-            ),
-            catalog=catalog,
+
+#: Content type of entry-level patches, see ``_parse_patch()``
+PATCH_CONTENT_TYPE = "application/json"
+
+
+def _parse_patch(body):
+    """
+    Parse an entry-level patch against a pofile
+
+    Patches are JSON objects::
+
+        {
+            "header": "<the header entry, only if it changed>",
+            "added": "<the added entries>",
+            "changed": "<the changed entries>",
+            "removed": [[msgctxt or null, msgid], ...],
+            "base": "<the changed and removed entries before the changes>"
+        }
+
+    Entries are sent in the pofile format, so only the entries contained in
+    the patch have to be parsed. Returns a ``polib.POFile`` containing the
+    header and the added and changed entries, a ``polib.POFile`` containing
+    the base entries and the ``msgid_with_context`` values of the removed
+    entries.
+    """
+    patch = json.loads(body)
+    po = polib.pofile(
+        "\n\n".join(
+            patch[key] for key in ("header", "added", "changed") if patch.get(key)
+        ),
+        wrapwidth=0,
+    )
+    base = polib.pofile(patch.get("base", ""), wrapwidth=0)
+    removed = {
+        f"{msgctxt}\x04{msgid}" if msgctxt else msgid
+        for msgctxt, msgid in patch["removed"]
+    }
+    return po, base, removed
+
+
+def _patch_catalog(
+    project, language_code, domain, patch, *, user, base_revision, replace
+):
+    """
+    Apply a patch to the catalog
+
+    Patches are merged entry by entry with the changes made since
+    ``base_revision``; ``Conflict`` is raised if the patch and somebody else
+    changed the same entries when replacing. Returns the catalog or ``None``
+    if it doesn't exist.
+    """
+    po, base, removed = patch
+    with transaction.atomic():
+        catalog = (
+            project.catalogs
+            .select_for_update()
+            .filter(language_code=language_code, domain=domain)
+            .first()
+        )
+        if not catalog:
+            return None
+        if (
+            replace
+            and base_revision != catalog.revision
+            and (conflicts := catalog.patch_conflicts(po, base, removed))
+        ):
+            raise Conflict(conflicts)
+
+        if replace:
+            catalog.patch_po(po, removed)
+        elif not catalog.merge_po(po, removed=removed):
+            return catalog
+        _log_upload(catalog, user=user, created=False, replace=replace)
+    return catalog
+
+
+def _upload_pofile(request, language_code, domain, *, user, project):
+    """
+    Handle uploads of complete pofiles and patches to the pofile API
+
+    The revision the upload is based on is sent as ``X-Base-Revision``.
+    """
+    try:
+        body = _request_body(request)
+        base_revision = request.headers.get("x-base-revision")
+        base_revision = int(base_revision) if base_revision else None
+    except RequestDataTooBig:
+        return http.HttpResponse(status=413)  # Content Too Large
+    except (EOFError, OSError, ValueError, zlib.error) as exc:
+        return http.HttpResponseBadRequest(f"Invalid request body: {exc}")
+
+    patch = None
+    if request.content_type == PATCH_CONTENT_TYPE:
+        try:
+            patch = _parse_patch(body)
+        except (KeyError, OSError, TypeError, ValueError) as exc:
+            return http.HttpResponseBadRequest(f"Invalid patch: {exc}")
+
+    try:
+        if patch:
+            catalog = _patch_catalog(
+                project,
+                language_code,
+                domain,
+                patch,
+                user=user,
+                base_revision=base_revision,
+                replace=request.method == "PUT",
+            )
+        else:
+            catalog, _changed = _upload_catalog(
+                project,
+                language_code,
+                domain,
+                polib.pofile(body.decode("utf-8"), wrapwidth=0),
+                user=user,
+                replace=request.method == "PUT",
+                base_revision=base_revision,
+            )
+    except Conflict as exc:
+        return http.JsonResponse(
+            {
+                "conflicts": [
+                    [msgctxt or None, msgid]
+                    for msgctxt, _eot, msgid in (
+                        key.rpartition("\x04") for key in exc.conflicts
+                    )
+                ]
+            },
+            status=409,  # Conflict
         )
+    if not catalog:
+        return http.HttpResponse(status=412)  # Precondition Failed
+
+    headers = {
+        "Last-Modified": http_date(catalog.updated_at.timestamp()),
+        "X-Revision": catalog.revision,
+    }
+    # Rendering the pofile is left to the next download, which stores it
+    if catalog.content_hash:
+        headers["ETag"] = f'"{catalog.content_hash}"'
+    return http.HttpResponse(status=202, headers=headers)  # Accepted
+
+
+def _pofile_headers(catalog):
+    return {
+        "ETag": f'"{catalog.content_hash}"',
+        "Last-Modified": http_date(int(catalog.updated_at.timestamp())),
+        "X-Revision": catalog.revision,
+    }
+
+
+@cli_api
+def pofile(request, language_code, domain, *, user, project):
+    if request.method == "GET":
+        if catalog := project.catalogs.filter(
+            language_code=language_code, domain=domain
+        ).first():
+            if not catalog.content_hash:
+                catalog.store_pofile()
+
+            last_modified = int(catalog.updated_at.timestamp())
+            headers = _pofile_headers(catalog)
+            if response := get_conditional_response(
+                request, etag=headers["ETag"], last_modified=last_modified
+            ):
+                for header, value in headers.items():
+                    response[header] = value
+                return response
+
+            # Load the hash and the compressed pofile together; a concurrent
+            # save clears both
+            catalog.refresh_from_db(
+                fields=["content_hash", "compressed_pofile", "updated_at", "revision"]
+            )
+            if not (catalog.content_hash and catalog.compressed_pofile):
+                catalog.store_pofile()
+            return _gzip_response(
+                request,
+                catalog.compressed_pofile,
+                content_type="text/plain; charset=utf-8",
+                headers=_pofile_headers(catalog),
+            )
+        return http.HttpResponseNotFound()
 
-        return http.HttpResponse(status=202)  # Accepted
+    if request.method in {"POST", "PUT"}:
+        return _upload_pofile(
+            request, language_code, domain, user=user, project=project
+        )
 
     if request.method == "DELETE":
         if catalog := project.catalogs.filter(
@@ -209,6 +627,156 @@ def pofile(request, project, language_code, domain):
     return http.HttpResponse(status=405)  # Method Not Allowed
 
 
+#: Name of the archive member listing the content hashes of all catalogs
+ARCHIVE_INDEX = "catalogs.json"
+#: Name of the archive member listing the revisions of the catalogs when
+#: downloading and the revisions the pofiles are based on when uploading
+ARCHIVE_REVISIONS = "revisions.json"
+
+
+def _archive_name(catalog):
+    return f"{catalog.language_code}/{catalog.domain}.po"
+
+
+def _parse_archive_name(name):
+    language_code, _slash, filename = name.partition("/")
+    if not language_code or "/" in filename or not filename.endswith(".po"):
+        raise ValueError(f"Unexpected archive member {name!r}")
+    return language_code, filename.removesuffix(".po")
+
+
+@cli_api
+def pofiles(request, *, user, project):
+    """
+    Download or upload all catalogs of a project as one zip archive
+
+    Archive members are named ``<language_code>/<domain>.po``. Downloads
+    always contain indexes of all catalogs and their content hashes and
+    revisions but skip catalogs whose hash has been sent in
+    ``If-None-Match``. Uploads are processed in a single transaction and
+    may contain an index of the revisions the pofiles are based on;
+    replacing fails for all catalogs if any of them has been changed since.
+    """
+    if request.method == "GET":
+        known = {
+            etag.strip('"')
+            for etag in parse_etags(request.headers.get("if-none-match", ""))
+        }
+        index, revisions = {}, {}
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for catalog in project.catalogs.defer(None):
+                if not (catalog.content_hash and catalog.compressed_pofile):
+                    catalog.store_pofile()
+                index[_archive_name(catalog)] = catalog.content_hash
+                revisions[_archive_name(catalog)] = catalog.revision
+                if catalog.content_hash not in known:
+                    archive.writestr(
+                        _archive_name(catalog),
+                        gzip.decompress(catalog.compressed_pofile),
+                    )
+            archive.writestr(ARCHIVE_INDEX, json.dumps(index))
+            archive.writestr(ARCHIVE_REVISIONS, json.dumps(revisions))
+        return http.HttpResponse(buffer.getvalue(), content_type="application/zip")
+
+    if request.method in {"POST", "PUT"}:
+        try:
+            with zipfile.ZipFile(io.BytesIO(_request_body(request))) as archive:
+                _check_archive_size(archive)
+                names = archive.namelist()
+                revisions = (
+                    json.loads(archive.read(ARCHIVE_REVISIONS))
+                    if ARCHIVE_REVISIONS in names
+                    else {}
+                )
+                uploads = [
+                    (
+                        name,
+                        *_parse_archive_name(name),
+                        polib.pofile(archive.read(name).decode("utf-8"), wrapwidth=0),
+                    )
+                    for name in names
+                    if name != ARCHIVE_REVISIONS
+                ]
+        except RequestDataTooBig:
+            return http.HttpResponse(status=413)  # Content Too Large
+        except (EOFError, OSError, ValueError, zipfile.BadZipFile, zlib.error) as exc:
+            return http.HttpResponseBadRequest(f"Invalid archive: {exc}")
+
+        result, conflicts = {}, []
+        with transaction.atomic():
+            for name, language_code, domain, po in uploads:
+                try:
+                    catalog, changed = _upload_catalog(
+                        project,
+                        language_code,
+                        domain,
+                        po,
+                        user=user,
+                        replace=request.method == "PUT",
+                        base_revision=revisions.get(name),
+                    )
+                except Conflict:
+                    conflicts.append(name)
+                    continue
+                result[_archive_name(catalog)] = {
+                    "changed": changed,
+                    "last_modified": http_date(catalog.updated_at.timestamp()),
+                    "revision": catalog.revision,
+                }
+            if conflicts:
+                transaction.set_rollback(True)
+        if conflicts:
+            return http.JsonResponse({"conflicts": conflicts}, status=409)  # Conflict
+        return http.JsonResponse(result, status=202)  # Accepted
+
+    return http.HttpResponse(status=405)  # Method Not Allowed
+
+
+@cli_api
+def pofile_status(request, *, user, project):
+    """
+    Return the content hash, revision and statistics of all catalogs
+
+    Catalogs are keyed by their archive names, see ``pofiles()``.
+    """
+    catalogs = {}
+    for catalog in project.catalogs.all():
+        if not catalog.content_hash:
+            catalog.store_pofile()
+        catalogs[_archive_name(catalog)] = {
+            "hash": catalog.content_hash,
+            "last_modified": http_date(catalog.updated_at.timestamp()),
+            "revision": catalog.revision,
+            "total": catalog.total_count,
+            "translated": catalog.translated_count,
+            "fuzzy": catalog.fuzzy_count,
+            "untranslated": catalog.untranslated_count,
+            "obsolete": catalog.obsolete_count,
+        }
+    return http.JsonResponse({"catalogs": catalogs})
+
+
+@cli_api
+def pofile_pretranslate(request, language_code, domain, *, user, project):
+    """
+    Start pre-translating a catalog (POST) or return the progress (GET)
+    """
+    catalog = get_object_or_404(
+        project.catalogs, language_code=language_code, domain=domain
+    )
+    if request.method == "POST":
+        if not settings.DEEPL_AUTH_KEY:
+            return http.HttpResponseBadRequest("Machine translation isn't configured.")
+        job, _created = pretranslation.start(catalog, user=user)
+        return http.JsonResponse(job.as_json(), status=202)  # Accepted
+    if request.method == "GET":
+        if job := catalog.pretranslation_jobs.first():
+            return http.JsonResponse(job.as_json())
+        return http.HttpResponseNotFound()
+    return http.HttpResponse(status=405)  # Method Not Allowed
+
+
 @login_required
 def traduire_toml(request):
     toml = "\n".join(
@@ -222,7 +790,13 @@ def traduire_toml(request):
 def messages_csv(request, slug):
     project = get_object_or_404(Project.objects.for_user(request.user), slug=slug)
 
-    response = HttpResponse(content_type="text/csv")
-    csv.writer(response).writerows(messages_as_table(project))
+    key = (project.pk, tuple(project.catalogs.values_list("pk", "updated_at")))
+
+    def export():
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(messages_as_table(project))
+        return gzip.compress(buffer.getvalue().encode("utf-8"), mtime=0)
 
-    return response
+    return _gzip_response(
+        request, csv_cache.get(key, export), content_type="text/csv; charset=utf-8"
+    )
@@ -0,0 +1,62 @@
+"""
+Check the import time of the trd CLI against a budget
+
+Usage: python scripts/benchmark_cli_startup.py [BUDGET_MS]
+
+Imports ``cli/trd.py`` using ``python -X importtime`` a few times and exits
+with status 1 if the fastest import takes longer than the budget (default:
+50ms) or if a module which should only be imported when needed is loaded.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+
+CLI = Path(__file__).resolve().parent.parent / "cli"
+RUNS = 5
+
+#: Modules which only the commands transferring pofiles need
+DEFERRED = {"concurrent.futures", "requests", "tomllib", "zipfile"}
+
+
+def import_times():
+    """Return the cumulative import time in microseconds per module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import trd"],
+        cwd=CLI,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    budget = float(sys.argv[1]) if sys.argv[1:] else 50.0
+    runs = [import_times() for _ in range(RUNS)]
+    fastest = min(times["trd"] for times in runs) / 1000
+    slowest = sorted(runs[0].items(), key=lambda item: item[1], reverse=True)
+
+    print(f"trd imports in {fastest:.1f}ms (budget: {budget:.0f}ms)")
+    for name, cumulative in slowest[1:6]:
+        print(f"  {cumulative / 1000:>6.1f}ms {name}")
+
+    failed = False
+    if deferred := sorted(DEFERRED & runs[0].keys()):
+        print(f"Imported at startup: {', '.join(deferred)}")
+        failed = True
+    if fastest > budget:
+        print("Over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare merging pofiles using polib with ``Catalog.merge_po()``
+
+Usage: python scripts/benchmark_merge.py [ENTRIES ...]
+
+Uses the configured database; everything is rolled back afterwards.
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+import django
+
+
+django.setup()
+
+import polib  # noqa: E402
+from django.db import transaction  # noqa: E402
+
+from projects.models import Project  # noqa: E402
+
+
+def make_po(count, *, translated):
+    po = polib.POFile(wrapwidth=0)
+    po.metadata = {"Content-Type": "text/plain; charset=UTF-8"}
+    for i in range(count):
+        po.append(
+            polib.POEntry(
+                msgid=f"Message {i}",
+                msgstr=f"Nachricht {i}" if translated else "",
+                occurrences=[(f"app/module{i % 50}.py", str(i))],
+            )
+        )
+    return po
+
+
+def polib_merge(catalog, pot):
+    po = catalog.build_po()
+    po.merge(pot)
+    catalog.replace_po(po)
+    catalog.save()
+
+
+def indexed_merge(catalog, pot):
+    catalog.merge_po(pot)
+
+
+def measure(merge, count):
+    po = make_po(count, translated=True)
+    # Drop a tenth of the messages, add as many new ones and move some
+    pot = make_po(count + count // 10, translated=False)
+    del pot[: count // 10]
+    for entry in pot[::7]:
+        entry.occurrences = [("app/moved.py", "1")]
+
+    with transaction.atomic():
+        project = Project.objects.create(name="benchmark", slug="benchmark-merge")
+        catalog = project.catalogs.create(
+            language_code="de", domain="django", pofile=po
+        )
+        start = time.perf_counter()
+        merge(catalog, pot)
+        duration = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return duration
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    print(f"{'entries':>8} {'polib':>10} {'indexed':>10}")
+    for count in counts:
+        print(
+            f"{count:>8} {measure(polib_merge, count):>9.3f}s"
+            f" {measure(indexed_merge, count):>9.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
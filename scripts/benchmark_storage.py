@@ -0,0 +1,144 @@
+"""
+Measure the size and latency of compressed pofile storage
+
+Usage: python scripts/benchmark_storage.py [POFILE ...]
+
+Generates a catalog resembling a Django project's if no pofiles are given.
+Uses the configured database; everything is rolled back afterwards.
+"""
+
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+import django
+
+
+django.setup()
+
+import polib  # noqa: E402
+from django.db import transaction  # noqa: E402
+
+from projects.models import Catalog, Project, po_cache  # noqa: E402
+
+
+WORDS = [
+    "the",
+    "of",
+    "account",
+    "password",
+    "reset",
+    "student",
+    "class",
+    "dashboard",
+    "please",
+    "enter",
+    "your",
+    "email",
+    "address",
+    "successfully",
+    "updated",
+    "saved",
+    "deleted",
+    "invalid",
+    "value",
+    "this",
+    "field",
+    "is",
+    "required",
+    "for",
+    "a",
+    "an",
+    "and",
+    "to",
+    "in",
+    "with",
+    "has",
+    "been",
+    "could",
+    "not",
+    "be",
+    "found",
+]
+
+
+def generate_po(count):
+    rng = random.Random(42)
+    modules = [f"app/{rng.choice(WORDS)}/{rng.choice(WORDS)}.py" for _ in range(80)]
+    po = polib.POFile(wrapwidth=0)
+    po.metadata = {"Content-Type": "text/plain; charset=UTF-8"}
+    for i in range(count):
+        msgid = " ".join(rng.choices(WORDS, k=rng.randint(2, 14))).capitalize()
+        po.append(
+            polib.POEntry(
+                msgid=f"{msgid} ({i})",
+                msgstr=f"{msgid.upper()} ({i})" if rng.random() < 0.9 else "",
+                occurrences=[
+                    (rng.choice(modules), str(rng.randint(1, 900)))
+                    for _ in range(rng.randint(1, 6))
+                ],
+                flags=["python-format"] if rng.random() < 0.2 else [],
+            )
+        )
+    return po
+
+
+def timed(fn, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def measure(name, po):
+    with transaction.atomic():
+        project = Project.objects.create(name="benchmark", slug="benchmark-storage")
+        catalog = project.catalogs.create(
+            language_code="de", domain="django", pofile=po
+        )
+
+        def render():
+            po_cache.clear()
+            return Catalog.objects.get(pk=catalog.pk).pofile
+
+        def store():
+            Catalog.objects.get(pk=catalog.pk).store_pofile()
+
+        def read():
+            return Catalog.objects.get(pk=catalog.pk).pofile
+
+        render_time = timed(render)
+        store_time = timed(store)
+        read_time = timed(read)
+        catalog = Catalog.objects.get(pk=catalog.pk)
+        plain, compressed = len(read().encode("utf-8")), len(catalog.compressed_pofile)
+        transaction.set_rollback(True)
+
+    print(
+        f"{name:>24} {len(po):>7} {plain / 1024:>8.0f}K {compressed / 1024:>8.0f}K"
+        f" {plain / compressed:>5.1f}x {render_time * 1000:>8.1f}ms"
+        f" {store_time * 1000:>8.1f}ms {read_time * 1000:>8.1f}ms"
+    )
+
+
+def main():
+    print(
+        f"{'catalog':>24} {'entries':>7} {'plain':>9} {'gzip':>9} {'ratio':>6}"
+        f" {'render':>10} {'store':>10} {'read':>10}"
+    )
+    if sys.argv[1:]:
+        for path in sys.argv[1:]:
+            measure(Path(path).name, polib.pofile(path, wrapwidth=0))
+    else:
+        for count in (1000, 5000, 20000):
+            measure(f"generated-{count}", generate_po(count))
+
+
+if __name__ == "__main__":
+    main()
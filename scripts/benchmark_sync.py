@@ -0,0 +1,113 @@
+"""
+Compare syncing a project using the per-file API with the bulk endpoint
+
+Usage: python scripts/benchmark_sync.py [CATALOGS ...]
+
+Requests are made using Django's test client, the numbers therefore only
+contain the server side work; every request saved also saves a network
+round trip in practice. Uses the configured database; everything is rolled
+back afterwards.
+"""
+
+import io
+import os
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+
+import django
+
+
+django.setup()
+
+import polib  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from accounts.models import User  # noqa: E402
+from projects.models import Project  # noqa: E402
+
+
+ENTRIES = 500
+
+
+def make_po(language_code):
+    po = polib.POFile(wrapwidth=0)
+    po.metadata = {"Content-Type": "text/plain; charset=UTF-8"}
+    for i in range(ENTRIES):
+        po.append(
+            polib.POEntry(
+                msgid=f"Message {i}",
+                msgstr=f"{language_code} {i}",
+                occurrences=[(f"app/module{i % 50}.py", str(i))],
+            )
+        )
+    return str(po).encode("utf-8")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def measure(count):
+    pofiles = {f"l{i:03}/django.po": make_po(f"l{i:03}") for i in range(count)}
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in pofiles.items():
+            archive.writestr(name, content)
+    data = buffer.getvalue()
+
+    with transaction.atomic():
+        user = User.objects.create_superuser("benchmark@example.com", "benchmark")
+        Project.objects.create(name="benchmark", slug="benchmark-sync")
+        client = Client(headers={"x-cli-api": settings.CLI_API, "x-token": user.token})
+        base = "/api/pofile/benchmark-sync/"
+
+        def put_files():
+            for name, content in pofiles.items():
+                client.put(
+                    f"{base}{name.removesuffix('.po')}/",
+                    content,
+                    content_type="text/plain",
+                )
+
+        def get_files():
+            for name in pofiles:
+                client.get(f"{base}{name.removesuffix('.po')}/")
+
+        def put_bulk():
+            client.put(base, data, content_type="application/zip")
+
+        def get_bulk():
+            client.get(base)
+
+        timings = (
+            timed(put_files),
+            timed(get_files),
+            timed(put_bulk),
+            timed(get_bulk),
+        )
+        transaction.set_rollback(True)
+    return timings
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [5, 20, 50]
+    print(
+        f"{'catalogs':>8} {'put files':>10} {'get files':>10}"
+        f" {'put bulk':>10} {'get bulk':>10}"
+    )
+    for count in counts:
+        print(f"{count:>8}" + "".join(f" {t:>9.3f}s" for t in measure(count)))
+
+
+if __name__ == "__main__":
+    main()